@@ -0,0 +1,162 @@
+"""Compare the vector search backends on random clustered vectors.
+
+Usage:
+    python -m benchmarks.bench_ann_backends --sizes 1000 10000 100000 --output results.json
+
+For each size and backend, the records hold the build time, the latency of the
+k-nearest-neighbours and range queries, the peak memory allocated by the build, the
+size of the saved files and the recall@k and range recall against the exact search.
+The memory of Annoy is mostly its saved file, which is memory-mapped when loaded.
+"""
+import argparse
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+from json import dump, dumps
+from os import path
+
+import numpy as np
+
+from src.utils.vector_backends import BACKENDS, get_backend
+
+
+def clustered_vectors(n_vectors: int, dim: int, seed: int = 0, vectors_per_cluster: int = 8) -> np.ndarray:
+    """Random vectors around random centers, like the words of a deck with
+    a few synonyms each."""
+    rng = np.random.default_rng(seed)
+    n_clusters = max(n_vectors // vectors_per_cluster, 1)
+    centers = rng.standard_normal((n_clusters, dim))
+    vectors = centers[rng.integers(0, n_clusters, n_vectors)] + 0.5 * rng.standard_normal((n_vectors, dim))
+    return vectors.astype(np.float32)
+
+
+def get_files_size(directory: str) -> int:
+    return sum(path.getsize(path.join(directory, name)) for name in os.listdir(directory))
+
+
+def recall(results: list[list[int]], expected: list[list[int]]) -> float:
+    n_expected = sum(len(row) for row in expected)
+    if n_expected == 0:
+        return 1.0
+    return sum(len(set(row) & set(expected_row)) for row, expected_row in zip(results, expected)) / n_expected
+
+
+def bench_backend(
+    name: str,
+    vectors: np.ndarray,
+    queries: np.ndarray,
+    k: int,
+    radius: float,
+    work_dir: str,
+    params: dict,
+) -> dict:
+    # The libraries are imported by the first build, which is not timed
+    get_backend(name, vectors.shape[1], "angular", params).build(vectors[:2])
+    backend = get_backend(name, vectors.shape[1], "angular", params)
+    tracemalloc.start()
+    start = time.perf_counter()
+    backend.build(vectors)
+    build_seconds = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    backend_dir = path.join(work_dir, name)
+    os.makedirs(backend_dir)
+    backend.save(path.join(backend_dir, "index"))
+
+    start = time.perf_counter()
+    items, _ = backend.query(queries, k)
+    query_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    radius_items, _ = backend.query_radius(queries, radius)
+    radius_seconds = time.perf_counter() - start
+    backend.unload()
+    return {
+        "build_seconds": build_seconds,
+        "query_ms": 1000 * query_seconds / len(queries),
+        "radius_query_ms": 1000 * radius_seconds / len(queries),
+        "build_peak_mb": peak / 2**20,
+        "files_mb": get_files_size(backend_dir) / 2**20,
+        "items": items,
+        "radius_items": radius_items,
+    }
+
+
+def run_benchmarks(
+    sizes: list[int],
+    backends: list[str],
+    work_dir: str,
+    dim: int = 300,
+    k: int = 15,
+    radius: float = 0.7,
+    n_queries: int = 200,
+    seed: int = 0,
+    annoy_trees: int = 10,
+) -> list[dict]:
+    results = []
+    for n_vectors in sizes:
+        vectors = clustered_vectors(n_vectors, dim, seed)
+        rng = np.random.default_rng(seed + 1)
+        queries = vectors[rng.choice(n_vectors, min(n_queries, n_vectors), replace=False)]
+
+        # bruteforce is the reference of the recalls, so it always runs first
+        measures = {}
+        for name in ["bruteforce"] + [b for b in backends if b != "bruteforce"]:
+            params = {"n_trees": annoy_trees} if name == "annoy" else {}
+            size_dir = path.join(work_dir, str(n_vectors))
+            os.makedirs(size_dir, exist_ok=True)
+            measures[name] = bench_backend(name, vectors, queries, k, radius, size_dir, params)
+
+        exact = measures["bruteforce"]
+        for name in backends:
+            measure = measures[name]
+            result = {"backend": name, "n_vectors": n_vectors, "dim": dim, "k": k, "radius": radius}
+            result.update({key: value for key, value in measure.items() if not key.endswith("items")})
+            result[f"recall@{k}"] = recall(measure["items"], exact["items"])
+            result["radius_recall"] = recall(measure["radius_items"], exact["radius_items"])
+            result["mean_radius_neighbours"] = float(np.mean([len(row) for row in exact["radius_items"]]))
+            results.append(result)
+            print(result, file=sys.stderr)
+    return results
+
+
+def main(argv=None) -> list[dict]:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000],
+                        help="Numbers of vectors, ex: the numbers of notes of the decks")
+    parser.add_argument("--backends", nargs="+", choices=list(BACKENDS), default=list(BACKENDS))
+    parser.add_argument("--dim", type=int, default=300,
+                        help="Length of the vectors. Defaults to 300, as the spaCy md models")
+    parser.add_argument("--k", type=int, default=15, help="Number of neighbours of the queries")
+    parser.add_argument("--radius", type=float, default=0.7,
+                        help="Angular distance of the range queries (cf. the distance threshold of the groups)")
+    parser.add_argument("--n-queries", type=int, default=200)
+    parser.add_argument("--annoy-trees", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="JSON file of the results. Printed if not given")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        results = run_benchmarks(
+            args.sizes, args.backends, work_dir, args.dim, args.k, args.radius,
+            args.n_queries, args.seed, args.annoy_trees,
+        )
+
+    report = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "results": results,
+    }
+    if args.output is None:
+        print(dumps(report, indent=2))
+    else:
+        with open(args.output, "w", encoding="utf-8") as f:
+            dump(report, f, indent=2)
+    return results
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,287 @@
+"""Time the three pipelines on synthetic collections.
+
+Usage:
+    python -m benchmarks.bench_pipelines --sizes 1000 10000 --output results.json
+
+Each stage runs on a fresh copy of the generated collection. The results are a JSON
+list of {"stage", "n_notes", "seconds", ...} records, printed or saved in --output,
+so that they can be compared between commits. With --profile, the records also hold
+the timing spans and counters of src.utils.instrumentation.
+"""
+import argparse
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+import zlib
+from contextlib import redirect_stdout
+from json import dump, dumps
+from os import path
+from typing import Callable
+from unittest import mock
+
+import numpy as np
+import yaml
+from anki.buildinfo import version as anki_version
+from anki.collection import Collection
+from loguru import logger
+
+from benchmarks.synthetic_collection import generate_collection
+from src.utils import instrumentation
+from src.utils.collection_reader import CollectionReader
+from src.utils.group_index import GroupIndex
+from src.utils.hint_generation_utils import HintAdaptor
+from src.utils.note_cache import get_note_cache
+from src.utils.note_utils import NoteConverter
+
+STAGES = (
+    "generate",
+    "cloze2basic",
+    "hint_adaptor_run",
+    "hint_adaptor_run_all_groups",
+    "hint_adaptor_run_all_groups_pool",
+    "create_syn_groups",
+    "fill_pinyin",
+    "read_note_type",
+)
+
+
+class StubDoc:
+    def __init__(self, vector: np.ndarray):
+        self.vector = vector
+
+
+class StubNlp:
+    """Stand-in for a spaCy pipeline, with a random vector seeded by the text."""
+
+    def __init__(self, vector_len: int = 300):
+        self.meta = {"lang": "zh", "name": "stub", "version": "0.0.0"}
+        self.vocab = mock.Mock(vectors_length=vector_len)
+
+    def __call__(self, text: str) -> StubDoc:
+        rng = np.random.default_rng(zlib.crc32(text.encode("utf-8")))
+        return StubDoc(rng.standard_normal(self.vocab.vectors_length).astype(np.float32))
+
+    def pipe(self, texts, batch_size=256, n_process=1):
+        for text in texts:
+            yield self(text)
+
+
+def copy_collection(col_path: str, work_dir: str, name: str) -> str:
+    stage_dir = path.join(work_dir, name)
+    os.makedirs(stage_dir)
+    stage_col_path = path.join(stage_dir, "collection.anki2")
+    shutil.copy(col_path, stage_col_path)
+    return stage_col_path
+
+
+def bench_cloze2basic(col_path: str) -> dict:
+    config_path = path.join(path.dirname(col_path), "config.yaml")
+    with open(config_path, "w", encoding="utf-8") as f:
+        yaml.safe_dump({"collection_path": col_path}, f)
+    new_fields = [("Album", "c1"), ("Year", "c2"), ("Group", "c3"), ("Extra", "Back Extra")]
+    note_converter = NoteConverter(config_path, "Music (converted)", new_fields, "Cloze", "Text")
+    note_converter.run_cloze2Basic(query="")
+    return {}
+
+
+def new_music_hint_adaptor(col: Collection) -> HintAdaptor:
+    return HintAdaptor(
+        "Music",
+        ["Year", "Album"],
+        col=col,
+        hint_holding_field="Extra",
+        sorting_field="Year",
+        separator=" ",
+        replace=True,
+        query_field="Group",
+        override_confirm=True,
+        verbose=0,
+    )
+
+
+def bench_hint_adaptor_run(col_path: str) -> dict:
+    col = Collection(col_path)
+    bands = sorted(
+        {flds.split("\x1f")[2] for flds in col.db.list(
+            "select flds from notes where mid = ?", col.models.id_for_name("Music")
+        )}
+    )
+    hint_adaptor = new_music_hint_adaptor(col)
+    for band in bands:
+        hint_adaptor.run(f'"Group:{band}"')
+    return {"n_groups": len(bands)}
+
+
+def bench_hint_adaptor_run_all_groups(col_path: str, n_process: int = 1) -> dict:
+    col = Collection(col_path)
+    hint_adaptor = HintAdaptor(
+        "Chinois",
+        ["Simplified", "Meaning"],
+        col=col,
+        hint_holding_field="Generated Synonyms",
+        sorting_field="Pinyin.1",
+        separator=" ",
+        group_separator=", ",
+        additional_hint_field="Pinyin.1",
+        replace=True,
+        query_field="Synonyms group",
+        override_confirm=True,
+        verbose=0,
+    )
+    group_index = GroupIndex.from_collection(col, "Chinois", "Synonyms group", ", ")
+    hint_adaptor.run_all_groups(group_index, n_process=n_process)
+    return {"n_groups": len(group_index.group_to_nids), "n_process": n_process}
+
+
+def bench_hint_adaptor_run_all_groups_pool(col_path: str) -> dict:
+    return bench_hint_adaptor_run_all_groups(col_path, n_process=max(2, os.cpu_count()))
+
+
+def bench_create_syn_groups(col_path: str) -> dict:
+    # The module needs spaCy and langdetect, even with the stub model
+    from src import create_syn_cognat_groups_main
+
+    work_dir = path.dirname(col_path)
+    cwd = os.getcwd()
+    os.chdir(work_dir)  # The groups, index and vectors are saved in the working directory
+    col = Collection(col_path)
+    try:
+        groups = create_syn_cognat_groups_main.main(
+            "groups.json",
+            col,
+            tag="syn_created",
+            hint_field="Synonyms",
+            group_name="Synonyms group",
+            main_signification_field="Simplified",
+            original_type_name="Chinois",
+            group_separator=", ",
+            query="-is:new -is:suspended tag:marked -tag:syn_created",
+            embedding_cache_dir="embedding_cache",
+            nlp=StubNlp(),
+        )
+    finally:
+        os.chdir(cwd)
+    return {"n_groups": len(groups)}
+
+
+def bench_fill_pinyin(col_path: str) -> dict:
+    from src.utils import chinese_utils
+
+    chinese_utils._PINYIN_CACHE.clear()  # Converted again for each size
+    chinese_utils.get_pinyin_converter()  # Loading the dictionaries is not timed
+    start = time.perf_counter()
+    saved = chinese_utils.fill_pinyin(None, "Chinois", "Pinyin.1", "Simplified", "", col=Collection(col_path))
+    return {"n_saved": saved, "fill_seconds": time.perf_counter() - start}
+
+
+def bench_read_note_type(col_path: str) -> dict:
+    """Read the Simplified field of all the Chinese notes with the Anki backend
+    and the note cache, then with the sqlite3 reader."""
+    start = time.perf_counter()
+    col = Collection(col_path)
+    notesID = col.find_notes('note:"Chinois"')
+    texts = [note["Simplified"] for note in get_note_cache(col).get_notes(notesID)]
+    col.close()
+    collection_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    with CollectionReader(col_path) as reader:
+        columns = reader.read_columns("Chinois", ["Simplified"])
+    reader_seconds = time.perf_counter() - start
+    assert sorted(columns["Simplified"]) == sorted(texts)
+    return {"n_read": len(columns), "collection_seconds": collection_seconds, "reader_seconds": reader_seconds}
+
+
+BENCHMARKS: dict[str, Callable[[str], dict]] = {
+    "cloze2basic": bench_cloze2basic,
+    "hint_adaptor_run": bench_hint_adaptor_run,
+    "hint_adaptor_run_all_groups": bench_hint_adaptor_run_all_groups,
+    "hint_adaptor_run_all_groups_pool": bench_hint_adaptor_run_all_groups_pool,
+    "create_syn_groups": bench_create_syn_groups,
+    "fill_pinyin": bench_fill_pinyin,
+    "read_note_type": bench_read_note_type,
+}
+
+
+def run_benchmarks(sizes: list[int], stages: list[str], work_dir: str, seed: int = 0) -> list[dict]:
+    results = []
+    for n_notes in sizes:
+        size_dir = path.join(work_dir, str(n_notes))
+        os.makedirs(size_dir)
+        col_path = path.join(size_dir, "collection.anki2")
+
+        start = time.perf_counter()
+        notes_per_type = generate_collection(col_path, n_notes, seed=seed)
+        results.append({
+            "stage": "generate",
+            "n_notes": n_notes,
+            "seconds": time.perf_counter() - start,
+            "notes_per_type": {k: len(v) for k, v in notes_per_type.items()},
+        })
+        print(results[-1], file=sys.stderr)
+
+        for stage in stages:
+            if stage == "generate":
+                continue
+            stage_col_path = copy_collection(col_path, size_dir, stage)
+            result = {"stage": stage, "n_notes": n_notes}
+            # The pipelines ask for confirmations, and their prints would mix with the results
+            with mock.patch("builtins.input", return_value="y"), redirect_stdout(sys.stderr):
+                start = time.perf_counter()
+                try:
+                    with instrumentation.span(stage):
+                        result.update(BENCHMARKS[stage](stage_col_path))
+                    result["seconds"] = time.perf_counter() - start
+                    if instrumentation.PROFILER.enabled:
+                        result["profile"] = instrumentation.PROFILER.last_report
+                except ImportError as e:
+                    result["skipped"] = f"Missing dependency: {e.name}"
+            results.append(result)
+            print(result, file=sys.stderr)
+    return results
+
+
+def main(argv=None) -> list[dict]:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000],
+                        help="Numbers of notes of the generated collections (1k to 200k)")
+    parser.add_argument("--stages", nargs="+", choices=STAGES, default=list(STAGES))
+    parser.add_argument("--output", help="JSON file of the results. Printed if not given")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--work-dir", help="Where to keep the collections. Temporary if not given")
+    parser.add_argument("--profile", action="store_true",
+                        help="Add the timing spans and counters of each stage to the results")
+    parser.add_argument("--log-level", default="WARNING",
+                        help="Level of the logs of the pipelines. Defaults to WARNING")
+    args = parser.parse_args(argv)
+
+    logger.remove()
+    logger.add(sys.stderr, level=args.log_level)
+    if args.profile:
+        instrumentation.enable()
+
+    if args.work_dir is None:
+        with tempfile.TemporaryDirectory() as work_dir:
+            results = run_benchmarks(args.sizes, args.stages, work_dir, args.seed)
+    else:
+        results = run_benchmarks(args.sizes, args.stages, args.work_dir, args.seed)
+
+    report = {
+        "python": platform.python_version(),
+        "anki": anki_version,
+        "platform": platform.platform(),
+        "results": results,
+    }
+    if args.output is None:
+        print(dumps(report, indent=2))
+    else:
+        with open(args.output, "w", encoding="utf-8") as f:
+            dump(report, f, indent=2)
+    return results
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""Time the import of each entry point, in a new interpreter each time.
+
+Usage:
+    python -m benchmarks.bench_startup --repeat 5 --output startup.json
+
+The records hold the median import time of each entry point and the heavy
+dependencies (NLP libraries, numpy...) it imported, which should be loaded
+only when a job needs them.
+"""
+import argparse
+import platform
+import statistics
+import subprocess
+import sys
+from json import dump, dumps, loads
+
+ENTRY_POINTS = (
+    "src.cloze2basic_main",
+    "src.hint_generation_main",
+    "src.create_syn_cognat_groups_main",
+    "src.utils.chinese_utils",
+    "src.daemon_main",
+)
+HEAVY_MODULES = ("spacy", "annoy", "langdetect", "nltk", "pinyin_jyutping", "numpy", "sklearn")
+
+_IMPORT_SCRIPT = """
+import json, sys, time
+start = time.perf_counter()
+import {module}
+seconds = time.perf_counter() - start
+print(json.dumps({{"seconds": seconds, "heavy_modules": [m for m in {heavy!r} if m in sys.modules]}}))
+"""
+
+
+def time_import(module: str) -> dict:
+    """Import the module in a new interpreter. Raises ImportError if it can't be imported."""
+    process = subprocess.run(
+        [sys.executable, "-c", _IMPORT_SCRIPT.format(module=module, heavy=HEAVY_MODULES)],
+        capture_output=True,
+        text=True,
+    )
+    if process.returncode != 0:
+        error = process.stderr.strip().splitlines()[-1] if process.stderr.strip() else ""
+        raise ImportError(error, name=module)
+    return loads(process.stdout.strip().splitlines()[-1])
+
+
+def run_benchmarks(entry_points: list[str], repeat: int = 5) -> list[dict]:
+    results = []
+    for module in entry_points:
+        result = {"entry_point": module}
+        try:
+            runs = [time_import(module) for _ in range(repeat)]
+            result["seconds"] = statistics.median(run["seconds"] for run in runs)
+            result["heavy_modules"] = runs[0]["heavy_modules"]
+        except ImportError as e:
+            result["skipped"] = str(e)
+        results.append(result)
+        print(result, file=sys.stderr)
+    return results
+
+
+def main(argv=None) -> list[dict]:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--entry-points", nargs="+", default=list(ENTRY_POINTS))
+    parser.add_argument("--repeat", type=int, default=5, help="Number of imports of each entry point")
+    parser.add_argument("--output", help="JSON file of the results. Printed if not given")
+    args = parser.parse_args(argv)
+
+    results = run_benchmarks(args.entry_points, args.repeat)
+    report = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "results": results,
+    }
+    if args.output is None:
+        print(dumps(report, indent=2))
+    else:
+        with open(args.output, "w", encoding="utf-8") as f:
+            dump(report, f, indent=2)
+    return results
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+import random
+from typing import Optional
+
+from anki.collection import Collection
+from anki.models import NotetypeDict
+from anki.utils import ids2str
+
+CHINOIS_FIELDS = ["Simplified", "Pinyin.1", "Meaning", "Synonyms", "Synonyms group", "Generated Synonyms"]
+MUSIC_FIELDS = ["Album", "Year", "Group", "Extra"]
+NOTE_TYPES = ("Cloze", "Chinois", "Music")
+
+INITIALS = ["b", "p", "m", "f", "d", "t", "n", "l", "g", "k", "h", "j", "q", "x", "zh", "ch", "sh", "r", "z", "c", "s", ""]
+FINALS = [
+    ("a", "āáǎà"), ("o", "ōóǒò"), ("e", "ēéěè"), ("ai", "āáǎà"), ("ao", "āáǎà"),
+    ("ou", "ōóǒò"), ("an", "āáǎà"), ("en", "ēéěè"), ("ang", "āáǎà"), ("ong", "ōóǒò"),
+    ("i", "īíǐì"), ("u", "ūúǔù"), ("in", "īíǐì"), ("un", "ūúǔù"),
+]
+
+
+def new_note_type(col: Collection, name: str, fields: list[str]) -> NotetypeDict:
+    """Add a Basic-like note type with a card "<first field> -> <second field>"."""
+    models = col.models
+    note_type = models.new(name)
+    for field in fields:
+        models.add_field(note_type, models.new_field(field))
+    template = models.new_template("Card 1")
+    template["qfmt"] = "{{%s}}" % fields[0]
+    template["afmt"] = "{{FrontSide}}<hr id=answer>{{%s}}" % fields[1]
+    models.add_template(note_type, template)
+    models.add(note_type)
+    return models.by_name(name)
+
+
+def chinese_word(i: int) -> str:
+    """A unique word of two CJK characters for each i < 20000 * 20000."""
+    return chr(0x4E00 + i % 20000) + chr(0x4E00 + i // 20000)
+
+
+def pinyin_syllable(rng: random.Random) -> str:
+    final, toned_vowels = rng.choice(FINALS)
+    tone = rng.randrange(5)
+    if tone < 4:
+        final = final.replace(final[0], toned_vowels[tone], 1)
+    return rng.choice(INITIALS) + final
+
+
+def add_cloze_notes(col: Collection, n_notes: int, rng: random.Random, deck_id: int) -> list[int]:
+    """Cloze notes like '{{c1::Album}} by {{c3::Band}} ({{c2::1999}})'."""
+    model = col.models.by_name("Cloze")
+    notesID = []
+    for i in range(n_notes):
+        note = col.new_note(model)
+        note["Text"] = (
+            f"{{{{c1::Album {i}}}}} by {{{{c3::Band {i // 8}}}}} "
+            f"({{{{c2::{rng.randint(1960, 2023)}}}}})"
+        )
+        note["Back Extra"] = rng.choice(["", f"<div>Label {i % 50}</div>"])
+        col.add_note(note, deck_id)
+        notesID.append(note.id)
+    return notesID
+
+
+def add_chinois_notes(col: Collection, n_notes: int, rng: random.Random, deck_id: int,
+                      group_size: int = 3) -> list[int]:
+    """Chinese vocabulary notes by groups of synonyms of group_size notes.
+
+    A third of the groups already have their group ID in "Synonyms group" (as after
+    create_syn_cognat_groups_main), a third only have their synonyms written by hand in
+    "Synonyms", and the last third have no synonyms yet. The two last thirds are
+    tagged "marked" so that they are picked by create_syn_cognat_groups_main.
+    """
+    model = new_note_type(col, "Chinois", CHINOIS_FIELDS)
+    notesID = []
+    group_id = 0
+    for start in range(0, n_notes, group_size):
+        members = list(range(start, min(start + group_size, n_notes)))
+        kind = (start // group_size) % 3
+        if kind == 0:
+            group_id += 1
+        for i in members:
+            note = col.new_note(model)
+            note["Simplified"] = chinese_word(i)
+            note["Pinyin.1"] = " ".join(pinyin_syllable(rng) for _ in range(2))
+            note["Meaning"] = f"meaning {start // group_size}, sense {i - start}"
+            if kind == 0:
+                note["Synonyms group"] = str(group_id)
+                if rng.random() < 0.1 and group_id > 1:
+                    # Notes in two groups
+                    note["Synonyms group"] = f"{rng.randint(1, group_id - 1)}, {group_id}"
+            if kind in (0, 1):
+                note["Synonyms"] = "<br>".join(chinese_word(j) for j in members if j != i)
+            if kind in (1, 2):
+                note.add_tag("marked")
+            col.add_note(note, deck_id)
+            notesID.append(note.id)
+    return notesID
+
+
+def add_music_notes(col: Collection, n_notes: int, rng: random.Random, deck_id: int,
+                    albums_per_group: int = 8) -> list[int]:
+    """Basic notes of albums, albums_per_group albums for each "Band <i>"."""
+    model = new_note_type(col, "Music", MUSIC_FIELDS)
+    notesID = []
+    for i in range(n_notes):
+        note = col.new_note(model)
+        note["Album"] = f"Album {i}"
+        note["Year"] = str(rng.randint(1960, 2023))
+        note["Group"] = f"Band {i // albums_per_group}"
+        col.add_note(note, deck_id)
+        notesID.append(note.id)
+    return notesID
+
+
+def mark_as_reviewed(col: Collection, notesID: list[int]) -> None:
+    """Make the cards of the notes review cards, so that they are not found with is:new."""
+    col.db.execute(
+        f"update cards set type = 2, queue = 2, ivl = 1, due = 0 where nid in {ids2str(notesID)}"
+    )
+
+
+def generate_collection(
+    col_path: str,
+    n_notes: int,
+    note_types: tuple[str, ...] = NOTE_TYPES,
+    seed: Optional[int] = 0,
+) -> dict[str, list[int]]:
+    """Create a throwaway collection with n_notes notes shared between the note types.
+
+    Args:
+        col_path (str): The path of the new .anki2 file
+        n_notes (int): The total number of notes
+        note_types (tuple[str, ...], optional): The note types of the notes, among
+        "Cloze", "Chinois" and "Music". Defaults to all of them.
+        seed (Optional[int], optional): The seed of the random contents. Defaults to 0.
+
+    Returns:
+        dict[str, list[int]]: The IDs of the notes of each note type
+    """
+    rng = random.Random(seed)
+    col = Collection(col_path)
+    deck_id = col.decks.id("Benchmark")
+    add_notes = {"Cloze": add_cloze_notes, "Chinois": add_chinois_notes, "Music": add_music_notes}
+    notes_per_type = {}
+    for i, note_type in enumerate(note_types):
+        # The remainder goes to the first note types
+        n = n_notes // len(note_types) + (i < n_notes % len(note_types))
+        notes_per_type[note_type] = add_notes[note_type](col, n, rng, deck_id)
+    if "Chinois" in notes_per_type:
+        mark_as_reviewed(col, notes_per_type["Chinois"])
+    col.close()
+    return notes_per_type
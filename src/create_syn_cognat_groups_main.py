@@ -1,56 +1,50 @@
-import numpy as np
-from collections import defaultdict
 from typing import Callable, Optional
-from json import dump, load
 from anki.collection import Collection
 from loguru import logger
-from langdetect import detect
 import re
-from datetime import datetime
 from os import path
-import spacy
-from annoy import AnnoyIndex 
+from src.utils import instrumentation
+from src.utils.collection_reader import CollectionReader
 from src.utils.note_utils import find_notes, get_col_path
-from src.utils.field_utils import NoteFieldsUtils
-from src.utils.utils import timeit
+from src.utils.field_utils import NoteFieldsUtils, extract_text_from_html
+from src.utils.graph_clustering import cluster_knn_graph, knn_graph_edges, merge_into_existing_groups
+from src.utils.group_index import GroupIndex
+from src.utils.group_store import GroupStore
+from src.utils.note_cache import DEFAULT_CHUNK_SIZE, get_note_cache
 import subprocess
 # TODO: make as arg
+# spaCy, numpy and the vector search backends (and their index and embedding modules)
+# are imported on first use, so that the manual groups don't pay for them
 
 # TODO: method to return the list of groups with main signification summary or an example
 # TODO: methods to delete groups, especially starting from a number ?
 # TODO: method to clean synonyms field ? when there's a blank line between each line?
-# TODO: apply group ID from json file
 
-def get_last_id(col,original_type_name,query_field,group_separator,GROUPS,main_signification_field):
-    if len(GROUPS)!=0:
+@instrumentation.traced
+def get_last_id(col,original_type_name,query_field,group_separator,group_store,main_signification_field,reader=None):
+    if len(group_store)!=0:
         # TODO: check that last group ID exists indeed in the database
-        return max([int(id) for id in GROUPS.keys()]) 
-    i=0
-    while True:
-        i+=1
-        query = f'"{query_field}:re:(^|{group_separator}){i}({group_separator}|$)"'
-        # query is something like "Synonyms group:re:(^|, )1(, |$)"
-
-        try: 
-            notesID, _ = find_notes(
-                col,
-                query=query,
-                verbose=0,
-                note_type_name=original_type_name,
-                override_confirmation = True
-            )
-            add_group_to_dict(col, GROUPS, main_signification_field, i, notesID)
-        except ValueError:
-            return i-1
+        return group_store.last_id
+    # Read the group field of all the notes once instead of querying
+    # "Synonyms group:re:(^|, )1(, |$)" for each group ID
+    if reader is None:
+        group_index = GroupIndex.from_collection(col, original_type_name, query_field, group_separator)
+    else:
+        group_index = GroupIndex.from_reader(reader, original_type_name, query_field, group_separator)
+    get_note_cache(col).load(group_index.nid_to_groups)
+    for group_id in group_index.group_ids():
+        add_group_to_store(col, group_store, main_signification_field, group_id, group_index.get_notes(group_id))
+    return group_index.last_id
 
-def add_group_to_dict(col, GROUPS, main_signification_field, group_id, notesID):
-    notes_info = []
-    for noteID in notesID:
-        note = col.get_note(noteID)
-        notes_info.append({"id":noteID,
-                           "text":note[main_signification_field]})
-    GROUPS[str(group_id)] = notes_info
-    return GROUPS
+def get_notes_info(col, main_signification_field, notesID):
+    return [{"id":noteID, "text":note[main_signification_field]}
+            for noteID, note in zip(notesID, get_note_cache(col).get_notes(notesID))]
+
+def add_group_to_store(col, group_store, main_signification_field, group_id, notesID):
+    group_store.set_group(group_id, get_notes_info(col, main_signification_field, notesID))
+
+def add_notes_to_group_in_store(col, group_store, main_signification_field, group_id, notesID):
+    group_store.add_notes(group_id, get_notes_info(col, main_signification_field, notesID))
 
 
 def get_notes_to_edit(col,original_type_name,query):
@@ -63,33 +57,41 @@ def get_notes_to_edit(col,original_type_name,query):
             )
 
 def assign_group_id(col,noteIDs,group_name,group_id, group_separator = ", ",tag="auto_edited"):
+    note_cache = get_note_cache(col)
     notes = []
-    for noteID in noteIDs:
-        note = col.get_note(noteID)
+    for note in note_cache.get_notes(noteIDs):
         if note[group_name]:
             note[group_name] += group_separator
         note[group_name] += str(group_id)
         note.add_tag(tag)
         notes.append(note)
-    col.update_notes(notes)
+    note_cache.update_notes(notes)
 
-def reversed_assign_group_id(col,group_name,NOTE_GROUPS, group_separator = ", ",tag="auto_edited"):
-    notes = []
-    for noteID,group_ids in NOTE_GROUPS.items():
-        note = col.get_note(noteID)
-        note[group_name] = group_separator.join([str(group_id) for group_id in group_ids])
-        note.add_tag(tag)
-        notes.append(note)
-    col.update_notes(notes)
+@instrumentation.traced
+def reversed_assign_group_id(col,group_name,NOTE_GROUPS, group_separator = ", ",tag="auto_edited",chunk_size=DEFAULT_CHUNK_SIZE):
+    """Write the groups of each note in its group field. The notes are loaded,
+    edited and saved by chunks of chunk_size notes (all at once if None)."""
+    note_cache = get_note_cache(col)
+    notesID = list(NOTE_GROUPS.keys())
+
+    def notes():
+        for note in note_cache.iter_notes(notesID, chunk_size):
+            group_ids = NOTE_GROUPS[note.id]["groups"]
+            note[group_name] = group_separator.join([str(group_id) for group_id in group_ids])
+            note.add_tag(tag)
+            yield note
+
+    note_cache.update_notes_by_chunks(notes(), chunk_size, total=len(notesID))
 
-def update_notes_in_group(col, group_name, group_separator, current_max_id, overall_edited_notes, group,GROUPS,tag="auto_edited"):
+def update_notes_in_group(col, group_name, group_separator, main_signification_field, current_max_id, overall_edited_notes, group,group_store,tag="auto_edited"):
     current_max_id += 1
-    GROUPS = add_group_to_dict(col, GROUPS, main_signification_field, current_max_id, group)
+    add_group_to_store(col, group_store, main_signification_field, current_max_id, group)
     # assign_group_id(col,group,group_name,current_max_id, group_separator,tag)
     overall_edited_notes.update(group)
-    return current_max_id,overall_edited_notes,GROUPS
+    return current_max_id,overall_edited_notes
 
-def assign_group_id_to_chinese_manual_group(col,GROUPS,noteID, field_text, original_type_name, main_signification_field,current_max_id,overall_edited_notes,tag):
+@instrumentation.traced
+def assign_group_id_to_chinese_manual_group(col,group_store,noteID, field_text, original_type_name, group_name, group_separator, main_signification_field,current_max_id,overall_edited_notes,tag):
     group_elements = re.findall("[\u4e00-\u9FFF]+|\n", field_text)
     groups = [[noteID]]
     for el in group_elements:
@@ -114,58 +116,74 @@ def assign_group_id_to_chinese_manual_group(col,GROUPS,noteID, field_text, origi
                 logger.warning("TODO: what to do if there's several notes with the same signification?") # TODO:
     for group in groups:
         if len(group) > 1:
-            current_max_id,overall_edited_notes,GROUPS = update_notes_in_group(col, group_name, group_separator, current_max_id, overall_edited_notes, group,GROUPS,tag)
+            current_max_id,overall_edited_notes = update_notes_in_group(col, group_name, group_separator, main_signification_field, current_max_id, overall_edited_notes, group,group_store,tag)
         else:
             continue
-    return current_max_id,overall_edited_notes,GROUPS  
-
-def get_word_vector(nlp,word):
-    return nlp(word).vector
-
-@timeit
-def get_vector_of_notes(nlp,col,notesID,note_field_utils):
-    vectors = []
-    for noteID in notesID:
-        vectors.append(get_word_vector(nlp,note_field_utils.extract_text_from_field(col.get_note(noteID),main_signification_field)))
-    return np.array(vectors)
-
-def build_index(vector_len,all_vectors):
-    t = AnnoyIndex(vector_len, 'angular')
-    for i,v in enumerate(all_vectors):
-        t.add_item(i, v)
-    t.build(10) # 10 trees
-    # t.save('chinese.ann')
+    return current_max_id,overall_edited_notes
+
+@instrumentation.traced
+def get_vector_of_notes(nlp,texts,embedding_cache=None,batch_size=256,n_process=1):
+    from src.utils.embedding_utils import embed_texts
+    return embed_texts(nlp,texts,cache=embedding_cache,batch_size=batch_size,n_process=n_process)
+
+@instrumentation.traced
+def build_index(nlp,col,notesID,note_field_utils,main_signification_field,index_path,embedding_cache=None,rebuild_threshold=0.1,backend="annoy",index=None,embedding_batch_size=256,embedding_n_process=1,reader=None,**backend_params):
+    """Load the index saved in index_path and update it with the new or edited notes.
+    The whole index is rebuilt only if more than rebuild_threshold of the notes changed.
+    The backend is "annoy" (approximate), "bruteforce" or "sklearn" (exact), cf. vector_backends.
+    An index already in memory can be given to update it instead of loading it.
+    The texts are embedded with nlp.pipe by batches of embedding_batch_size, in
+    embedding_n_process processes.
+    With a CollectionReader, the notes are read from the saved collection file in one scan."""
+    from src.utils.ann_index import PersistentVectorIndex
+    if reader is None:
+        notes = get_note_cache(col).get_notes(notesID)
+        mods = [note.mod for note in notes]
+        texts = [note_field_utils.extract_text_from_field(note,main_signification_field) for note in notes]
+    else:
+        columns = reader.read_columns(note_field_utils.note_type["name"], [main_signification_field])
+        rows = {nid: (mod, text) for nid, mod, text in zip(columns.ids, columns.mods, columns[main_signification_field])}
+        mods = [rows[nid][0] for nid in notesID]
+        texts = [extract_text_from_html(rows[nid][1]) for nid in notesID]
+    if backend == "annoy":
+        backend_params.setdefault("n_trees", 10)
+    t = index if index is not None else PersistentVectorIndex(index_path, metric='angular', backend=backend, rebuild_threshold=rebuild_threshold, **backend_params)
+    t.update(notesID, mods, texts, lambda texts: get_vector_of_notes(nlp,texts,embedding_cache,batch_size=embedding_batch_size,n_process=embedding_n_process))
     return t
 
-# @timeit
-def find_new_groups_from_embedding(col,GROUPS,noteID,current_max_id,annoy_index,overall_edited_notes,all_deck_notesID,distance_threshold=0.7,tag="auto_edited"):    
-    # XXX: not perfect : it necessarily gives a new group. Could have included to an existing group...
-    # or use https://github.com/explosion/spaCy/discussions/10465 most_similar, but then must use same logic as in commit 39f1f962fead7de0c48edbb76d36bef941a68728 : check if sim words are in anki
-    # but it would do all notesID at once
-    # most_similar = nlp.vocab.vectors.most_similar(vectors, n=10)
-    note = col.get_note(noteID)
-    nn,distances = annoy_index.get_nns_by_item(all_deck_notesID.index(noteID), 15,include_distances=True)
-    group = {noteID}
-    for nn_index,distance in zip(nn,distances):
-        if distance>distance_threshold:
-            break
-
-        close_note = col.get_note(all_deck_notesID[nn_index])
-        g1 = set(note["Synonyms group"].split(","))
-        g2 = set(close_note["Synonyms group"].split(","))
-        if all_deck_notesID[nn_index] not in overall_edited_notes and len(g1.intersection(g2))==0:
-            group.add(all_deck_notesID[nn_index])
-        elif all_deck_notesID[nn_index] in overall_edited_notes and all_deck_notesID[nn_index]!=noteID: # check que des dup ?
-            if len(g1.intersection(g2))!=0 and g1!={""} and g2!={""}:
-                print(note["Synonyms group"],close_note["Synonyms group"])
-                continue
-                # TODO: 2 notes ne peuvent pas être dans 2 mêmes groupes ! Il faut les fusionner ensemble ou en amont, 
-    
-    if len(group)>1:
-        # XXX: what to do when group is of len(1) ? lower the threshold / use english vectors, makes it even more complicated
-        group = list(group)
-        current_max_id,overall_edited_notes,GROUPS = update_notes_in_group(col, group_name, group_separator, current_max_id, overall_edited_notes, group,GROUPS,tag)
-    return current_max_id,overall_edited_notes,GROUPS
+@instrumentation.traced
+def find_new_groups_from_knn_graph(col,group_store,notesID,current_max_id,ann_index,overall_edited_notes,group_name,group_separator,main_signification_field,distance_threshold=0.7,n_neighbours=15,max_group_size=None,tag="auto_edited"):
+    """Group all the notes with their close notes in one pass.
+
+    The neighbours of all the notes are queried at once, the notes closer than
+    distance_threshold are linked in a graph, and each connected component of the graph
+    is a group (split at its weakest links if it has more than max_group_size notes).
+    A group whose notes are already in a group extends it instead of creating a new one.
+    If n_neighbours is None, all the notes closer than distance_threshold are linked.
+    """
+    indexed_notesID = []
+    for noteID in notesID:
+        if noteID in ann_index:
+            indexed_notesID.append(noteID)
+        else:
+            logger.warning(f"The note {noteID} is not in the index. Is it a new note?")
+    if n_neighbours is None:
+        neighbours,distances = ann_index.get_nns_within_distance(indexed_notesID, distance_threshold)
+    else:
+        neighbours,distances = ann_index.get_nns_by_nids(indexed_notesID, n_neighbours)
+    edges = knn_graph_edges(indexed_notesID, neighbours, distances, distance_threshold)
+    clusters = cluster_knn_graph(edges, max_group_size)
+
+    note_groups = {nid: group_store.get_groups(nid) for cluster in clusters for nid in cluster}
+    new_groups, extended_groups = merge_into_existing_groups(clusters, note_groups)
+    logger.info(f"{len(new_groups)} new groups and {len(extended_groups)} extended groups found in the graph of {len(edges)} edges.")
+
+    for group_id, new_notesID in extended_groups.items():
+        add_notes_to_group_in_store(col, group_store, main_signification_field, group_id, new_notesID)
+        overall_edited_notes.update(new_notesID)
+    for group in new_groups:
+        current_max_id,overall_edited_notes = update_notes_in_group(col, group_name, group_separator, main_signification_field, current_max_id, overall_edited_notes, group,group_store,tag)
+    return current_max_id,overall_edited_notes
 
 
 def download_spacy_model(model_name):
@@ -177,14 +195,52 @@ def download_spacy_model(model_name):
     except subprocess.CalledProcessError as e:
         print(f"Error occurred while downloading the model: {e.stderr}")
 
-def main(groups_file, col, tag, hint_field, group_name, main_signification_field, original_type_name, group_separator, query,lang="zh",vector_search=True):
-    GROUPS = dict(load(open(groups_file, 'rb'))) if path.exists(groups_file) else dict()
+@instrumentation.traced
+def load_spacy_model(lang):
+    import spacy
+    try:
+        nlp = spacy.load(f'{lang}_core_web_md', exclude=["ner","tagger","parser","senter","attribute_ruler"])
+    except OSError:
+        download_spacy_model(f'{lang}_core_web_md')
+        nlp = spacy.load(f'{lang}_core_web_md', exclude=["ner","tagger","parser","senter","attribute_ruler"])
+    logger.info("Model loaded.")
+    return nlp
+
+@instrumentation.traced(name="create_syn_cognat_groups")
+def main(groups_file, col, tag, hint_field, group_name, main_signification_field, original_type_name, group_separator, query,lang="zh",vector_search=True,index_path=None,embedding_cache_dir="embedding_cache",nlp=None,distance_threshold=0.7,max_group_size=None,index_backend="annoy",ann_indexes=None,embedding_caches=None,embedding_batch_size=256,embedding_n_process=1,n_neighbours=15):
+    """The groups are kept in a SQLite group store (cf. GroupStore) next to groups_file:
+    "groups.json" -> "groups.sqlite". The groups of an existing groups_file are imported
+    when the store is created.
+
+    ann_indexes and embedding_caches keep the indexes (by path) and the embedding caches
+    (by directory and model) in memory between runs, cf. the daemon.
+    embedding_batch_size and embedding_n_process are the batch size and the number of
+    processes of nlp.pipe for the texts that are not in the embedding cache.
+    Each note is linked to its n_neighbours closest notes within distance_threshold,
+    or to all the notes within distance_threshold if n_neighbours is None.
+
+    Returns:
+        list[int]: The IDs of all the groups
+    """
+    store_path = f"{groups_file.split('.json')[0]}.sqlite" if groups_file.endswith(".json") else groups_file
+    new_store = not path.exists(store_path)
+    group_store = GroupStore(store_path)  # Committed only once the notes are saved
+    # The notes whose group field is written at the end
+    notes_to_write = set()
+    if new_store and groups_file.endswith(".json") and path.exists(groups_file):
+        logger.info(f"Importing the groups of {groups_file} in {store_path}.")
+        notes_to_write.update(group_store.import_json(groups_file))
+    # The scans of the whole note type read the collection file without the Anki
+    # backend. They are done before the first write of the run.
+    col.save()
+    reader = CollectionReader(col.path)
     current_max_id = get_last_id(col,
                                 original_type_name,
                                 group_name,
                                 group_separator= group_separator,
-                                GROUPS=GROUPS,
-                                main_signification_field=main_signification_field)
+                                group_store=group_store,
+                                main_signification_field=main_signification_field,
+                                reader=reader)
 
     logger.info(f"Max group ID: {current_max_id+1}")
     overall_edited_notes = set()
@@ -202,26 +258,40 @@ def main(groups_file, col, tag, hint_field, group_name, main_signification_field
             )
     
     # TODO: change get_yaml_value to retrieve all values at once in a method
-    try:
-        nlp = spacy.load(f'{lang}_core_web_md', exclude=["ner","tagger","parser","senter","attribute_ruler"])
-    except OSError:
-        download_spacy_model(f'{lang}_core_web_md')
-        nlp = spacy.load(f'{lang}_core_web_md', exclude=["ner","tagger","parser","senter","attribute_ruler"])
-    logger.info("Model loaded.")
-    
-    if vector_search:
-        all_vectors = get_vector_of_notes(nlp,col,all_deck_notesID,note_field_utils)
-        vector_len = len(get_word_vector(nlp,col.get_note(all_deck_notesID[0])[main_signification_field]))
-        annoy_index = build_index(vector_len=vector_len,all_vectors=all_vectors)
+    if vector_search and nlp is None:
+        nlp = load_spacy_model(lang)
 
+    note_cache = get_note_cache(col)
+    note_cache.load(notesID)
+    if vector_search:
+        from src.utils.embedding_utils import EmbeddingCache, get_model_name
+        if index_path is None:
+            index_path = f"{groups_file.split('.json')[0]}_{lang}_index"
+        embedding_cache_key = (embedding_cache_dir, get_model_name(nlp))
+        if embedding_caches is not None and embedding_cache_key in embedding_caches:
+            embedding_cache = embedding_caches[embedding_cache_key]
+        else:
+            embedding_cache = EmbeddingCache(*embedding_cache_key)
+        ann_index = None
+        if ann_indexes is not None and index_path in ann_indexes and ann_indexes[index_path].backend == index_backend:
+            ann_index = ann_indexes[index_path]
+        ann_index = build_index(nlp,col,all_deck_notesID,note_field_utils,main_signification_field,index_path,embedding_cache,backend=index_backend,index=ann_index,embedding_batch_size=embedding_batch_size,embedding_n_process=embedding_n_process,reader=reader)
+        if embedding_caches is not None:
+            embedding_caches[embedding_cache_key] = embedding_cache
+        if ann_indexes is not None:
+            ann_indexes[index_path] = ann_index
+    reader.close()
+
+    # The notes to group with vector search, all grouped at once after the loop
+    vector_search_notesID = []
     for noteID in notesID:
-        note = col.get_note(noteID)
+        note = note_cache.get(noteID)
 
         if noteID in overall_edited_notes:
             # TODO: calculate the average or max or other stat of the distance of words in all the manually created groups to know the threshold   
             if vector_search:
                 logger.warning(f"The note '{note[main_signification_field]}' was already found in a group. Searching new syn/cognats group.")
-                current_max_id,overall_edited_notes,GROUPS = find_new_groups_from_embedding(col,GROUPS,noteID,current_max_id,annoy_index,overall_edited_notes,all_deck_notesID,tag=tag)
+                vector_search_notesID.append(noteID)
             else:
                 logger.info(f"The not '{note[main_signification_field]}' was already found in a group. Doing nothing.")
         
@@ -234,12 +304,12 @@ def main(groups_file, col, tag, hint_field, group_name, main_signification_field
                 # TODO: make it more flexible
                 case "Chinois":
                     # Find the notes with the same signification/cognats, id est, that are in the same group 
-                    current_max_id,overall_edited_notes,GROUPS = assign_group_id_to_chinese_manual_group(col,GROUPS,noteID,field_text, original_type_name, main_signification_field,current_max_id,overall_edited_notes,tag)
+                    current_max_id,overall_edited_notes = assign_group_id_to_chinese_manual_group(col,group_store,noteID,field_text, original_type_name, group_name, group_separator, main_signification_field,current_max_id,overall_edited_notes,tag)
 
         # It's not in a group yet. I need to find the group using word embeddings
         elif not note[hint_field] and vector_search:
-            logger.info(f"Finding synonyms/cognats for '{note[main_signification_field]}' using vector search for new group ID {current_max_id+1}")
-            current_max_id,overall_edited_notes,GROUPS = find_new_groups_from_embedding(col,GROUPS,noteID,current_max_id,annoy_index,overall_edited_notes,all_deck_notesID,tag=tag)
+            logger.info(f"Finding synonyms/cognats for '{note[main_signification_field]}' using vector search.")
+            vector_search_notesID.append(noteID)
                 
 
         elif note[hint_field] and note[group_name]:
@@ -253,26 +323,23 @@ def main(groups_file, col, tag, hint_field, group_name, main_signification_field
             logger.warning(f"What's happening for '{note[main_signification_field]}'?")
             breakpoint()
             pass
+
+    if vector_search_notesID:
+        current_max_id,overall_edited_notes = find_new_groups_from_knn_graph(col,group_store,vector_search_notesID,current_max_id,ann_index,overall_edited_notes,group_name,group_separator,main_signification_field,distance_threshold=distance_threshold,n_neighbours=n_neighbours,max_group_size=max_group_size,tag=tag)
     
     
-    NOTE_GROUPS = defaultdict(lambda: {"text":"","groups":[]})
-    for k,v in GROUPS.items():
-        for noteID in v:
-            NOTE_GROUPS[noteID["id"]]["text"] = noteID["text"]
-            NOTE_GROUPS[noteID["id"]]["groups"].append(k)
+    # Only the notes that joined a group in this run have a new group field
+    notes_to_write.update(overall_edited_notes)
+    NOTE_GROUPS = {noteID: {"groups": group_store.get_groups(noteID)} for noteID in sorted(notes_to_write)}
     reversed_assign_group_id(col,group_name,NOTE_GROUPS, group_separator = ", ",tag="auto_edited")
     col.close()
+    group_store.commit()
 
     logger.success("Done!")
-    now = datetime.now().strftime('%Y%m%d-%H-%M')
-    main_file_name = f"{now}_{groups_file.split('.json')[0]}"
-    logger.info(f"Saving in {main_file_name}.json and {main_file_name}_noteview.json")
-    with open(f"{main_file_name}.json", 'w',encoding="utf-8") as f:
-        dump(GROUPS, f,ensure_ascii=False)
-    with open(f"{main_file_name}_noteview.json", 'w',encoding="utf-8") as f:
-        dump(NOTE_GROUPS, f,ensure_ascii=False)
-
-    return GROUPS
+    logger.info(f"{len(NOTE_GROUPS)} notes with new groups. The groups are saved in {store_path}.")
+    group_ids = group_store.group_ids()
+    group_store.close()
+    return group_ids
 
 
 if __name__ == "__main__":
@@ -295,5 +362,4 @@ if __name__ == "__main__":
 
     query = f'-is:new -is:suspended tag:marked -tag:{tag}' # XXX: need -tag ?
     # query = 'Synonyms:_* "Synonyms group:" rated:15'
-    # TODO: fix the duplicated groups...
     main(groups_file, col, tag, hint_field, group_name, main_signification_field, original_type_name, group_separator, query,vector_search=True)
\ No newline at end of file
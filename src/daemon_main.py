@@ -0,0 +1,48 @@
+"""Daemon keeping the collection and the NLP models warm between editing jobs.
+
+Usage:
+    python -m src.daemon_main serve
+    python -m src.daemon_main submit hints --params '{"note_type_name": "Music", ...}' --confirm
+    python -m src.daemon_main submit shutdown
+
+The jobs are "cloze2basic", "hints", "grouping" and "pinyin" (cf. EditingDaemon),
+plus "ping" and "shutdown". They run one at a time, in the order they are submitted.
+"""
+import argparse
+import sys
+from json import dumps, loads
+
+from anki.collection import Collection
+from loguru import logger
+
+from src.utils.daemon import DEFAULT_SOCKET_PATH, serve, submit_job
+from src.utils.note_utils import get_col_path
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--socket", default=DEFAULT_SOCKET_PATH, help="Path of the Unix socket of the daemon")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    serve_parser = subparsers.add_parser("serve", help="Start the daemon")
+    serve_parser.add_argument("--config", default="src/config.yaml", help="Config with the collection path")
+    submit_parser = subparsers.add_parser("submit", help="Submit a job to the daemon")
+    submit_parser.add_argument("job")
+    submit_parser.add_argument("--params", default="{}", help="Parameters of the job as JSON")
+    submit_parser.add_argument("--confirm", action="store_true",
+                               help="Answer yes to the confirmations asked by the job")
+    args = parser.parse_args(argv)
+
+    if args.command == "serve":
+        serve(Collection(get_col_path(args.config)), args.socket)
+        return 0
+
+    response = submit_job(args.job, loads(args.params), args.confirm, args.socket)
+    print(dumps(response, indent=2))
+    if not response["ok"]:
+        logger.error(response["error"])
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
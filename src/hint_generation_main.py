@@ -2,8 +2,10 @@
 from anki.collection import Collection
 from src.utils.german_utils import romanic_additional_hint_func, romanic_sorting_key
 
+from src.utils.group_index import GroupIndex
 from src.utils.hint_generation_utils import HintAdaptor
 from src.utils.note_utils import get_col_path
+from src.utils.pinyin_collation import pinyin_sorting_key
 
 # TODO: make as arg
 
@@ -20,13 +22,16 @@ if __name__ == "__main__":
         group_separator = ", "
         query_field = "Year"
         override_confirm = True
+        chunk_size = None  # Save the notes every chunk_size notes instead of at the end
+        n_process = 1  # Compute the hints in several processes (ex: os.cpu_count())
+        incremental = False  # Only regenerate the groups that changed since the last incremental run
 
         match note_type_name:
             case "Chinois":
                 flds_in_hint = ["Simplified", "Meaning"]
                 separator = " "
                 sorting_field = additional_hint_field = "Pinyin.1"
-                sorting_key = None
+                sorting_key = pinyin_sorting_key
                 additional_hint_func = None
                 for type in ["Synonyms"]:#,"Cognats"]:
                     hint_field= f"Generated {type}"
@@ -79,17 +84,10 @@ if __name__ == "__main__":
         
                 
         # Itère sur query : chiffre par chiffre. Si retrouve une carte, doit append le hint, pas remplacer
-        i=1
-        while True:
-            query = f'"{query_field}:re:(^|{group_separator}){i}({group_separator}|$)"'
-            try:
-                hint_adaptor.run(
-                    query=query
-                )
-            except ValueError as e:
-                print(query, e)
-                break
-            i+=1
+        # The group IDs and their notes are read once from the group field of all the notes
+        # All the groups are processed in one collection session
+        group_index = GroupIndex.from_collection(col, note_type_name, query_field, group_separator)
+        hint_adaptor.run_all_groups(group_index, chunk_size=chunk_size, n_process=n_process, incremental=incremental)
 
 
         # query = f'Krzysztof'
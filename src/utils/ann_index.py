@@ -0,0 +1,326 @@
+import os
+from json import JSONDecodeError, dump, load
+from os import path
+from typing import Callable, Optional
+
+import numpy as np
+from loguru import logger
+
+from src.utils import instrumentation
+from src.utils.utils import text_hash
+from src.utils.vector_backends import VectorBackend, batch_vector_distances, get_backend, save_vectors
+
+
+class PersistentVectorIndex:
+    """Index of note vectors saved on disk and updated incrementally.
+
+    The files are:
+    - the files of the search backend (cf. vector_backends), ex: <index_path>.ann
+    for Annoy, memory-mapped when loaded
+    - <index_path>.json: the nid <-> item ID mapping and the (mod, text hash)
+    of every indexed note
+    - <index_path>_delta.npy: the vectors of the notes added or edited since
+    the last build, which are searched exactly
+
+    Only the new or edited notes are embedded. The backend index is rebuilt
+    only when the fraction of changed notes is above rebuild_threshold.
+    """
+
+    def __init__(
+        self,
+        index_path: str,
+        vector_len: Optional[int] = None,
+        metric: str = "angular",
+        backend: str = "annoy",
+        rebuild_threshold: float = 0.1,
+        **backend_params,
+    ):
+        """
+        Args:
+            index_path (str): The path of the files of the index, without extension
+            vector_len (Optional[int]): The length of the vectors. Known from the
+            first vectors if None.
+            metric (str, optional): "angular" or "euclidean". Defaults to "angular".
+            backend (str, optional): "annoy", "bruteforce" or "sklearn". Defaults to "annoy".
+            rebuild_threshold (float, optional): The fraction of changed notes above
+            which the backend index is rebuilt. Defaults to 0.1.
+            backend_params: The parameters of the backend, ex: n_trees=10 for Annoy
+        """
+        self.index_path = index_path
+        self.vector_len = vector_len
+        self.metric = metric
+        self.backend = backend
+        self.backend_params = backend_params
+        self.rebuild_threshold = rebuild_threshold
+
+        self.index: Optional[VectorBackend] = None
+        self.item_nids: list[int] = []  # Item ID -> nid
+        self.stale_items: set[int] = set()  # Items of notes edited or deleted since the build
+        self.delta_nids: list[int] = []
+        self.delta_vectors = np.zeros((0, vector_len or 0), dtype=np.float32)
+        self.fingerprints: dict[int, tuple[int, str]] = {}
+        self.nid_to_item: dict[int, int] = {}
+        self.nid_to_delta: dict[int, int] = {}
+
+    @property
+    def mapping_file(self) -> str:
+        return f"{self.index_path}.json"
+
+    @property
+    def delta_file(self) -> str:
+        return f"{self.index_path}_delta.npy"
+
+    def load(self) -> bool:
+        """Load the index saved on disk. Returns False if there is none, or if it
+        must be rebuilt with another backend."""
+        if not path.exists(self.mapping_file):
+            return False
+        try:
+            with open(self.mapping_file, "r", encoding="utf-8") as f:
+                mapping = load(f)
+        except (JSONDecodeError, UnicodeDecodeError):
+            logger.warning(f"The saved index mapping {self.mapping_file} is corrupt. The index will be rebuilt.")
+            return False
+        if mapping["metric"] != self.metric or (
+            self.vector_len is not None and mapping["vector_len"] != self.vector_len
+        ):
+            logger.warning("The saved index was built with other parameters. It will be rebuilt.")
+            return False
+
+        saved_backend = mapping.get("backend", "annoy")
+        index = get_backend(
+            saved_backend,
+            mapping["vector_len"],
+            self.metric,
+            self.backend_params if saved_backend == self.backend else None,
+        )
+        if not index.load(self.index_path):
+            return False
+        self.vector_len = mapping["vector_len"]
+        self.index = index
+        self.item_nids = mapping["item_nids"]
+        self.stale_items = set(mapping["stale_items"])
+        self.delta_nids = mapping["delta_nids"]
+        self.delta_vectors = (
+            np.load(self.delta_file)
+            if self.delta_nids
+            else np.zeros((0, self.vector_len), dtype=np.float32)
+        )
+        self.fingerprints = {int(nid): tuple(fp) for nid, fp in mapping["fingerprints"].items()}
+        self._update_lookups()
+        if saved_backend != self.backend:
+            # The saved vectors are kept, only the search structure is rebuilt
+            logger.info(f"The saved index was built with {saved_backend}. It will be rebuilt with {self.backend}.")
+            return False
+        return True
+
+    def save(self) -> None:
+        """Save the delta vectors, then replace the mapping file at once, so that an
+        interrupted save can't leave a truncated mapping."""
+        if self.delta_nids:
+            save_vectors(self.delta_file, self.delta_vectors)
+        tmp_file = f"{self.mapping_file}.tmp"
+        with open(tmp_file, "w", encoding="utf-8") as f:
+            dump(
+                {
+                    "vector_len": self.vector_len,
+                    "metric": self.metric,
+                    "backend": self.backend,
+                    "item_nids": self.item_nids,
+                    "stale_items": sorted(self.stale_items),
+                    "delta_nids": self.delta_nids,
+                    "fingerprints": self.fingerprints,
+                },
+                f,
+            )
+        os.replace(tmp_file, self.mapping_file)
+
+    def _update_lookups(self) -> None:
+        self.nid_to_item = {
+            nid: item for item, nid in enumerate(self.item_nids) if item not in self.stale_items
+        }
+        self.nid_to_delta = {nid: i for i, nid in enumerate(self.delta_nids)}
+
+    @instrumentation.traced
+    def update(
+        self,
+        notesID: list[int],
+        mods: list[int],
+        texts: list[str],
+        embed_func: Callable[[list[str]], np.ndarray],
+    ) -> None:
+        """Update the index with the current notes, embedding only the new or edited ones.
+
+        Args:
+            notesID (list[int]): The IDs of all the notes to index
+            mods (list[int]): The modification time of the notes
+            texts (list[str]): The texts of the notes to embed
+            embed_func (Callable[[list[str]], np.ndarray]): The method to get the
+            vectors of a list of texts
+        """
+        # An index already in memory (ex: kept by the daemon) is up to date with its files
+        has_index = self.index is not None or self.load()
+
+        changed, changed_fingerprints = [], []
+        for nid, mod, text in zip(notesID, mods, texts):
+            fingerprint = self.fingerprints.get(nid)
+            if fingerprint is not None and fingerprint[0] == mod:
+                continue
+            text_fingerprint = (mod, text_hash(text))
+            if fingerprint is not None and fingerprint[1] == text_fingerprint[1]:
+                # Another field of the note was edited
+                self.fingerprints[nid] = text_fingerprint
+                continue
+            changed.append((nid, text))
+            changed_fingerprints.append(text_fingerprint)
+        removed = set(self.fingerprints) - set(notesID)
+        logger.info(
+            f"{len(changed)} notes new or edited and {len(removed)} notes deleted since "
+            "the last index update."
+        )
+
+        if changed:
+            new_vectors = np.asarray(embed_func([text for _, text in changed]), dtype=np.float32)
+            self.vector_len = new_vectors.shape[1]
+        else:
+            new_vectors = np.zeros((0, self.vector_len or 0), dtype=np.float32)
+
+        # The outdated vectors are masked, the new ones go into the delta
+        outdated = removed | {nid for nid, _ in changed}
+        self.stale_items.update(
+            self.nid_to_item[nid] for nid in outdated if nid in self.nid_to_item
+        )
+        kept_delta = [i for i, nid in enumerate(self.delta_nids) if nid not in outdated]
+        self.delta_nids = [self.delta_nids[i] for i in kept_delta] + [nid for nid, _ in changed]
+        self.delta_vectors = np.concatenate(
+            [self.delta_vectors[kept_delta].reshape(-1, new_vectors.shape[1]), new_vectors]
+        )
+        for nid in removed:
+            del self.fingerprints[nid]
+        for (nid, _), fingerprint in zip(changed, changed_fingerprints):
+            self.fingerprints[nid] = fingerprint
+        self._update_lookups()
+
+        changed_fraction = (len(self.delta_nids) + len(self.stale_items)) / max(
+            len(self.fingerprints), 1
+        )
+        if not has_index or changed_fraction > self.rebuild_threshold:
+            self.rebuild()
+        else:
+            logger.info(
+                f"Loaded the saved index ({changed_fraction:.1%} of the notes changed)."
+            )
+        self.save()
+
+    def __contains__(self, nid: int) -> bool:
+        return nid in self.nid_to_item or nid in self.nid_to_delta
+
+    def get_vector(self, nid: int) -> np.ndarray:
+        if nid in self.nid_to_delta:
+            return self.delta_vectors[self.nid_to_delta[nid]]
+        if nid in self.nid_to_item:
+            return self.index.get_item_vector(self.nid_to_item[nid])
+        raise KeyError(f"Note {nid} is not in the index.")
+
+    @instrumentation.traced
+    def rebuild(self) -> None:
+        """Build the backend index with all the indexed vectors and save it."""
+        if self.vector_len is None:
+            raise ValueError("There is no vector to index.")
+        logger.info("Building the index.")
+        nids = list(self.nid_to_item) + self.delta_nids
+        vectors = np.array(
+            [self.get_vector(nid) for nid in nids], dtype=np.float32
+        ).reshape(-1, self.vector_len)
+
+        if self.index is not None:
+            self.index.unload()
+        self.index = get_backend(self.backend, self.vector_len, self.metric, self.backend_params)
+        self.index.build(vectors)
+        self.index.save(self.index_path)
+
+        self.item_nids = nids
+        self.stale_items = set()
+        self.delta_nids = []
+        self.delta_vectors = np.zeros((0, self.vector_len), dtype=np.float32)
+        self._update_lookups()
+
+    def _get_index_candidates(
+        self, vectors: np.ndarray, n: Optional[int], distance: Optional[float] = None
+    ) -> list[list[tuple[float, int]]]:
+        """The (distance, nid) of the n nearest notes of each vector in the backend
+        index, or of all the notes closer than distance if n is None."""
+        if n is None:
+            items, distances = self.index.query_radius(vectors, distance)
+        else:
+            # Ask for more neighbours to still have n after removing the stale items
+            items, distances = self.index.query(vectors, n + len(self.stale_items))
+        return [
+            [
+                (item_distance, self.item_nids[item])
+                for item, item_distance in zip(row_items, row_distances)
+                if item not in self.stale_items
+            ]
+            for row_items, row_distances in zip(items, distances)
+        ]
+
+    def _search(
+        self, vectors: np.ndarray, n: Optional[int], distance: Optional[float] = None
+    ) -> tuple[list[list[int]], list[list[float]]]:
+        """Search the index and the delta for a batch of vectors."""
+        neighbours = self._get_index_candidates(vectors, n, distance)
+        if self.delta_nids:
+            delta_distances = batch_vector_distances(self.delta_vectors, vectors, self.metric)
+            for candidates, row in zip(neighbours, delta_distances.tolist()):
+                candidates += (
+                    (delta_distance, nid)
+                    for delta_distance, nid in zip(row, self.delta_nids)
+                    if n is not None or delta_distance <= distance
+                )
+        nids, distances = [], []
+        for candidates in neighbours:
+            candidates.sort()
+            candidates = candidates if n is None else candidates[:n]
+            nids.append([nid for _, nid in candidates])
+            distances.append([candidate_distance for candidate_distance, _ in candidates])
+        return nids, distances
+
+    def get_nns_by_vector(
+        self, vector: np.ndarray, n: int, include_distances: bool = False
+    ) -> tuple[list[int], list[float]] | list[int]:
+        """Find the n nearest notes of the vector, in the index and in the delta."""
+        instrumentation.count(instrumentation.ANN_QUERIES)
+        nids, distances = self._search(np.atleast_2d(np.asarray(vector, dtype=np.float32)), n)
+        if include_distances:
+            return nids[0], distances[0]
+        return nids[0]
+
+    def get_nns_by_nid(
+        self, nid: int, n: int, include_distances: bool = False
+    ) -> tuple[list[int], list[float]] | list[int]:
+        return self.get_nns_by_vector(self.get_vector(nid), n, include_distances)
+
+    @instrumentation.traced
+    def get_nns_by_nids(
+        self, notesID: list[int], n: int
+    ) -> tuple[list[list[int]], list[list[float]]]:
+        """Find the n nearest notes of each note of the batch, with their distances.
+        The delta is searched with one matrix product for the whole batch."""
+        if not notesID:
+            return [], []
+        instrumentation.count(instrumentation.ANN_QUERIES, len(notesID))
+        return self._search(self._get_vectors(notesID), n)
+
+    @instrumentation.traced
+    def get_nns_within_distance(
+        self, notesID: list[int], distance: float
+    ) -> tuple[list[list[int]], list[list[float]]]:
+        """Find all the notes closer than distance to each note of the batch,
+        with their distances, nearest first."""
+        if not notesID:
+            return [], []
+        instrumentation.count(instrumentation.ANN_QUERIES, len(notesID))
+        return self._search(self._get_vectors(notesID), None, distance)
+
+    def _get_vectors(self, notesID: list[int]) -> np.ndarray:
+        return np.stack([self.get_vector(nid) for nid in notesID]).astype(np.float32)
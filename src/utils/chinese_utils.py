@@ -1,34 +1,157 @@
-import pinyin_jyutping
-import yaml
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache, partial
+from typing import Callable, Iterable, Optional
+
 from anki.collection import Collection
-from anki_utils import COL_PATH
+from loguru import logger
 
+from src.utils import instrumentation
+from src.utils.note_cache import DEFAULT_CHUNK_SIZE, get_note_cache
 from src.utils.note_utils import find_notes, get_col_path
 
-COL_PATH = get_col_path("config.yaml")
+class PinyinCache:
+    """The last conversions, by converter and text, kept between the runs of a daemon."""
+
+    def __init__(self, maxsize: int = 200_000):
+        self.maxsize = maxsize
+        self._pinyins: "OrderedDict[tuple[Callable[[str], str], str], str]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._pinyins)
+
+    def get(self, convert: Callable[[str], str], text: str) -> Optional[str]:
+        key = (convert, text)
+        if key not in self._pinyins:
+            return None
+        self._pinyins.move_to_end(key)
+        return self._pinyins[key]
+
+    def put(self, convert: Callable[[str], str], text: str, pinyin: str) -> None:
+        self._pinyins[(convert, text)] = pinyin
+        self._pinyins.move_to_end((convert, text))
+        while len(self._pinyins) > self.maxsize:
+            self._pinyins.popitem(last=False)
+
+    def clear(self) -> None:
+        self._pinyins.clear()
+
+
+_PINYIN_CACHE = PinyinCache()
+
+@lru_cache(maxsize=None)
+def get_pinyin_converter():
+    import pinyin_jyutping  # Its dictionaries take a while to load
+
+    return pinyin_jyutping.PinyinJyutping()
+
+def to_pinyin(text: str) -> str:
+    return get_pinyin_converter().pinyin(text)
+
+def _convert_texts(convert: Callable[[str], str], texts: list[str]) -> list[str]:
+    return [convert(text) for text in texts]
+
+@instrumentation.traced
+def convert_to_pinyin(
+    texts: Iterable[str],
+    convert: Callable[[str], str] = to_pinyin,
+    n_process: int = 1,
+    texts_per_task: int = 256,
+) -> dict[str, str]:
+    """Convert each distinct text once. The texts converted by a previous call
+    with the same convert function are taken from the cache.
+
+    The texts are converted as a whole and not character by character, since the
+    pinyin of a character depends on its word (ex: 行 in 银行 and 行走).
+
+    Args:
+        texts (Iterable[str]): The texts to convert, with duplicates
+        convert (Callable[[str], str], optional): The conversion of a text. It is sent
+        to the worker processes, so it must be defined at the top level of a module.
+        Defaults to pinyin_jyutping.
+        n_process (int, optional): The number of processes converting the new texts.
+        Each one loads the dictionaries of pinyin_jyutping. Defaults to 1.
+        texts_per_task (int, optional): The number of texts sent at once to a process.
+
+    Returns:
+        dict[str, str]: The pinyin of each distinct text
+    """
+    pinyins = {}
+    new_texts = []
+    for text in set(texts):
+        pinyin = _PINYIN_CACHE.get(convert, text)
+        if pinyin is None:
+            new_texts.append(text)
+        else:
+            pinyins[text] = pinyin
+    new_texts.sort()
+    logger.info(f"{len(pinyins) + len(new_texts)} distinct texts, {len(new_texts)} to convert.")
+    tasks = [new_texts[start : start + texts_per_task] for start in range(0, len(new_texts), texts_per_task)]
+    if n_process > 1 and len(tasks) > 1:
+        with ProcessPoolExecutor(min(n_process, len(tasks))) as executor:
+            results = list(executor.map(partial(_convert_texts, convert), tasks))
+    else:
+        results = [_convert_texts(convert, task) for task in tasks]
+    for task, task_pinyins in zip(tasks, results):
+        for text, pinyin in zip(task, task_pinyins):
+            pinyins[text] = pinyin
+            _PINYIN_CACHE.put(convert, text, pinyin)
+    return pinyins
 
 ## Get pinyin of characters to fill into a note field
-def fill_pinyin(COL_PATH, note_type_name, field_to_fill, source_field, query):
-    col = Collection(COL_PATH)
+def fill_pinyin(
+    COL_PATH,
+    note_type_name,
+    field_to_fill,
+    source_field,
+    query,
+    col: Optional[Collection] = None,
+    n_process: int = 1,
+    chunk_size: Optional[int] = DEFAULT_CHUNK_SIZE,
+    convert: Callable[[str], str] = to_pinyin,
+) -> int:
+    """Fill a field with the pinyin of the source field. Only the notes whose
+    field changes are saved, by chunks of chunk_size notes.
+
+    Returns:
+        int: The number of saved notes
+    """
+    col = Collection(COL_PATH) if col is None else col
     notesID, original_model = find_notes(
     col, query, note_type_name, verbose=True, cloze_text_field=source_field
 )
-    p = pinyin_jyutping.PinyinJyutping()
-    notes = []
-    for nid in notesID:
-        note = col.get_note(nid)
-        note[field_to_fill] = p.pinyin(note[source_field])
-    
-        notes.append(note)
+    field_names = col.models.field_names(original_model)
+    source_index = field_names.index(source_field)
+    fill_index = field_names.index(field_to_fill)
+
+    note_cache = get_note_cache(col)
+    note_cache.load(notesID)
+    sources = {nid: note_cache.get_fields(nid)[source_index] for nid in notesID}
+    pinyins = convert_to_pinyin(sources.values(), convert, n_process)
+    changed_notesID = [
+        nid for nid in notesID if note_cache.get_fields(nid)[fill_index] != pinyins[sources[nid]]
+    ]
+    logger.info(f"{len(changed_notesID)} notes out of {len(notesID)} have a new pinyin.")
 
-    if input("Confirm save ?") == "y":
-        col.update_notes(notes)
+    def edited_notes():
+        for note in note_cache.iter_notes(changed_notesID, chunk_size):
+            note[field_to_fill] = pinyins[sources[note.id]]
+            yield note
 
+    saved = note_cache.update_notes_by_chunks(
+        edited_notes(),
+        chunk_size,
+        total=len(changed_notesID),
+        confirm=lambda: input("Confirm save ?") == "y",
+    )
     col.close()
+    return saved
 
 if __name__ == "__main__":
+    COL_PATH = get_col_path("config.yaml")
     note_type_name = "Chinois"
     field_to_fill="Pinyin.1"
     source_field = "Simplified"
     query=f"{field_to_fill}:"
-    fill_pinyin(COL_PATH, note_type_name, field_to_fill, source_field, query)
\ No newline at end of file
+    n_process = 1  # Convert in several processes (ex: os.cpu_count()), for big decks
+    fill_pinyin(COL_PATH, note_type_name, field_to_fill, source_field, query, n_process=n_process)
@@ -0,0 +1,52 @@
+import re
+from dataclasses import dataclass, field
+from functools import lru_cache
+from types import MappingProxyType
+from typing import Mapping, Optional
+
+from anki.notes import Note
+
+# {{c1::deletion}} or {{c1::deletion::hint}}. The deletion can hold single ":"
+# https://regex101.com/r/usAlIw/1
+CLOZE_REGEX = re.compile(
+    r"\{\{(c\d+)::((?:(?!::|\}\}).)*)(?:::((?:(?!\}\}).)*))?\}\}", re.DOTALL
+)
+
+
+@dataclass(frozen=True)
+class ClozeData:
+    """All the cloze deletions of a field, by cloze number, in the order of the text.
+    Ex: {"c1": ("Lucien Van Impe",), "c2": ("1976",)}
+
+    It is read-only, as the parsed fields are shared by parse_cloze_field."""
+
+    deletions: Mapping[str, tuple[str, ...]] = field(default_factory=dict)
+    hints: Mapping[str, tuple[Optional[str], ...]] = field(default_factory=dict)
+
+    def get(self, cloze_deletion: str, occurrence: int = 0) -> str:
+        """Get a deletion. Raises KeyError if there is no such cloze deletion."""
+        try:
+            return self.deletions[cloze_deletion][occurrence]
+        except (KeyError, IndexError):
+            raise KeyError(cloze_deletion) from None
+
+
+@lru_cache(maxsize=65536)
+def parse_cloze_field(text: str) -> ClozeData:
+    """Parse a field once to get all its cloze deletions, including
+    the several occurrences of the same cloze number. The result is memoized
+    by field content."""
+    deletions: dict[str, list[str]] = {}
+    hints: dict[str, list[Optional[str]]] = {}
+    for m in CLOZE_REGEX.finditer(text):
+        deletions.setdefault(m.group(1), []).append(m.group(2))
+        hints.setdefault(m.group(1), []).append(m.group(3))
+    return ClozeData(
+        MappingProxyType({cloze: tuple(texts) for cloze, texts in deletions.items()}),
+        MappingProxyType({cloze: tuple(texts) for cloze, texts in hints.items()}),
+    )
+
+
+def get_note_cloze_data(note: Note, field_index: int) -> ClozeData:
+    """Get the cloze deletions of a field of the note, parsed once per field content."""
+    return parse_cloze_field(note.fields[field_index])
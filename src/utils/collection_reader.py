@@ -0,0 +1,177 @@
+import sqlite3
+from array import array
+from json import loads
+from pathlib import Path
+from typing import Iterator, Optional
+
+from src.utils import instrumentation
+
+
+def _unicase(a: str, b: str) -> int:
+    """Case-insensitive collation of the names of the note types and fields,
+    which Anki declares in its schema."""
+    a, b = a.casefold(), b.casefold()
+    return (a > b) - (a < b)
+
+
+class NoteRow:
+    """Read-only view of a note row, whose fields are read by name: row["Front"]."""
+
+    __slots__ = ("id", "mid", "mod", "tags", "fields", "_field_index")
+
+    def __init__(self, nid: int, mid: int, mod: int, tags: list[str], fields: list[str], field_index: dict[str, int]):
+        self.id = nid
+        self.mid = mid
+        self.mod = mod
+        self.tags = tags
+        self.fields = fields
+        self._field_index = field_index
+
+    def __getitem__(self, field_name: str) -> str:
+        return self.fields[self._field_index[field_name]]
+
+    def keys(self) -> list[str]:
+        return list(self._field_index)
+
+    def __repr__(self) -> str:
+        return f"NoteRow(id={self.id}, fields={self.fields})"
+
+
+class NoteColumns:
+    """The notes of a note type by columns: the IDs and modification times in
+    compact arrays, and one list of contents per field."""
+
+    def __init__(self, field_names: list[str]):
+        self.ids = array("q")
+        self.mods = array("q")
+        self.tags: list[list[str]] = []
+        self.fields: dict[str, list[str]] = {name: [] for name in field_names}
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def __getitem__(self, field_name: str) -> list[str]:
+        return self.fields[field_name]
+
+
+class CollectionReader:
+    """Read-only access to the notes of an .anki2 file with sqlite3, without the
+    Anki backend. It is much lighter to scan all the notes of a note type (ex: to
+    build the groups or the embedding inputs) than Collection and Note objects.
+
+    Only the changes saved in the file are read (cf. col.save()). The changes must
+    still be written with the Anki backend (cf. NoteCache).
+
+    Ex:
+        with CollectionReader(col_path) as reader:
+            columns = reader.read_columns("Chinois", ["Simplified"])
+    """
+
+    def __init__(self, col_path: str):
+        """
+        Args:
+            col_path (str): The path of the collection.anki2 file. It can be
+            open in Anki at the same time.
+
+        Raises:
+            FileNotFoundError: If there is no collection at col_path
+        """
+        self.col_path = col_path
+        try:
+            self.db = sqlite3.connect(f"{Path(col_path).resolve().as_uri()}?mode=ro", uri=True)
+        except sqlite3.OperationalError as e:
+            raise FileNotFoundError(f"No collection can be read at {col_path}.") from e
+        self.db.create_collation("unicase", _unicase)
+        self._note_types: Optional[dict[str, tuple[int, list[str]]]] = None
+
+    def __enter__(self) -> "CollectionReader":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def close(self) -> None:
+        self.db.close()
+
+    def _read_note_types(self) -> dict[str, tuple[int, list[str]]]:
+        tables = {name for (name,) in self.db.execute("select name from sqlite_master where type = 'table'")}
+        note_types = {}
+        if "notetypes" in tables:
+            # Schema of Anki 2.1.28+
+            for ntid, name in self.db.execute("select id, name from notetypes"):
+                note_types[name] = (ntid, [])
+            names_by_id = {ntid: names for ntid, names in note_types.values()}
+            for ntid, field_name in self.db.execute("select ntid, name from fields order by ntid, ord"):
+                names_by_id[ntid].append(field_name)
+        else:
+            # Older schema: the note types are a JSON of the col table
+            (models,) = self.db.execute("select models from col").fetchone()
+            for model in loads(models).values():
+                flds = sorted(model["flds"], key=lambda fld: fld["ord"])
+                note_types[model["name"]] = (int(model["id"]), [fld["name"] for fld in flds])
+        instrumentation.count(instrumentation.SQL_QUERIES, 2)
+        return note_types
+
+    @property
+    def note_types(self) -> dict[str, tuple[int, list[str]]]:
+        """The ID and the field names of each note type, by name."""
+        if self._note_types is None:
+            self._note_types = self._read_note_types()
+        return self._note_types
+
+    def get_note_type(self, note_type_name: str) -> tuple[int, list[str]]:
+        try:
+            return self.note_types[note_type_name]
+        except KeyError:
+            raise ValueError(f"Note type {note_type_name} does not exist.") from None
+
+    def get_field_names(self, note_type_name: str) -> list[str]:
+        return list(self.get_note_type(note_type_name)[1])
+
+    def _scan(self, note_type_name: str) -> Iterator[tuple[int, int, int, str, str]]:
+        ntid, _ = self.get_note_type(note_type_name)
+        instrumentation.count(instrumentation.SQL_QUERIES)
+        return self.db.execute("select id, mid, mod, flds, tags from notes where mid = ? order by id", (ntid,))
+
+    @instrumentation.traced(name="CollectionReader.iter_rows")
+    def iter_rows(self, note_type_name: str) -> Iterator[NoteRow]:
+        """Yield the notes of the note type, ordered by ID, with a single query."""
+        field_index = {name: i for i, name in enumerate(self.get_field_names(note_type_name))}
+        n_loaded = 0
+        for nid, mid, mod, flds, tags in self._scan(note_type_name):
+            n_loaded += 1
+            yield NoteRow(nid, mid, mod, tags.split(), flds.split("\x1f"), field_index)
+        instrumentation.count(instrumentation.NOTES_LOADED, n_loaded)
+
+    def read_rows(self, note_type_name: str) -> list[NoteRow]:
+        return list(self.iter_rows(note_type_name))
+
+    @instrumentation.traced(name="CollectionReader.read_columns")
+    def read_columns(self, note_type_name: str, field_names: Optional[list[str]] = None) -> NoteColumns:
+        """Read the notes of the note type by columns, ordered by ID, with a single query.
+
+        Args:
+            note_type_name (str): The name of the note type
+            field_names (Optional[list[str]]): The fields to keep. Defaults to all the fields.
+
+        Raises:
+            ValueError: If the note type or one of the fields does not exist
+        """
+        all_field_names = self.get_field_names(note_type_name)
+        field_names = all_field_names if field_names is None else field_names
+        missing = [name for name in field_names if name not in all_field_names]
+        if missing:
+            raise ValueError(f"The note type {note_type_name} has no field {', '.join(missing)}.")
+        indexes = [all_field_names.index(name) for name in field_names]
+
+        columns = NoteColumns(field_names)
+        field_columns = [columns.fields[name] for name in field_names]
+        for nid, _, mod, flds, tags in self._scan(note_type_name):
+            columns.ids.append(nid)
+            columns.mods.append(mod)
+            columns.tags.append(tags.split())
+            fields = flds.split("\x1f")
+            for column, index in zip(field_columns, indexes):
+                column.append(fields[index])
+        instrumentation.count(instrumentation.NOTES_LOADED, len(columns))
+        return columns
@@ -0,0 +1,77 @@
+import os
+import re
+from json import JSONDecodeError, dumps, loads
+from os import path
+from typing import Iterable
+
+from anki.collection import Collection
+from anki.utils import ids2str
+from loguru import logger
+
+
+class ConversionJournal:
+    """Sidecar file of a note type conversion, to resume it after a crash or Ctrl-C.
+
+    Each line is a JSON record appended when a step of a chunk of notes is done:
+    - {"converting": [nids]}: written before the note type of the notes is changed.
+    Whether they were converted is checked in the collection when resuming.
+    - {"filled": [nids]}: written after the new fields of the notes are saved and committed.
+    A truncated last line (crash while writing it) is ignored.
+    """
+
+    def __init__(self, journal_path: str):
+        self.journal_path = journal_path
+        self.converting: dict[int, None] = {}  # Ordered set
+        self.filled: set[int] = set()
+        self.load()
+
+    @classmethod
+    def for_conversion(cls, col_path: str, original_type_name: str, new_type_name: str) -> "ConversionJournal":
+        """The journal of the conversion, next to the collection file."""
+        names = "_to_".join(re.sub(r"\W+", "_", name) for name in (original_type_name, new_type_name))
+        return cls(f"{path.splitext(col_path)[0]}_{names}.journal")
+
+    def load(self) -> None:
+        if not path.exists(self.journal_path):
+            return
+        with open(self.journal_path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = loads(line)
+                except JSONDecodeError:
+                    logger.warning(f"Ignoring the truncated line of the journal {self.journal_path}")
+                    continue
+                self.converting.update(dict.fromkeys(record.get("converting", [])))
+                self.filled.update(record.get("filled", []))
+
+    def _append(self, record: dict) -> None:
+        with open(self.journal_path, "a", encoding="utf-8") as f:
+            f.write(dumps(record) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+    def add_converting(self, notesID: Iterable[int]) -> None:
+        notesID = list(notesID)
+        self._append({"converting": notesID})
+        self.converting.update(dict.fromkeys(notesID))
+
+    def add_filled(self, notesID: Iterable[int]) -> None:
+        notesID = list(notesID)
+        self._append({"filled": notesID})
+        self.filled.update(notesID)
+
+    def get_unfilled(self, col: Collection, new_note_type_id: int) -> list[int]:
+        """The notes already converted to the new type but not filled yet."""
+        candidates = [nid for nid in self.converting if nid not in self.filled]
+        if not candidates:
+            return []
+        converted = set(col.db.list(
+            f"select id from notes where mid = ? and id in {ids2str(candidates)}", new_note_type_id
+        ))
+        return [nid for nid in candidates if nid in converted]
+
+    def remove(self) -> None:
+        if path.exists(self.journal_path):
+            os.remove(self.journal_path)
+        self.converting = {}
+        self.filled = set()
@@ -0,0 +1,327 @@
+import getpass
+import importlib
+import io
+import socket
+import socketserver
+import sys
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from json import JSONDecodeError, dumps, loads
+from os import chmod, path, remove
+from typing import Callable, Optional
+
+from anki.collection import Collection
+from loguru import logger
+
+from src.utils.group_index import GroupIndex
+from src.utils.hint_generation_utils import HintAdaptor
+from src.utils.note_cache import DEFAULT_CHUNK_SIZE, get_note_cache
+from src.utils.note_utils import NoteConverter
+from src.utils.query_cache import get_query_cache
+
+DEFAULT_SOCKET_PATH = path.join(tempfile.gettempdir(), f"anki-collection-editing-{getpass.getuser()}.sock")
+
+
+class _ConfirmingStdin(io.TextIOBase):
+    """Answers "y" to every input() of a job submitted with confirm=True."""
+
+    def readable(self) -> bool:
+        return True
+
+    def readline(self, size: int = -1) -> str:
+        return "y\n"
+
+
+@contextmanager
+def _answers(confirm: bool):
+    # Without confirmation, input() raises EOFError instead of waiting forever
+    stdin = sys.stdin
+    sys.stdin = _ConfirmingStdin() if confirm else io.StringIO("")
+    try:
+        yield
+    finally:
+        sys.stdin = stdin
+
+
+def resolve_function(name: Optional[str]) -> Optional[Callable]:
+    """Get a function of this project from its full name, ex:
+    "src.utils.german_utils.romanic_sorting_key"."""
+    if name is None:
+        return None
+    if not name.startswith("src."):
+        raise ValueError(f"{name} is not a function of this project.")
+    module_name, function_name = name.rsplit(".", 1)
+    return getattr(importlib.import_module(module_name), function_name)
+
+
+class EditingDaemon:
+    """Runs the editing jobs with the collection and the resources kept warm
+    between the jobs: the Collection object and its note cache, the spaCy models,
+    the embedding caches and the vector indexes.
+
+    The collection is closed after each job, as the scripts do: the changes are
+    committed and Anki can open the collection between the jobs. Reopening it is
+    much cheaper than the rest of the warm-up. The note cache is emptied at the
+    start of each job, since the notes may have been edited in Anki meanwhile.
+
+    The changes of a failed job are rolled back only since its last commit. The
+    cloze2basic job commits each converted and each filled chunk (cf. the
+    conversion journal), so a failed conversion stays partial: submit the same
+    job again to resume it.
+    """
+
+    def __init__(self, col: Collection, nlp_models: Optional[dict] = None):
+        """
+        Args:
+            col (Collection): The collection, kept by the daemon
+            nlp_models (Optional[dict]): The spaCy models already loaded, by language
+        """
+        self.col = col
+        self.nlp_models = {} if nlp_models is None else nlp_models
+        self.ann_indexes = {}
+        self.embedding_caches = {}
+        self.jobs: dict[str, Callable[..., Optional[dict]]] = {
+            "ping": self.ping,
+            "cloze2basic": self.cloze2basic,
+            "hints": self.hints,
+            "grouping": self.grouping,
+            "pinyin": self.pinyin,
+        }
+
+    def ensure_open(self) -> None:
+        try:
+            self.col.reopen()
+        except AssertionError:
+            pass
+        get_note_cache(self.col).invalidate()
+
+    def run_job(self, request: dict) -> dict:
+        """Run a job request {"job": <name>, "params": {...}, "confirm": bool}.
+        The collection is saved if the job succeeds, and the changes since the last
+        commit of the job are rolled back otherwise.
+
+        Returns:
+            dict: {"ok": True, "result": ..., "seconds": ...} or {"ok": False, "error": ...}
+        """
+        job = request.get("job")
+        if job not in self.jobs:
+            return {"ok": False, "error": f"Unknown job {job}. Available jobs: {', '.join(self.jobs)}"}
+        logger.info(f"Running the job {job}.")
+        start = time.perf_counter()
+        uses_col = job != "ping"
+        ok = False
+        try:
+            if uses_col:
+                self.ensure_open()
+            with _answers(request.get("confirm", False)):
+                result = self.jobs[job](**request.get("params", {}))
+            ok = True
+        except EOFError:
+            error = "The job asks for a confirmation. Submit it with confirm to answer yes."
+        except SystemExit:
+            error = "The job was stopped."
+        except Exception as e:
+            logger.exception(f"The job {job} failed.")
+            error = f"{type(e).__name__}: {e}"
+        finally:
+            if uses_col and self.col.db is not None:
+                # Rolled back if the job failed, except the chunks it already committed
+                self.col.close(save=ok)
+        if not ok:
+            return {"ok": False, "error": error}
+        return {"ok": True, "result": result, "seconds": time.perf_counter() - start}
+
+    def get_nlp(self, lang: str):
+        if lang not in self.nlp_models:
+            from src.create_syn_cognat_groups_main import load_spacy_model
+
+            self.nlp_models[lang] = load_spacy_model(lang)
+        return self.nlp_models[lang]
+
+    def ping(self) -> dict:
+        return {
+            "col_path": self.col.path,
+            "nlp_models": list(self.nlp_models),
+            "ann_indexes": list(self.ann_indexes),
+            "query_cache": get_query_cache(self.col).stats(),
+        }
+
+    def cloze2basic(
+        self,
+        new_type_name: str,
+        new_fields: list[list[str]],
+        query: str,
+        original_type_name: str = "Cloze",
+        cloze_text_field: str = "Text",
+        chunk_size: Optional[int] = DEFAULT_CHUNK_SIZE,
+    ) -> None:
+        """Cf. NoteConverter.run_cloze2Basic. The chunks are committed as they are
+        converted and filled: if the job fails, the same job resumes the conversion."""
+        note_converter = NoteConverter(
+            None,
+            new_type_name,
+            [tuple(field) for field in new_fields],
+            original_type_name,
+            cloze_text_field,
+            col=self.col,
+        )
+        note_converter.run_cloze2Basic(query=query, chunk_size=chunk_size)
+
+    def hints(
+        self,
+        note_type_name: str,
+        flds_in_hint: list[str],
+        query: Optional[str] = None,
+        sorting_key: Optional[str] = None,
+        additional_hint_func: Optional[str] = None,
+        chunk_size: Optional[int] = None,
+        n_process: int = 1,
+        incremental: bool = False,
+        **hint_params,
+    ) -> dict:
+        """Generate the hints of the notes found by query, or of all the groups of
+        the query_field if query is None. The functions are given by their full name
+        (cf. resolve_function), the other parameters are the ones of HintAdaptor."""
+        hint_adaptor = HintAdaptor(
+            note_type_name,
+            flds_in_hint,
+            col=self.col,
+            sorting_key=resolve_function(sorting_key),
+            additional_hint_func=resolve_function(additional_hint_func),
+            **hint_params,
+        )
+        if query is not None:
+            hint_adaptor.run(query)
+            return {}
+        group_index = GroupIndex.from_collection(
+            self.col, note_type_name, hint_adaptor.query_field, hint_adaptor.group_separator
+        )
+        hint_adaptor.run_all_groups(group_index, chunk_size=chunk_size, n_process=n_process, incremental=incremental)
+        return {"groups": len(group_index.group_to_nids)}
+
+    def grouping(self, lang: str = "zh", vector_search: bool = True, **params) -> dict:
+        """Cf. create_syn_cognat_groups_main.main"""
+        from src.create_syn_cognat_groups_main import main
+
+        groups = main(
+            col=self.col,
+            lang=lang,
+            vector_search=vector_search,
+            nlp=self.get_nlp(lang) if vector_search else None,
+            ann_indexes=self.ann_indexes,
+            embedding_caches=self.embedding_caches,
+            **params,
+        )
+        return {"groups": len(groups)}
+
+    def pinyin(
+        self,
+        note_type_name: str,
+        field_to_fill: str,
+        source_field: str,
+        query: str,
+        n_process: int = 1,
+        chunk_size: Optional[int] = DEFAULT_CHUNK_SIZE,
+    ) -> dict:
+        """Cf. chinese_utils.fill_pinyin. The pinyin converted by the previous
+        jobs are kept in its cache."""
+        from src.utils.chinese_utils import fill_pinyin
+
+        saved = fill_pinyin(
+            None, note_type_name, field_to_fill, source_field, query,
+            col=self.col, n_process=n_process, chunk_size=chunk_size,
+        )
+        return {"saved": saved}
+
+
+class _JobHandler(socketserver.StreamRequestHandler):
+    """One JSON request line, one JSON response line per connection."""
+
+    def handle(self) -> None:
+        try:
+            request = loads(self.rfile.readline())
+        except JSONDecodeError as e:
+            request, response = {}, {"ok": False, "error": f"Invalid request: {e}"}
+        else:
+            if request.get("job") == "shutdown":
+                response = {"ok": True, "result": None}
+            else:
+                response = self.server.editing_daemon.run_job(request)
+        self.wfile.write((dumps(response, default=str) + "\n").encode("utf-8"))
+        if request.get("job") == "shutdown":
+            # shutdown() waits for serve_forever, which is running this handler
+            threading.Thread(target=self.server.shutdown).start()
+
+
+class DaemonServer(socketserver.UnixStreamServer):
+    """Unix socket server running the jobs one at a time."""
+
+    def __init__(self, editing_daemon: EditingDaemon, socket_path: str = DEFAULT_SOCKET_PATH):
+        if path.exists(socket_path):
+            if is_daemon_running(socket_path):
+                raise RuntimeError(f"A daemon is already listening on {socket_path}.")
+            remove(socket_path)  # Left by a daemon that crashed
+        super().__init__(socket_path, _JobHandler)
+        chmod(socket_path, 0o600)
+        self.editing_daemon = editing_daemon
+
+    def server_close(self) -> None:
+        super().server_close()
+        if path.exists(self.server_address):
+            remove(self.server_address)
+
+
+def serve(col: Collection, socket_path: str = DEFAULT_SOCKET_PATH, nlp_models: Optional[dict] = None) -> None:
+    """Run the jobs submitted on the socket until a "shutdown" job."""
+    with DaemonServer(EditingDaemon(col, nlp_models), socket_path) as server:
+        logger.info(f"Listening on {socket_path}.")
+        try:
+            server.serve_forever()
+        finally:
+            if col.db is not None:
+                col.close()
+    logger.info("Daemon stopped.")
+
+
+def submit_job(
+    job: str,
+    params: Optional[dict] = None,
+    confirm: bool = False,
+    socket_path: str = DEFAULT_SOCKET_PATH,
+    timeout: Optional[float] = None,
+) -> dict:
+    """Send a job to the daemon and wait for its response.
+
+    Args:
+        job (str): "ping", "cloze2basic", "hints", "grouping", "pinyin" or "shutdown"
+        params (Optional[dict]): The parameters of the job (cf. EditingDaemon)
+        confirm (bool, optional): To answer yes to the confirmations asked by the job.
+        Otherwise, a job asking for a confirmation fails. Defaults to False.
+        socket_path (str, optional): The socket of the daemon
+        timeout (Optional[float]): The maximum seconds to wait. Defaults to no limit.
+
+    Raises:
+        ConnectionError: If no daemon is listening on socket_path
+
+    Returns:
+        dict: {"ok": True, "result": ..., "seconds": ...} or {"ok": False, "error": ...}
+    """
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+            client.settimeout(timeout)
+            client.connect(socket_path)
+            request = {"job": job, "params": params or {}, "confirm": confirm}
+            client.sendall((dumps(request) + "\n").encode("utf-8"))
+            with client.makefile("r", encoding="utf-8") as f:
+                return loads(f.readline())
+    except (FileNotFoundError, ConnectionRefusedError) as e:
+        raise ConnectionError(f"No daemon is listening on {socket_path}.") from e
+
+
+def is_daemon_running(socket_path: str = DEFAULT_SOCKET_PATH) -> bool:
+    try:
+        return submit_job("ping", socket_path=socket_path, timeout=5)["ok"]
+    except (ConnectionError, OSError):
+        return False
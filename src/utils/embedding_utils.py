@@ -0,0 +1,203 @@
+import os
+import unicodedata
+from bisect import bisect_right
+from json import dump, load
+from os import path
+from typing import Optional
+
+import numpy as np
+from loguru import logger
+
+from src.utils import instrumentation
+from src.utils.utils import text_hash
+
+
+def normalize_text(text: str) -> str:
+    return " ".join(unicodedata.normalize("NFC", text).split())
+
+
+def get_model_name(nlp) -> str:
+    """Name of the spaCy pipeline, with its version. Ex: zh_core_web_md-3.7.0"""
+    return f"{nlp.meta['lang']}_{nlp.meta['name']}-{nlp.meta['version']}"
+
+
+# Number of chunk files from which the next save merges all the vectors in one file
+MAX_CHUNK_FILES = 8
+
+
+class EmbeddingCache:
+    """Vectors of texts saved on disk, keyed by the model name and the hash of the
+    normalized text.
+
+    The files are, for each model:
+    - <cache_dir>/<model_name>.npy: the vectors, memory-mapped when loaded
+    - <cache_dir>/<model_name>_chunk<first row>.npy: the vectors added by each
+      later save. When there are MAX_CHUNK_FILES of them, the next save merges
+      them in <model_name>.npy
+    - <cache_dir>/<model_name>_index.json: the text hash -> row of the vector mapping
+    """
+
+    def __init__(self, cache_dir: str, model_name: str):
+        self.cache_dir = cache_dir
+        self.model_name = model_name
+        self.rows: dict[str, int] = {}
+        # The memory-mapped files, in the order of the rows, and their first row
+        self.blocks: list[np.ndarray] = []
+        self.block_starts: list[int] = []
+        # The rows of the vectors in the index, and in the files (more if a save was
+        # interrupted after writing its vectors)
+        self.n_saved = 0
+        self.n_file_rows = 0
+        self.new_vectors: list[np.ndarray] = []
+        self.load()
+
+    @property
+    def vectors_file(self) -> str:
+        return path.join(self.cache_dir, f"{self.model_name}.npy")
+
+    @property
+    def index_file(self) -> str:
+        return path.join(self.cache_dir, f"{self.model_name}_index.json")
+
+    def chunk_file(self, start: int) -> str:
+        return path.join(self.cache_dir, f"{self.model_name}_chunk{start}.npy")
+
+    def load(self) -> None:
+        self.blocks, self.block_starts, self.n_saved, self.n_file_rows = [], [], 0, 0
+        if not (path.exists(self.vectors_file) and path.exists(self.index_file)):
+            return
+        with open(self.index_file, "r", encoding="utf-8") as f:
+            rows = load(f)
+        n_indexed = max(rows.values(), default=-1) + 1
+        self.blocks.append(np.load(self.vectors_file, mmap_mode="r"))
+        self.block_starts.append(0)
+        self.n_file_rows = len(self.blocks[0])
+        # A chunk file written by a save interrupted before the index is ignored,
+        # and overwritten by the next save
+        while self.n_file_rows < n_indexed and path.exists(self.chunk_file(self.n_file_rows)):
+            self.blocks.append(np.load(self.chunk_file(self.n_file_rows), mmap_mode="r"))
+            self.block_starts.append(self.n_file_rows)
+            self.n_file_rows += len(self.blocks[-1])
+        # The vectors of the files beyond the index are never read: their rows are
+        # given to the next new vectors, which are then saved by a merge
+        self.n_saved = min(self.n_file_rows, n_indexed)
+        self.rows = {key: row for key, row in rows.items() if row < self.n_saved}
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.rows
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def get(self, key: str) -> np.ndarray:
+        row = self.rows[key]
+        if row >= self.n_saved:
+            return self.new_vectors[row - self.n_saved]
+        i = bisect_right(self.block_starts, row) - 1
+        return np.asarray(self.blocks[i][row - self.block_starts[i]])
+
+    def add(self, key: str, vector: np.ndarray) -> None:
+        if key in self.rows:
+            return
+        self.rows[key] = len(self.rows)
+        self.new_vectors.append(np.asarray(vector, dtype=np.float32))
+
+    def save(self) -> None:
+        """Append the new vectors to the cache in a new chunk file. The saved
+        vectors are only copied when the chunk files are merged."""
+        if not self.new_vectors:
+            return
+        os.makedirs(self.cache_dir, exist_ok=True)
+        new_vectors = np.stack(self.new_vectors)
+        if not self.blocks:
+            np.save(self.vectors_file, new_vectors)
+            self.save_index()
+        elif len(self.blocks) - 1 >= MAX_CHUNK_FILES or self.n_file_rows > self.n_saved:
+            self.merge(new_vectors)
+        else:
+            np.save(self.chunk_file(self.n_saved), new_vectors)
+            self.save_index()
+        self.new_vectors = []
+        self.load()
+
+    def save_index(self) -> None:
+        """Replace the index file at once, so that an interrupted save can't
+        leave a truncated index."""
+        tmp_file = f"{self.index_file}.tmp"
+        with open(tmp_file, "w", encoding="utf-8") as f:
+            dump(self.rows, f)
+        os.replace(tmp_file, self.index_file)
+
+    def merge(self, new_vectors: np.ndarray) -> None:
+        """Write all the vectors in the main file and remove the chunk files.
+        The index is saved before the main file is replaced."""
+        # Copied by blocks in a new memory-mapped file, replacing the old one at the end
+        tmp_file = f"{self.vectors_file}.tmp.npy"
+        out = np.lib.format.open_memmap(
+            tmp_file,
+            mode="w+",
+            dtype=np.float32,
+            shape=(self.n_saved + len(new_vectors), new_vectors.shape[1]),
+        )
+        for block, block_start in zip(self.blocks, self.block_starts):
+            n_rows = min(len(block), self.n_saved - block_start)
+            for start in range(0, n_rows, 65536):
+                end = min(start + 65536, n_rows)
+                out[block_start + start : block_start + end] = block[start:end]
+        out[self.n_saved :] = new_vectors
+        out.flush()
+        del out
+        self.save_index()
+        chunk_starts = self.block_starts[1:]
+        self.blocks = []
+        os.replace(tmp_file, self.vectors_file)
+        for start in chunk_starts:
+            os.remove(self.chunk_file(start))
+
+
+@instrumentation.traced
+def embed_texts(
+    nlp,
+    texts: list[str],
+    cache: Optional[EmbeddingCache] = None,
+    batch_size: int = 256,
+    n_process: int = 1,
+) -> np.ndarray:
+    """Get the vectors of the texts with nlp.pipe, embedding only the texts that
+    are not in the cache yet.
+
+    Args:
+        nlp: The spaCy pipeline
+        texts (list[str]): The texts to embed
+        cache (Optional[EmbeddingCache]): The cache of the vectors of the pipeline.
+        If None, all the texts are embedded.
+        batch_size (int, optional): The batch size of nlp.pipe. Defaults to 256.
+        n_process (int, optional): The number of processes of nlp.pipe. Defaults to 1.
+
+    Returns:
+        np.ndarray: The (len(texts), vector_len) matrix of the vectors
+    """
+    normalized_texts = [normalize_text(text) for text in texts]
+    keys = [text_hash(text) for text in normalized_texts]
+
+    missing = {}
+    for key, text in zip(keys, normalized_texts):
+        if (cache is None or key not in cache) and key not in missing:
+            missing[key] = text
+    logger.info(f"Embedding {len(missing)} texts out of {len(texts)}.")
+
+    vectors = {}
+    for key, doc in zip(
+        missing, nlp.pipe(missing.values(), batch_size=batch_size, n_process=n_process)
+    ):
+        vectors[key] = doc.vector
+        if cache is not None:
+            cache.add(key, doc.vector)
+    if cache is not None:
+        cache.save()
+
+    if not texts:
+        return np.zeros((0, nlp.vocab.vectors_length), dtype=np.float32)
+    return np.stack(
+        [vectors[key] if key in vectors else cache.get(key) for key in keys]
+    ).astype(np.float32)
@@ -1,11 +1,10 @@
-import re
-
 from anki.collection import Collection
 from anki.models import ModelsDictProxy, NotetypeDict
 from anki.notes import Note
-from bs4 import BeautifulSoup
 from loguru import logger
 
+from src.utils.cloze_utils import get_note_cloze_data
+from src.utils.html_utils import extract_field_lines, html_to_text
 from src.utils.utils import CLOZE_TYPE
 
 def proceed():
@@ -20,7 +19,8 @@ def proceed():
 
 
 def extract_text(node,transform_newline=False):
-    """Recursively extract text from the BeautifulSoup node, handling blank lines."""
+    """Recursively extract text from the BeautifulSoup node, handling blank lines.
+    Cf. html_utils.extract_field_lines which gives the same lines without building the tree."""
     if transform_newline:
         newline_replacement = " "
     else:
@@ -73,29 +73,20 @@ class NoteFieldsUtils:
             filter(lambda field: field["name"] == field_name, self.note_type["flds"])
         )[0]["ord"]
 
-    def extract_cloze_deletion(self,field_to_extract_index, note, cloze_deletion) -> str:
-        regex = r"\{\{%s::([^}:]*):?:?.*\}\}" % cloze_deletion
+    def extract_cloze_deletion(self,field_to_extract_index, note, cloze_deletion, occurrence=0) -> str:
         # TODO: use field_name directly ?
-        # TODO: include case when there's several cloze for one card
-        # (ex: several {{c1::...}}) => to put in different fields
-        # https://regex101.com/r/usAlIw/1
-        p = re.compile(regex)
-        m = p.search(note.fields[field_to_extract_index])
-        if m:
-            return m.group(1)
-        else:
+        # The several cloze for one card (ex: several {{c1::...}}) are in
+        # get_note_cloze_data(...).deletions["c1"] => to put in different fields
+        try:
+            return get_note_cloze_data(note, field_to_extract_index).get(cloze_deletion, occurrence)
+        except KeyError:
             logger.error(f"Cloze text: '{note.fields[field_to_extract_index]}'")
-            raise Exception(f"Regex {regex} incorrect.")
+            raise Exception(f"Cloze deletion {cloze_deletion} not found.")
 
 
     def extract_text_from_field(self,note,field_name,transform_newline=False):
         if self.check_field_exists(field_name):
-            html_content = note[field_name].replace('\n', ' ')
-            soup = BeautifulSoup(html_content, "html.parser")
-            lines = extract_text(soup,transform_newline=transform_newline)
-            lines = remove_pos_tags_from_lines(lines)
-            text = ' '.join(lines)
-            return text
+            return extract_text_from_html(note[field_name],transform_newline=transform_newline)
         else:
             raise ValueError(f"Field {field_name} does not exist.")
 
@@ -116,12 +107,10 @@ class NoteFieldsUtils:
         
     def get_cleaned_field_data(self, separator, note, flds_in_hint):
         # TODO: check if given note is of correct type
-        content = ""
         for field in flds_in_hint:
-            text = self.extract_text_from_field(note,field,transform_newline=True)
-            clean_text = truncate_field([t for t in text.splitlines() if t][0], 60)
-            content += clean_text + separator
-        return content
+            if not self.check_field_exists(field):
+                raise ValueError(f"Field {field} does not exist.")
+        return get_cleaned_fields_content(separator, note, flds_in_hint)
 
     def get_cloze_data(self, flds_in_hint, cloze_field_index, separator, c_err, note):
         content = ""
@@ -159,11 +148,29 @@ def remove_pos_tags_from_lines(lines: list[str]):
     return lines
     
 
+def extract_text_from_html(html_content: str, transform_newline=False) -> str:
+    lines = extract_field_lines(html_content.replace('\n', ' '),transform_newline=transform_newline)
+    lines = remove_pos_tags_from_lines(lines)
+    return ' '.join(lines)
+
+
+def get_cleaned_fields_content(separator, fields, flds_in_hint) -> str:
+    """The first line of the text of each field in flds_in_hint, each followed by
+    the separator. fields can be a Note or a field name -> content dict."""
+    content = ""
+    for field in flds_in_hint:
+        text = extract_text_from_html(fields[field],transform_newline=True)
+        clean_text = truncate_field([t for t in text.splitlines() if t][0], 60)
+        content += clean_text + separator
+    return content
+
+
 def truncate_field(field: str, max_length: int = 30) -> str:
+    text = html_to_text(field)
     return (
-        f'{BeautifulSoup(field[:max_length], "html.parser").text}...'
-        if len(BeautifulSoup(field, "html.parser").text) > max_length + 3
-        else BeautifulSoup(field, "html.parser").text
+        f'{html_to_text(field[:max_length])}...'
+        if len(text) > max_length + 3
+        else text
     )
 
 
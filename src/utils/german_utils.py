@@ -1,27 +1,92 @@
-import nltk
-from nltk.corpus import stopwords
-from nltk.tokenize import word_tokenize
+import re
+from functools import lru_cache
+from typing import Iterable, Optional
 
 # import icu
 # collator = icu.Collator.createInstance()
 
-try:
-    stop_words = set(stopwords.words('german'))
-except LookupError:
-    nltk.download('stopwords')
-    stop_words = set(stopwords.words('german'))
+# NLTK and its data are loaded on first use, not when the module is imported
 
-stop_words.update(("e","r","s"))
+# Words (with their hyphens, ex: E-Mail) and punctuation signs, as NLTK word_tokenize
+# splits the hints, without its Punkt model
+_TOKEN = re.compile(r"\w+(?:[-'’]\w+)*|[^\w\s]")
+
+
+@lru_cache(maxsize=None)
+def get_stop_words() -> frozenset[str]:
+    import nltk
+    from nltk.corpus import stopwords
+
+    try:
+        stop_words = set(stopwords.words('german'))
+    except LookupError:
+        nltk.download('stopwords')
+        stop_words = set(stopwords.words('german'))
+    stop_words.update(("e","r","s"))
+    return frozenset(stop_words)
+
+def tokenize(text: str) -> list[str]:
+    return _TOKEN.findall(text)
 
 def get_main_words(text):
+    """The words of the text without the stop words, with the NLTK tokenizer.
+    The hints use GermanKeys, which is much faster."""
+    from nltk.tokenize import word_tokenize
+
+    stop_words = get_stop_words()
     word_tokens = word_tokenize(text)
     return iter(w for w in word_tokens if w.lower() not in stop_words)
-        
+
+
+class GermanKeys:
+    """Sorting key and additional hint of the German hints, computed together in one
+    pass over the text and memoized by text: the sorting field and the additional
+    hint field are the same one, and a text is found again in each run.
+
+    The articles and the other stop words are removed, so that "das Mädchen" is sorted
+    with the M and hinted by "M".
+    """
+
+    def __init__(self, stop_words: Optional[Iterable[str]] = None, maxsize: Optional[int] = 65536):
+        """
+        Args:
+            stop_words (Optional[Iterable[str]]): The lowercase words to skip. Defaults
+            to the German stop words of NLTK and the articles e, r, s.
+            maxsize (Optional[int]): The number of texts kept in the cache
+        """
+        self._stop_words = None if stop_words is None else frozenset(stop_words)
+        self.get_keys = lru_cache(maxsize=maxsize)(self._compute_keys)
+
+    @property
+    def stop_words(self) -> frozenset[str]:
+        if self._stop_words is None:
+            self._stop_words = get_stop_words()
+        return self._stop_words
+
+    def _compute_keys(self, text: str) -> tuple[str, str]:
+        """
+        Returns:
+            tuple[str, str]: The sorting key (the main words) and the first letter
+            of the first main word, or "" if the text has no main word
+        """
+        stop_words = self.stop_words
+        main_words = [w for w in tokenize(text) if w.lower() not in stop_words]
+        # The first letter, not the bracket of "(sich) ärgern"
+        initial = next((w[0] for w in main_words if w[0].isalnum()), "")
+        return " ".join(main_words), initial
+
+    def sorting_key(self, hint_info: tuple[str, str]) -> str:
+        return self.get_keys(hint_info[1])[0]
+
+    def additional_hint(self, text: str) -> str:
+        return self.get_keys(text)[1]
+
+
+_german_keys = GermanKeys()
+
 def romanic_sorting_key(hint_info):
-    return " ".join(get_main_words(hint_info[1]))
+    return _german_keys.sorting_key(hint_info)
 
 def romanic_additional_hint_func(text):
     """Get the first letter of the main info (ex: for das Mädchen -> M, not d)"""
-    return next(get_main_words(text))[0]
-
-# TODO: make a class for the sorting key and additional hint func ?
\ No newline at end of file
+    return _german_keys.additional_hint(text)
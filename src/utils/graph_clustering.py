@@ -0,0 +1,124 @@
+from collections import Counter
+from typing import Hashable, Iterable, Optional, Sequence
+
+# (distance, note ID, neighbour note ID)
+Edge = tuple[float, int, int]
+
+
+class UnionFind:
+    """Disjoint sets of items, with the size of each set."""
+
+    def __init__(self, items: Iterable[Hashable] = ()):
+        self.parents: dict[Hashable, Hashable] = {}
+        self.sizes: dict[Hashable, int] = {}
+        for item in items:
+            self.add(item)
+
+    def add(self, item: Hashable) -> None:
+        if item not in self.parents:
+            self.parents[item] = item
+            self.sizes[item] = 1
+
+    def find(self, item: Hashable) -> Hashable:
+        self.add(item)
+        while self.parents[item] != item:
+            # Path halving: each visited item points to its grandparent
+            self.parents[item] = self.parents[self.parents[item]]
+            item = self.parents[item]
+        return item
+
+    def union(self, a: Hashable, b: Hashable, max_size: Optional[int] = None) -> bool:
+        """Merge the sets of a and b, unless the merged set would be bigger than max_size.
+        Returns if a and b are in the same set afterwards."""
+        root_a, root_b = self.find(a), self.find(b)
+        if root_a == root_b:
+            return True
+        if max_size is not None and self.sizes[root_a] + self.sizes[root_b] > max_size:
+            return False
+        if self.sizes[root_a] < self.sizes[root_b]:
+            root_a, root_b = root_b, root_a
+        self.parents[root_b] = root_a
+        self.sizes[root_a] += self.sizes.pop(root_b)
+        return True
+
+    def groups(self) -> list[list[Hashable]]:
+        """The sets, with their items in insertion order."""
+        groups: dict[Hashable, list[Hashable]] = {}
+        for item in self.parents:
+            groups.setdefault(self.find(item), []).append(item)
+        return list(groups.values())
+
+
+def knn_graph_edges(
+    notesID: Sequence[int],
+    neighbours: Sequence[Sequence[int]],
+    distances: Sequence[Sequence[float]],
+    distance_threshold: float,
+) -> list[Edge]:
+    """The edges of the kNN graph between each note and its neighbours closer
+    than distance_threshold, sorted by distance.
+
+    Args:
+        notesID (Sequence[int]): The IDs of the queried notes
+        neighbours (Sequence[Sequence[int]]): The IDs of the nearest notes of each note
+        distances (Sequence[Sequence[float]]): The distances to the nearest notes
+        distance_threshold (float): The maximum distance of an edge
+    """
+    edges = [
+        (distance, nid, neighbour)
+        for nid, row_neighbours, row_distances in zip(notesID, neighbours, distances)
+        for neighbour, distance in zip(row_neighbours, row_distances)
+        if neighbour != nid and distance <= distance_threshold
+    ]
+    edges.sort()
+    return edges
+
+
+def cluster_knn_graph(edges: Iterable[Edge], max_group_size: Optional[int] = None) -> list[list[int]]:
+    """Group the notes linked by the edges (connected components of the graph).
+
+    The edges are merged from the closest to the farthest, so when max_group_size
+    is given, the groups that would be too big are split at their weakest links.
+
+    Args:
+        edges (Iterable[Edge]): The edges of the graph, sorted by distance
+        max_group_size (Optional[int]): The maximum number of notes in a group
+
+    Returns:
+        list[list[int]]: The groups of at least 2 notes
+    """
+    union_find = UnionFind()
+    for _, a, b in edges:
+        union_find.union(a, b, max_group_size)
+    return [group for group in union_find.groups() if len(group) > 1]
+
+
+def merge_into_existing_groups(
+    clusters: Iterable[list[int]],
+    note_groups: dict[int, list[int]],
+) -> tuple[list[list[int]], dict[int, list[int]]]:
+    """Decide which clusters become new groups and which extend an existing group.
+
+    A cluster without any note already in a group is a new group. Otherwise, its notes
+    that are not in a group yet join the existing group sharing the most notes with it.
+
+    Args:
+        clusters (Iterable[list[int]]): The clusters of notes (cf. cluster_knn_graph)
+        note_groups (dict[int, list[int]]): The IDs of the existing groups of each note
+
+    Returns:
+        list[list[int]]: The new groups
+        dict[int, list[int]]: The notes to add to each existing group, by group ID
+    """
+    new_groups = []
+    extended_groups: dict[int, list[int]] = {}
+    for cluster in clusters:
+        overlap = Counter(group_id for nid in cluster for group_id in note_groups.get(nid, ()))
+        if not overlap:
+            new_groups.append(cluster)
+            continue
+        new_members = [nid for nid in cluster if not note_groups.get(nid)]
+        if new_members:
+            group_id = overlap.most_common(1)[0][0]
+            extended_groups.setdefault(group_id, []).extend(new_members)
+    return new_groups, extended_groups
@@ -0,0 +1,193 @@
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from typing import Callable, Iterable, Iterator, Optional
+
+from src.utils.cloze_utils import parse_cloze_field
+from src.utils.field_utils import breaklines_by_number, get_cleaned_fields_content
+from src.utils.html_utils import html_to_text
+
+# (group ID, [(note ID, fields of the note)])
+GroupTask = tuple[int, list[tuple[int, list[str]]]]
+# (group ID, [(note ID, adapted hint)] in the order of the hint, or an error message)
+GroupResult = tuple[int, list[tuple[int, str]] | str]
+
+
+def default_text_sorting_key(row):
+    return row[1].lower()
+
+
+def default_int_sorting_key(row):
+    return int(row[1])
+
+
+def first_char(text: str) -> str:
+    return text[0]
+
+
+@dataclass
+class HintSettings:
+    """What HintAdaptor needs to compute the hints of a group from the fields of
+    its notes. It is sent to the worker processes, so the functions must be picklable
+    (defined at the top level of a module)."""
+
+    field_names: list[str]
+    flds_in_hint: list[str]
+    separator: str = ", "
+    sorting_field: Optional[str] = None
+    sorting_key: Optional[Callable] = None
+    additional_hint_field: Optional[str] = None
+    additional_hint_func: Optional[Callable] = None
+    break_lines: bool = False
+    cloze_field_index: Optional[int] = None  # Only for Cloze notes
+
+
+def get_sorting_key(note_hints: list[tuple[str, str]]) -> Callable:
+    """If all the sorting infos are numeric, sort as int
+    (not int as strings, otherwise "10"<"6")"""
+    try:
+        [int(el[1]) for el in note_hints]
+        return default_int_sorting_key
+    except ValueError:
+        return default_text_sorting_key
+
+
+class JoinedHint:
+    """The lines of a hint joined once, with the offset of each line.
+
+    The hint with one line replaced is then two slices of the joined text, instead
+    of joining all the lines again for each note of the group.
+    """
+
+    def __init__(self, lines: list[str], separator: str = "<br>"):
+        self.text = separator.join(lines)
+        self.starts = []
+        self.lengths = []
+        offset = 0
+        for line in lines:
+            self.starts.append(offset)
+            self.lengths.append(len(line))
+            offset += len(line) + len(separator)
+
+    def __len__(self) -> int:
+        return len(self.starts)
+
+    def replace_line(self, position: int, text: str) -> str:
+        start = self.starts[position]
+        return self.text[:start] + text + self.text[start + self.lengths[position]:]
+
+
+def sort_hint_lines(
+    note_hints: list[tuple[str, str]],
+    sorting_key: Callable,
+    break_lines: bool = False,
+) -> tuple[list[int], list[str], list[int]]:
+    """Sort the hints of the notes of a group.
+
+    Args:
+        note_hints (list[tuple[str, str]]): The hint and the sorting info of each note
+        sorting_key (Callable): The key to sort the (hint, sorting info) rows
+        break_lines (bool, optional): To add blank lines between decades. Defaults to False.
+
+    Returns:
+        list[int]: The indices of the notes in the sorted order
+        list[str]: The lines of the hint
+        list[int]: The line of each note in the sorted order, so that the line of a
+        note is known even if several notes have the same hint
+    """
+    order = sorted(range(len(note_hints)), key=lambda i: sorting_key(note_hints[i]))
+    lines = [note_hints[i][0] for i in order]
+    positions = list(range(len(lines)))
+    if break_lines:
+        lines = breaklines_by_number(lines)
+        positions = [i for i, line in enumerate(lines) if line != ""]
+    return order, lines, positions
+
+
+def compute_group_hints(settings: HintSettings, notes: list[tuple[int, list[str]]]) -> list[tuple[int, str]]:
+    """Compute the hint adapted to each note of a group, as HintAdaptor.adapt_hint_to_note,
+    from the fields of the notes only.
+
+    Args:
+        settings (HintSettings): How to build the hints
+        notes (list[tuple[int, list[str]]]): The ID and the fields of each note of the group
+
+    Raises:
+        KeyError: If a field or cloze deletion used for the sorting or
+        the additional hint is missing
+
+    Returns:
+        list[tuple[int, str]]: The ID and adapted hint of each note, sorted by the sorting key
+    """
+    note_hints = []
+    hidding_chars = []
+    for _, fields in notes:
+        if settings.cloze_field_index is not None:
+            cloze_data = parse_cloze_field(fields[settings.cloze_field_index])
+            content = "".join(
+                cloze_data.deletions[cloze][0] + settings.separator
+                for cloze in settings.flds_in_hint
+                if cloze in cloze_data.deletions
+            )
+            get_raw_text = cloze_data.get
+        else:
+            named_fields = dict(zip(settings.field_names, fields))
+            content = get_cleaned_fields_content(settings.separator, named_fields, settings.flds_in_hint)
+            get_raw_text = named_fields.__getitem__
+        content = content[:len(content)-len(settings.separator)]
+        sorting_info = get_raw_text(settings.sorting_field)
+        if settings.cloze_field_index is None:
+            sorting_info = html_to_text(sorting_info)
+        note_hints.append((content, sorting_info))
+
+        if settings.additional_hint_field is None:
+            hidding_chars.append("?")
+        else:
+            additional_hint_func = settings.additional_hint_func or first_char
+            hidding_chars.append(additional_hint_func(html_to_text(get_raw_text(settings.additional_hint_field))))
+
+    sorting_key = settings.sorting_key or get_sorting_key(note_hints)
+    order, lines, positions = sort_hint_lines(note_hints, sorting_key, settings.break_lines)
+    joined_hint = JoinedHint(lines)
+    return [
+        (notes[i][0], joined_hint.replace_line(position, hidding_chars[i]))
+        for i, position in zip(order, positions)
+    ]
+
+
+_WORKER_SETTINGS: Optional[HintSettings] = None
+
+
+def _init_worker(settings: HintSettings) -> None:
+    global _WORKER_SETTINGS
+    _WORKER_SETTINGS = settings
+
+
+def _compute_in_worker(task: GroupTask) -> GroupResult:
+    group_id, notes = task
+    try:
+        return group_id, compute_group_hints(_WORKER_SETTINGS, notes)
+    except (KeyError, IndexError, ValueError) as e:
+        return group_id, f"{type(e).__name__}: {e}"
+
+
+def compute_groups_hints_in_pool(
+    settings: HintSettings,
+    tasks: Iterable[GroupTask],
+    n_process: Optional[int] = None,
+    groups_per_task: int = 64,
+) -> Iterator[GroupResult]:
+    """Compute the hints of the groups in a pool of processes.
+
+    The results are yielded in the order of the tasks, as soon as they are
+    computed, so that a single writer can save them while the workers go on.
+
+    Args:
+        settings (HintSettings): How to build the hints, sent once to each worker
+        tasks (Iterable[GroupTask]): The groups with the fields of their notes
+        n_process (Optional[int]): The number of worker processes.
+        Defaults to the number of CPUs.
+        groups_per_task (int, optional): The number of groups sent at once to a worker.
+        Defaults to 64.
+    """
+    with ProcessPoolExecutor(n_process, initializer=_init_worker, initargs=(settings,)) as executor:
+        yield from executor.map(_compute_in_worker, tasks, chunksize=groups_per_task)
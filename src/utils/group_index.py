@@ -0,0 +1,98 @@
+from collections import defaultdict
+
+from anki.collection import Collection
+
+from src.utils import instrumentation
+from src.utils.collection_reader import CollectionReader
+from src.utils.field_utils import NoteFieldsUtils
+
+
+def parse_group_ids(field_content: str, group_separator: str = ", ") -> list[int]:
+    """Get the group IDs written in a group field. Ex: '1, 12' -> [1, 12]"""
+    group_ids = []
+    for el in field_content.split(group_separator.strip() or group_separator):
+        el = el.strip()
+        if el.isdigit():
+            group_ids.append(int(el))
+    return group_ids
+
+
+class GroupIndex:
+    """Index of the groups (synonyms, cognats...) of all the notes of a note type.
+
+    It is built by reading the group field of every note once, instead of running
+    one regex query per group ID.
+    """
+
+    def __init__(self, group_separator: str = ", "):
+        self.group_separator = group_separator
+        self.group_to_nids: dict[int, list[int]] = defaultdict(list)
+        self.nid_to_groups: dict[int, list[int]] = defaultdict(list)
+
+    @classmethod
+    @instrumentation.traced(name="GroupIndex.from_collection")
+    def from_collection(
+        cls,
+        col: Collection,
+        note_type_name: str,
+        group_field: str,
+        group_separator: str = ", ",
+    ) -> "GroupIndex":
+        """Build the index with a single scan of the notes of the note type.
+
+        Args:
+            col (Collection): The Anki collection
+            note_type_name (str): The name of the note type of the grouped notes
+            group_field (str): The field holding the group IDs. Ex: "Synonyms group"
+            group_separator (str, optional): The separator between the group IDs.
+            Defaults to ", ".
+        """
+        note_field_utils = NoteFieldsUtils(col, note_type_name)
+        if note_field_utils.note_type is None:
+            raise ValueError(f"Note type {note_type_name} does not exist.")
+        field_index = note_field_utils.get_field_index(group_field)
+
+        index = cls(group_separator)
+        for nid, flds in col.db.execute(
+            "select id, flds from notes where mid = ?", note_field_utils.note_type["id"]
+        ):
+            index.add(nid, parse_group_ids(flds.split("\x1f")[field_index], group_separator))
+        instrumentation.count(instrumentation.SQL_QUERIES)
+        return index
+
+    @classmethod
+    @instrumentation.traced(name="GroupIndex.from_reader")
+    def from_reader(
+        cls,
+        reader: CollectionReader,
+        note_type_name: str,
+        group_field: str,
+        group_separator: str = ", ",
+    ) -> "GroupIndex":
+        """Build the index from the collection file, without the Anki backend.
+        Cf. from_collection for the arguments."""
+        columns = reader.read_columns(note_type_name, [group_field])
+        index = cls(group_separator)
+        for nid, group_field_content in zip(columns.ids, columns[group_field]):
+            index.add(nid, parse_group_ids(group_field_content, group_separator))
+        return index
+
+    def add(self, nid: int, group_ids: list[int]) -> None:
+        for group_id in group_ids:
+            if nid not in self.group_to_nids[group_id]:
+                self.group_to_nids[group_id].append(nid)
+            if group_id not in self.nid_to_groups[nid]:
+                self.nid_to_groups[nid].append(group_id)
+
+    def group_ids(self) -> list[int]:
+        return sorted(self.group_to_nids)
+
+    def get_notes(self, group_id: int) -> list[int]:
+        return self.group_to_nids.get(group_id, [])
+
+    def get_groups(self, nid: int) -> list[int]:
+        return self.nid_to_groups.get(nid, [])
+
+    @property
+    def last_id(self) -> int:
+        return max(self.group_to_nids, default=0)
@@ -0,0 +1,168 @@
+import sqlite3
+from json import load
+from typing import Iterable, Optional
+
+# A note of a group, as in the groups JSON files: {"id": note ID, "text": main signification}
+NoteInfo = dict
+
+_SCHEMA = """
+create table if not exists groups (id integer primary key);
+create table if not exists notes (nid integer primary key, text text not null);
+create table if not exists members (
+    group_id integer not null references groups (id) on delete cascade,
+    nid integer not null,
+    position integer not null,
+    primary key (group_id, nid)
+) without rowid;
+create index if not exists members_nid on members (nid, group_id);
+"""
+
+
+class GroupStore:
+    """The groups (synonyms, cognats...) and their notes, in a SQLite file.
+
+    The groups are updated in place, group by group, instead of dumping all of
+    them in a new JSON file at each run. The text of each note is stored once,
+    and the notes of a group and the groups of a note are both indexed lookups.
+
+    The changes are written in a transaction, made permanent by commit() (or at
+    the end of a `with` block without error).
+    """
+
+    def __init__(self, store_path: str):
+        """
+        Args:
+            store_path (str): The SQLite file, created if it doesn't exist
+        """
+        self.store_path = store_path
+        self.db = sqlite3.connect(store_path)
+        self.db.execute("pragma foreign_keys = on")
+        self.db.executescript(_SCHEMA)
+
+    def __enter__(self) -> "GroupStore":
+        return self
+
+    def __exit__(self, exc_type, *exc) -> None:
+        if exc_type is None:
+            self.commit()
+        else:
+            self.rollback()
+        self.close()
+
+    def commit(self) -> None:
+        self.db.commit()
+
+    def rollback(self) -> None:
+        self.db.rollback()
+
+    def close(self) -> None:
+        self.db.close()
+
+    def __len__(self) -> int:
+        return self.db.execute("select count(*) from groups").fetchone()[0]
+
+    def __contains__(self, group_id: int) -> bool:
+        return self.db.execute("select 1 from groups where id = ?", (int(group_id),)).fetchone() is not None
+
+    @property
+    def last_id(self) -> int:
+        return self.db.execute("select coalesce(max(id), 0) from groups").fetchone()[0]
+
+    def group_ids(self) -> list[int]:
+        return [group_id for (group_id,) in self.db.execute("select id from groups order by id")]
+
+    def get_notes(self, group_id: int) -> list[int]:
+        """The IDs of the notes of the group, in the order they were added."""
+        rows = self.db.execute(
+            "select nid from members where group_id = ? order by position", (int(group_id),)
+        )
+        return [nid for (nid,) in rows]
+
+    def get_group(self, group_id: int) -> list[NoteInfo]:
+        rows = self.db.execute(
+            "select members.nid, notes.text from members join notes using (nid)"
+            " where group_id = ? order by position",
+            (int(group_id),),
+        )
+        return [{"id": nid, "text": text} for nid, text in rows]
+
+    def get_groups(self, nid: int) -> list[int]:
+        rows = self.db.execute("select group_id from members where nid = ? order by group_id", (nid,))
+        return [group_id for (group_id,) in rows]
+
+    def get_text(self, nid: int) -> Optional[str]:
+        row = self.db.execute("select text from notes where nid = ?", (nid,)).fetchone()
+        return None if row is None else row[0]
+
+    def set_group(self, group_id: int, notes: Iterable[NoteInfo]) -> None:
+        """Create the group, or replace its notes if it exists."""
+        group_id = int(group_id)
+        self.db.execute("insert or ignore into groups (id) values (?)", (group_id,))
+        removed = self.get_notes(group_id)
+        self.db.execute("delete from members where group_id = ?", (group_id,))
+        self.add_notes(group_id, notes)
+        self._remove_orphan_notes(removed)
+
+    def add_notes(self, group_id: int, notes: Iterable[NoteInfo]) -> None:
+        """Add notes at the end of a group, creating the group if needed.
+        The notes already in the group are only updated."""
+        group_id = int(group_id)
+        notes = list(notes)
+        self.db.execute("insert or ignore into groups (id) values (?)", (group_id,))
+        self.db.executemany(
+            "insert into notes (nid, text) values (?, ?) on conflict (nid) do update set text = excluded.text",
+            [(note["id"], note["text"]) for note in notes],
+        )
+        (position,) = self.db.execute(
+            "select coalesce(max(position), -1) from members where group_id = ?", (group_id,)
+        ).fetchone()
+        self.db.executemany(
+            "insert or ignore into members (group_id, nid, position) values (?, ?, ?)",
+            [(group_id, note["id"], position + 1 + i) for i, note in enumerate(notes)],
+        )
+
+    def remove_notes(self, group_id: int, notesID: Iterable[int]) -> None:
+        """Remove notes from a group. The group is kept, even if it becomes empty."""
+        notesID = list(notesID)
+        self.db.executemany(
+            "delete from members where group_id = ? and nid = ?", [(int(group_id), nid) for nid in notesID]
+        )
+        self._remove_orphan_notes(notesID)
+
+    def remove_group(self, group_id: int) -> None:
+        notesID = self.get_notes(group_id)
+        self.db.execute("delete from groups where id = ?", (int(group_id),))  # And its members
+        self._remove_orphan_notes(notesID)
+
+    def _remove_orphan_notes(self, notesID: list[int]) -> None:
+        self.db.executemany(
+            "delete from notes where nid = ? and not exists (select 1 from members where members.nid = notes.nid)",
+            [(nid,) for nid in notesID],
+        )
+
+    def import_groups(self, groups: dict[str, list[NoteInfo]]) -> set[int]:
+        """Add the groups of a groups JSON file ({group ID: [{"id", "text"}]}).
+
+        Returns:
+            set[int]: The IDs of the notes of the imported groups
+        """
+        notesID = set()
+        for group_id, notes in groups.items():
+            self.set_group(int(group_id), notes)
+            notesID.update(note["id"] for note in notes)
+        return notesID
+
+    def import_json(self, json_path: str) -> set[int]:
+        with open(json_path, "rb") as f:
+            return self.import_groups(load(f))
+
+    def to_dict(self) -> dict[str, list[NoteInfo]]:
+        """All the groups, as in the groups JSON files."""
+        groups = {str(group_id): [] for group_id in self.group_ids()}
+        rows = self.db.execute(
+            "select group_id, members.nid, notes.text from members join notes using (nid)"
+            " order by group_id, position"
+        )
+        for group_id, nid, text in rows:
+            groups[str(group_id)].append({"id": nid, "text": text})
+        return groups
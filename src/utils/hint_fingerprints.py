@@ -0,0 +1,131 @@
+import os
+import re
+from dataclasses import asdict
+from json import dump, load
+from os import path
+from typing import Callable, Iterable, Mapping, Optional
+
+from src.utils.group_hints import HintSettings
+from src.utils.group_index import GroupIndex
+from src.utils.utils import text_hash
+
+
+def settings_fingerprint(settings: HintSettings) -> str:
+    """Hash of the settings of the hints. The functions are identified by their name."""
+    values = {
+        key: getattr(value, "__qualname__", repr(value)) if callable(value) else value
+        for key, value in asdict(settings).items()
+    }
+    return text_hash(repr(sorted(values.items())))
+
+
+def get_input_field_indices(settings: HintSettings) -> list[int]:
+    """The indices of the fields the hints are computed from."""
+    if settings.cloze_field_index is not None:
+        return [settings.cloze_field_index]
+    names = set(settings.flds_in_hint) | {settings.sorting_field, settings.additional_hint_field}
+    return [i for i, name in enumerate(settings.field_names) if name in names]
+
+
+def group_fingerprint(
+    settings_hash: str,
+    notes: Iterable[tuple[int, list[str]]],
+    field_indices: list[int],
+    note_groups: Optional[Mapping[int, list[int]]] = None,
+) -> str:
+    """Hash of everything the hints of a group depend on: the settings, the notes of
+    the group, the content of their input fields and the groups of each note (the hint
+    of a note is made of the hints of all its groups).
+
+    Args:
+        settings_hash (str): The fingerprint of the settings (cf. settings_fingerprint)
+        notes (Iterable[tuple[int, list[str]]]): The ID and the fields of each note of the group
+        field_indices (list[int]): The indices of the input fields
+        note_groups (Optional[Mapping[int, list[int]]]): The groups of each note
+    """
+    parts = [settings_hash]
+    for nid, fields in sorted(notes):
+        parts.append(str(nid))
+        parts += [fields[i] for i in field_indices]
+        if note_groups is not None:
+            parts.append(",".join(str(group_id) for group_id in sorted(note_groups.get(nid, ()))))
+    return text_hash("\x1f".join(parts))
+
+
+class HintFingerprints:
+    """Fingerprints of the groups whose hints were saved, and the groups of each
+    note at that time, kept in a JSON file next to the collection, to only regenerate
+    the hints of the groups that changed."""
+
+    def __init__(self, fingerprints_path: str):
+        self.fingerprints_path = fingerprints_path
+        self.fingerprints: dict[str, str] = {}
+        self.memberships: dict[str, list[int]] = {}
+        if path.exists(fingerprints_path):
+            with open(fingerprints_path, "r", encoding="utf-8") as f:
+                saved = load(f)
+            if "groups" in saved:
+                self.fingerprints = saved["groups"]
+                self.memberships = saved["memberships"]
+            else:
+                # Saved without the memberships: all the fingerprints differ anyway
+                self.fingerprints = saved
+
+    @classmethod
+    def for_hints(cls, col_path: str, note_type_name: str, hint_field: str) -> "HintFingerprints":
+        names = "_".join(re.sub(r"\W+", "_", name) for name in (note_type_name, hint_field))
+        return cls(f"{path.splitext(col_path)[0]}_{names}_hints.json")
+
+    def get_changed_groups(
+        self,
+        group_index: GroupIndex,
+        get_fingerprint: Callable[[int], str],
+    ) -> tuple[list[int], dict[str, str]]:
+        """Find the groups to regenerate.
+
+        A group is regenerated if its fingerprint changed, if one of its notes joined
+        or left a group since the saved run (so that a note removed from a group or
+        from a deleted group doesn't keep its old hint), or if it shares a note with
+        a regenerated group: the hint of a note is made of the hints of all its groups.
+
+        Args:
+            group_index (GroupIndex): The groups of the notes
+            get_fingerprint (Callable[[int], str]): The current fingerprint of a group
+
+        Returns:
+            list[int]: The IDs of the groups to regenerate, sorted
+            dict[str, str]: The current fingerprints of all the groups, to save once
+            the hints are saved
+        """
+        current = {str(group_id): get_fingerprint(group_id) for group_id in group_index.group_ids()}
+        to_visit = [
+            int(group_id) for group_id, fingerprint in current.items()
+            if self.fingerprints.get(group_id) != fingerprint
+        ]
+        changed = set(to_visit)
+        notesID = set(group_index.nid_to_groups) | {int(nid) for nid in self.memberships}
+        for nid in notesID:
+            groups = group_index.get_groups(nid)
+            if sorted(self.memberships.get(str(nid), [])) != sorted(groups):
+                new_groups = [group_id for group_id in groups if group_id not in changed]
+                changed.update(new_groups)
+                to_visit += new_groups
+        while to_visit:
+            group_id = to_visit.pop()
+            for nid in group_index.get_notes(group_id):
+                for other_group_id in group_index.get_groups(nid):
+                    if other_group_id not in changed:
+                        changed.add(other_group_id)
+                        to_visit.append(other_group_id)
+        return sorted(changed), current
+
+    def save(self, fingerprints: dict[str, str], group_index: GroupIndex) -> None:
+        """Save the fingerprints of the groups and the current groups of each note."""
+        self.fingerprints = fingerprints
+        self.memberships = {
+            str(nid): group_index.get_groups(nid) for nid in group_index.nid_to_groups if group_index.get_groups(nid)
+        }
+        tmp_path = f"{self.fingerprints_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            dump({"groups": self.fingerprints, "memberships": self.memberships}, f)
+        os.replace(tmp_path, self.fingerprints_path)
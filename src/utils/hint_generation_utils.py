@@ -1,18 +1,27 @@
 # from datetime import datetime
-from typing import Callable, Optional
+from typing import Callable, Iterable, Optional
 import re
 from anki.collection import Collection
 from anki.models import ModelManager, NotetypeDict
-from bs4 import BeautifulSoup
+from anki.notes import Note
 from loguru import logger
 
+from src.utils import instrumentation
 from src.utils.field_utils import (NoteFieldsUtils,
                                    #extract_cloze_deletion,
                 #    get_field_index, print_note_content, 
                    proceed, 
                 #    get_cloze_data, get_cleaned_field_data,
-                   breaklines_by_number)
-from src.utils.note_utils import find_notes
+                   )
+from src.utils.group_hints import (HintSettings, JoinedHint, compute_groups_hints_in_pool,
+                                   default_int_sorting_key, default_text_sorting_key,
+                                   first_char, get_sorting_key, sort_hint_lines)
+from src.utils.group_index import GroupIndex
+from src.utils.hint_fingerprints import (HintFingerprints, get_input_field_indices,
+                                         group_fingerprint, settings_fingerprint)
+from src.utils.html_utils import html_to_text
+from src.utils.note_cache import DEFAULT_CHUNK_SIZE, get_note_cache
+from src.utils.note_utils import find_notes, get_notes_model
 from src.utils.utils import CLOZE_TYPE
 
 # TODO: use dataclass for all classes
@@ -67,6 +76,8 @@ class HintGenerator:
         self.cloze_field = cloze_field # TODO: get cloze_field_index here once and for all?
         self.group_separator = group_separator
         self.note_hints_sorted = []
+        self.joined_hint = JoinedHint([])
+        self.note_positions = []  # Line of the hint of each note, in the order of notesID
         self.query_field = query_field
         self.replace = replace
         self.break_lines = break_lines
@@ -74,6 +85,7 @@ class HintGenerator:
         self.verbose = verbose
         # TODO: instance it out of run? Then needs note_type_name at class instance
         self.note_field_utils = NoteFieldsUtils(self.col,note_type_name)
+        self.note_cache = get_note_cache(self.col)
 
         # XXX: Create new field, but only do it if sure ? or not critical, can always be deleted manually ?
         # if self.hint_holding_field not in [el["name"] for el in self.note_type["flds"]]:
@@ -81,19 +93,26 @@ class HintGenerator:
 
         
     def default_text_sorting_key(self,row):
-        return row[1].lower()
+        return default_text_sorting_key(row)
     
     def default_int_sorting_key(self,row):
-        return int(row[1])
+        return default_int_sorting_key(row)
                 
+    @instrumentation.traced
     def run(
         self,
         query: str,
+        notesID: Optional[list[int]] = None,
+        chunk_size: Optional[int] = DEFAULT_CHUNK_SIZE,
     ) -> None:
         """Main method to generate hints for several notes using their information.
 
         Args:
             query (str): The query to find the notes to update
+            notesID (Optional[list[int]]): The IDs of the notes to update if they are
+            already known (ex: from a GroupIndex). Then the query is not run.
+            chunk_size (Optional[int]): The number of notes saved at once, the notes
+            being modified lazily. If None, all the notes are saved at the end.
             flds_in_hint (list[str]): The fields from where to extract the hint info.
             Ex: ["c2","c1"] if the notes are Cloze notes
             hint_field (str): The field where the hint will be stored in
@@ -109,28 +128,43 @@ class HintGenerator:
             ValueError: If there is only 0 or 1 note found with the query
         """
         
-        hint = self.generate_clean_hint(query)
-        notes = []
-        for nid in self.notesID:
-            # TODO: check if ok
-            note = self.col.get_note(nid)
-            note[self.hint_holding_field] = hint if self.replace else note[self.hint_holding_field] + hint
-            notes.append(note)
+        hint = self.generate_clean_hint(query, notesID)
 
-        logger.info("Confirm the hint generation and save notes ? (Y/n)")
-        if self.override_confirm or input() == "y":
-            self.col.update_notes(notes)
-            logger.success("New note hints saved in the collection!")
+        def notes():
+            for note in self.note_cache.iter_notes(self.notesID):
+                # TODO: check if ok
+                note[self.hint_holding_field] = hint if self.replace else note[self.hint_holding_field] + hint
+                yield note
 
+        self.save_notes(notes(), chunk_size)
         self.col.close()
 
-    def generate_clean_hint(self, query):
+    def confirm_save(self) -> bool:
+        if self.override_confirm:
+            return True
+        logger.info("Confirm the hint generation and save notes ? (Y/n)")
+        return input() == "y"
+
+    def save_notes(self, notes: Iterable[Note], chunk_size: Optional[int]) -> None:
+        """Save the notes yielded lazily by chunks, after the confirmation of the user."""
+        saved = self.note_cache.update_notes_by_chunks(
+            notes, chunk_size, total=len(self.notesID), confirm=self.confirm_save
+        )
+        if saved:
+            logger.success("New note hints saved in the collection!")
+
+    @instrumentation.traced
+    def generate_clean_hint(self, query, notesID=None):
         # TODO: see what to return bw note_hints_sorted and hint? if HintGen, only need hint because identical
         # If HintAdaptor, need note_hints_sorted bc need to adapt to each note afterwards
         
-        self.notesID, self.original_model = find_notes(
-            self.col, query, self.note_type_name, verbose=self.verbose, cloze_text_field=self.cloze_field,override_confirmation=self.override_confirm
-        )
+        if notesID is None:
+            self.notesID, self.original_model = find_notes(
+                self.col, query, self.note_type_name, verbose=self.verbose, cloze_text_field=self.cloze_field,override_confirmation=self.override_confirm
+            )
+        else:
+            self.notesID = list(notesID)
+            self.original_model = get_notes_model(self.col, self.notesID)
 
         if len(self.notesID) < 2:
             raise ValueError(
@@ -138,25 +172,20 @@ class HintGenerator:
             )
 
         self.cloze_field_index = (
-            self.note_field_utils.get_field_index(self.original_model, self.cloze_field)
+            self.note_field_utils.get_field_index(self.cloze_field)
             if self.original_model["type"] == CLOZE_TYPE
             else None
         )
 
         note_hints = self.get_raw_global_hint()
 
-        # If the first hint info is numeric, then sort as int
-        # (not int as strings, otherwise "10"<"6")
-        if self.sorting_key is None:
-            try:
-                [int(el[1]) for el in note_hints]
-                self.sorting_key = self.default_int_sorting_key
-            except ValueError:
-                self.sorting_key = self.default_text_sorting_key
+        # If all the hint infos are numeric, then sort as int
+        # (not int as strings, otherwise "10"<"6"). Chosen for each group, as in the pool
+        sorting_key = self.sorting_key or get_sorting_key(note_hints)
 
         try:
             self.clean_hint(
-                note_hints
+                note_hints, sorting_key
             )
             hint = self.get_full_string_hint_from_list()
         except Exception as e:
@@ -170,6 +199,7 @@ class HintGenerator:
         return hint
     
 
+    @instrumentation.traced
     def get_raw_global_hint(self
     ) -> list[tuple[str, str]]:
         """Generate the global hint that uses information from several notes.
@@ -190,8 +220,7 @@ class HintGenerator:
         """
         note_hints = []
         c_err = 0
-        for nid in self.notesID:
-            note = self.col.get_note(nid)
+        for note in self.note_cache.get_notes(self.notesID):
 
             # TODO: check if all notes have the same type? try if it's already checked.
             # Otherwise, do I need to check note type each time, not above for loop?
@@ -199,13 +228,13 @@ class HintGenerator:
             if note._note_type["type"] == CLOZE_TYPE:
                 content = self.note_field_utils.get_cloze_data(self.flds_in_hint, 
                                          self.cloze_field_index, self.separator, 
-                                         self.sorting_field, c_err, note)
+                                         c_err, note)
                 sorting_info = self.note_field_utils.extract_cloze_deletion(
                     self.cloze_field_index, note, self.sorting_field
                 )
             else:
                 content = self.note_field_utils.get_cleaned_field_data(self.separator, note, self.flds_in_hint)  
-                sorting_info = BeautifulSoup(note[self.sorting_field], "html.parser").text
+                sorting_info = html_to_text(note[self.sorting_field])
                 
             content = content[:len(content)-len(self.separator)] # remove last separator that is useless
             note_hints.append((content, sorting_info))
@@ -217,12 +246,12 @@ class HintGenerator:
         return note_hints
 
     def get_full_string_hint_from_list(self)->str:
-        hint = "<br>".join(self.note_hints_sorted)
-        return hint
+        return self.joined_hint.text
 
     def clean_hint(
         self,
         note_hints: list[tuple[str, str]],
+        sorting_key: Optional[Callable] = None,
     ) -> list[str]:
         """Clean the global hint by sorting and eventually adding break lines.
 
@@ -230,22 +259,20 @@ class HintGenerator:
             note_hints (list[tuple[str, str]]): The generated global hint to clean
             sorting_key (Optional[Callable]): The method to use to sort the hint
             (alphabetically, numerically). Ex: lambda row: int(row[1])
+            Defaults to self.sorting_key.
         Returns:
             list[str]: The cleaned hints
         """
-        note_hints_sorted = note_hints[:]
-        # note_hints_sorted.sort(key=sorting_key)
-        temp = sorted(zip(note_hints_sorted, self.notesID), key=lambda zipped_list: self.sorting_key(zipped_list[0]))
-        note_hints_sorted, self.notesID = zip(*temp)
-        
-        # Issue with sorting pinyin for now:f
-        # ex yunmi < yunan whereas it should be the opposite (yu<yun)
-        note_hints_sorted = [el[0] for el in note_hints_sorted]
-
+        # The text sorting key orders pinyin letter by letter (yunmi < yunan whereas yu < yun):
+        # use pinyin_collation.pinyin_sorting_key for pinyin
         # TODO: Specifics to have lines breaks between decades when the sorting field is Year
-        if self.break_lines:
-            note_hints_sorted = breaklines_by_number(note_hints_sorted)
+        order, note_hints_sorted, self.note_positions = sort_hint_lines(
+            note_hints, sorting_key or self.sorting_key, self.break_lines
+        )
+        self.notesID = [self.notesID[i] for i in order]
         self.note_hints_sorted = note_hints_sorted
+        # Joined once for the whole group, the adapted hints are then built with slices
+        self.joined_hint = JoinedHint(note_hints_sorted)
         return note_hints_sorted
     
     
@@ -258,12 +285,22 @@ class HintAdaptor(HintGenerator):
         super().__init__(*args, **kwargs)
         self.additional_hint_field = additional_hint_field
         self.additional_hint_func = additional_hint_func
+        # Notes edited but not saved yet, and notes already edited during the
+        # current run_all_groups session (and if the user declined a save in it)
+        self.pending_notes: dict[int, Note] = {}
+        self.session_notesID: Optional[set[int]] = None
+        self.session_declined = False
+
+    def get_group_query(self, group_id: int) -> str:
+        # query is something like "Synonyms group:re:(^|, )1(, |$)"
+        return f'"{self.query_field}:re:(^|{self.group_separator}){group_id}({self.group_separator}|$)"'
         
     def check_append_if_not_first_group(self, query, note):
         if not self.group_separator: # XXX: there's no group separator only for cognats ?
             return self.replace
 
         # query_field = query.split(":")[0].replace('"','')
+        instrumentation.count(instrumentation.REGEX_COMPILES)
         p = re.compile(r"(\d+)")
         m = p.search(query)
         if m:
@@ -280,21 +317,13 @@ class HintAdaptor(HintGenerator):
         return self.replace
 
     def get_adapted_string_hint_from_list(self, idx, hidding_char)->str:
-        hint = (
-            "<br>".join(self.note_hints_sorted[:idx])
-            + ("<br>" if idx != 0 else "")
-            + hidding_char
-            + ("<br>" if idx != len(self.note_hints_sorted) - 1 else "")
-            + "<br>".join(self.note_hints_sorted[idx + 1 :])
-        )
-        
-        return hint
+        return self.joined_hint.replace_line(idx, hidding_char)
         
     def adapt_hint_to_note (
         self,
         query: str, 
         nid: int,
-        cur_note_hint: str,
+        position: int,
     ) -> NotetypeDict:
         """Adapt the hint to a note by hiding the hint info of that note and update the note.
 
@@ -303,7 +332,8 @@ class HintAdaptor(HintGenerator):
             note_hints_sorted (list[str]): The cleaned global hint
             original_model (ModelManager): The type of the note
             nid (int): The ID of the note
-            cur_note_hint (str): The hint corresponding to the current note
+            position (int): The line of the hint corresponding to the current note
+            (cf. note_positions)
             hint_holding_field (str): The field that will be populated with the hint
             cloze_field (str): The field with the cloze text (only for
             logging purposes)
@@ -318,14 +348,14 @@ class HintAdaptor(HintGenerator):
         Returns:
             NotetypeDict: The updated note
         """
-        note = self.col.get_note(nid)
-        idx = self.note_hints_sorted.index(cur_note_hint)
+        if nid in self.pending_notes:
+            note = self.pending_notes[nid]
+        else:
+            note = self.note_cache.get(nid)
+        idx = position
         if self.additional_hint_field is None:
             hidding_char = "?"
         else:
-            if self.additional_hint_func is None:
-                self.additional_hint_func = lambda text: text[0]
-            
             if self.original_model["type"] == CLOZE_TYPE:
                 field_raw_text = self.note_field_utils.extract_cloze_deletion(self.cloze_field_index, note, self.additional_hint_field)
             else:
@@ -337,8 +367,9 @@ class HintAdaptor(HintGenerator):
                     )
                     raise e
                     
-            field_text = BeautifulSoup(field_raw_text, "html.parser").text
-            hidding_char = self.additional_hint_func(field_text)
+            field_text = html_to_text(field_raw_text)
+            additional_hint_func = self.additional_hint_func or first_char
+            hidding_char = additional_hint_func(field_text)
 
 
         hint = self.get_adapted_string_hint_from_list(idx, hidding_char)
@@ -351,7 +382,17 @@ class HintAdaptor(HintGenerator):
             for el in hint.split("<br>"):
                 print(el)
 
-        keep_user_replace_setting = self.check_append_if_not_first_group(query, note)
+        return self.set_note_hint(query, note, hint)
+
+    def set_note_hint(self, query: str, note: Note, hint: str) -> Note:
+        """Replace the hint of the note or append the hint to it"""
+        if self.session_notesID is None:
+            keep_user_replace_setting = self.check_append_if_not_first_group(query, note)
+        else:
+            # In a session over all the groups, the hint of the first group of the note
+            # follows the user setting and the hints of the next groups are appended
+            keep_user_replace_setting = self.replace and note.id not in self.session_notesID
+            self.session_notesID.add(note.id)
 
         if keep_user_replace_setting:
             note[self.hint_holding_field] = hint
@@ -361,14 +402,21 @@ class HintAdaptor(HintGenerator):
             note[self.hint_holding_field] += hint
         return note
 
+    @instrumentation.traced
     def run(
         self,
         query: str,
+        notesID: Optional[list[int]] = None,
+        chunk_size: Optional[int] = DEFAULT_CHUNK_SIZE,
     ) -> None:
         """Main method to generate hints for several notes using their information.
 
         Args:
             query (str): The query to find the notes to update
+            notesID (Optional[list[int]]): The IDs of the notes to update if they are
+            already known (ex: from a GroupIndex). Then the query is not run.
+            chunk_size (Optional[int]): The number of notes saved at once, the notes
+            being modified lazily. If None, all the notes are saved at the end.
             flds_in_hint (list[str]): The fields from where to extract the hint info.
             Ex: ["c2","c1"] if the notes are Cloze notes
             hint_field (str): The field where the hint will be stored in
@@ -386,21 +434,177 @@ class HintAdaptor(HintGenerator):
             self.col.reopen()
         except AssertionError:
             pass
-        hint = self.generate_clean_hint(query)
-
-        notes = []
-        for i,nid in enumerate(self.notesID):
-            note = self.adapt_hint_to_note(
-                query,
-                nid,
-                self.note_hints_sorted[i],
+        hint = self.generate_clean_hint(query, notesID)
+
+        notes = (
+            self.adapt_hint_to_note(query, nid, self.note_positions[i])
+            for i,nid in enumerate(self.notesID)
+        )
+        self.save_notes(notes, chunk_size)
+        self.col.close()
+
+    @instrumentation.traced
+    def run_all_groups(
+        self,
+        group_index: GroupIndex,
+        chunk_size: Optional[int] = None,
+        n_process: int = 1,
+        incremental: bool = False,
+    ) -> None:
+        """Generate the hints of all the groups in one collection session.
+
+        The collection is opened once, and the modified notes are saved with
+        one batched write at the end, or every chunk_size notes.
+
+        Args:
+            group_index (GroupIndex): The groups of the notes
+            chunk_size (Optional[int]): The number of modified notes after which
+            they are saved. If None, all the notes are saved at the end.
+            n_process (int, optional): The number of processes computing the hints.
+            If more than 1, the fields of the notes are read once and the hints are
+            computed in a pool of processes, while this process saves the results.
+            Defaults to 1.
+            incremental (bool, optional): To only regenerate the groups whose notes or
+            input fields changed since the last incremental run (cf. HintFingerprints).
+            It is meant to be used with replace=True. Defaults to False.
+        """
+        try:
+            self.col.reopen()
+        except AssertionError:
+            pass
+        self.pending_notes = {}
+        self.session_notesID = set()
+        self.session_declined = False
+        confirmed = self.override_confirm
+
+        if incremental:
+            if not self.replace:
+                logger.warning("The hints of the changed groups will be appended to the previous ones.")
+            fingerprints = HintFingerprints.for_hints(self.col.path, self.note_type_name, self.hint_holding_field)
+            group_ids, current_fingerprints = self.get_changed_groups(group_index, fingerprints)
+            logger.info(
+                f"{len(group_ids)} groups out of {len(group_index.group_to_nids)} "
+                "changed since the last run."
             )
-            notes.append(note)
+        else:
+            group_ids = group_index.group_ids()
 
-        if not self.override_confirm:
-            logger.info("Confirm the hint generation and save notes ? (Y/n)")
-        if self.override_confirm or input() == "y":
-            self.col.update_notes(notes)
-            logger.success("New note hints saved in the collection!")
+        if n_process > 1:
+            confirmed = self.run_all_groups_in_pool(group_index, group_ids, chunk_size, n_process, confirmed)
+            group_ids = []
 
-        self.col.close()
\ No newline at end of file
+        for group_id in group_ids:
+            query = self.get_group_query(group_id)
+            try:
+                self.generate_clean_hint(query, group_index.get_notes(group_id))
+            except ValueError as e:
+                logger.warning(f"{query} {e}")
+                continue
+
+            for i,nid in enumerate(self.notesID):
+                self.pending_notes[nid] = self.adapt_hint_to_note(
+                    query,
+                    nid,
+                    self.note_positions[i],
+                )
+
+            if chunk_size is not None and len(self.pending_notes) >= chunk_size:
+                confirmed = self.save_pending_notes(confirmed)
+
+        confirmed = self.save_pending_notes(confirmed)
+        if incremental and confirmed and not self.session_declined:
+            fingerprints.save(current_fingerprints, group_index)
+        self.session_notesID = None
+        self.col.close()
+
+    def get_changed_groups(
+        self, group_index: GroupIndex, fingerprints: HintFingerprints
+    ) -> tuple[list[int], dict[str, str]]:
+        """The groups to regenerate and the current fingerprints of all the groups."""
+        settings = self.get_hint_settings()
+        settings_hash = settings_fingerprint(settings)
+        field_indices = get_input_field_indices(settings)
+        self.note_cache.load(group_index.nid_to_groups)
+        return fingerprints.get_changed_groups(
+            group_index,
+            lambda group_id: group_fingerprint(
+                settings_hash,
+                [(nid, self.note_cache.get_fields(nid)) for nid in group_index.get_notes(group_id)],
+                field_indices,
+                group_index.nid_to_groups,
+            ),
+        )
+
+    def get_hint_settings(self) -> HintSettings:
+        note_type = self.note_field_utils.note_type
+        return HintSettings(
+            field_names=[fld["name"] for fld in note_type["flds"]],
+            flds_in_hint=self.flds_in_hint,
+            separator=self.separator,
+            sorting_field=self.sorting_field,
+            sorting_key=self.sorting_key,
+            additional_hint_field=self.additional_hint_field,
+            additional_hint_func=self.additional_hint_func,
+            break_lines=self.break_lines,
+            cloze_field_index=(
+                self.note_field_utils.get_field_index(self.cloze_field)
+                if note_type["type"] == CLOZE_TYPE
+                else None
+            ),
+        )
+
+    @instrumentation.traced
+    def run_all_groups_in_pool(
+        self,
+        group_index: GroupIndex,
+        group_ids: list[int],
+        chunk_size: Optional[int],
+        n_process: int,
+        confirmed: bool,
+    ) -> bool:
+        """Compute the hints of the groups in a pool of processes. This process
+        is the only writer: it applies the hints to the notes and saves them by chunks.
+        Returns if the user confirmed the save."""
+        self.note_cache.load(group_index.nid_to_groups)
+        tasks = []
+        for group_id in group_ids:
+            notesID = group_index.get_notes(group_id)
+            if len(notesID) < 2:
+                logger.warning(
+                    f"{self.get_group_query(group_id)} There is only one note. "
+                    "You can't generate hints based on several notes."
+                )
+                continue
+            tasks.append((group_id, [(nid, self.note_cache.get_fields(nid)) for nid in notesID]))
+
+        for group_id, results in compute_groups_hints_in_pool(self.get_hint_settings(), tasks, n_process):
+            query = self.get_group_query(group_id)
+            if isinstance(results, str):
+                logger.warning(f"{query} {results}")
+                continue
+            for nid, hint in results:
+                note = self.pending_notes[nid] if nid in self.pending_notes else self.note_cache.get(nid)
+                self.pending_notes[nid] = self.set_note_hint(query, note, hint)
+
+            if chunk_size is not None and len(self.pending_notes) >= chunk_size:
+                confirmed = self.save_pending_notes(confirmed)
+        return confirmed
+
+    @instrumentation.traced
+    def save_pending_notes(self, confirmed: bool) -> bool:
+        """Save the notes edited in the session. Returns if the user confirmed."""
+        if not self.pending_notes:
+            return confirmed
+        if not confirmed:
+            logger.info("Confirm the hint generation and save notes ? (Y/n)")
+            confirmed = input() == "y"
+        if confirmed:
+            self.note_cache.update_notes(list(self.pending_notes.values()))
+            logger.success(f"{len(self.pending_notes)} note hints saved in the collection!")
+        elif self.session_notesID is not None:
+            # The hints of the declined notes are dropped: their next group
+            # must not be appended to them
+            self.session_notesID.difference_update(self.pending_notes)
+            self.session_declined = True
+        self.pending_notes = {}
+        return confirmed
\ No newline at end of file
@@ -0,0 +1,183 @@
+from functools import lru_cache
+from html.entities import html5
+from html.parser import HTMLParser
+from typing import NamedTuple, Optional
+
+from src.utils import instrumentation
+
+# Same rules as BeautifulSoup with the "html.parser" builder, so the texts are
+# identical to the ones extracted before from the BeautifulSoup trees
+VOID_ELEMENTS = {
+    "area", "base", "br", "col", "embed", "hr", "img", "input", "keygen", "link",
+    "menuitem", "meta", "param", "source", "track", "wbr", "basefont", "bgsound",
+    "command", "frame", "image", "isindex", "nextid", "spacer",
+}
+# The text of these tags is not part of the text of their parents
+STRING_CONTAINERS = {"rt", "rp", "style", "script", "template"}
+PRESERVE_WHITESPACE_TAGS = {"pre", "textarea"}
+ASCII_SPACES = set("\x20\x0a\x09\x0c\x0d")
+TEXT, CDATA, OTHER = "text", "cdata", "other"
+DEFAULT_TEXT_TYPES = frozenset((TEXT, CDATA))
+# Unknown entities are kept without their ";", like BeautifulSoup
+ENTITIES = {name[:-1]: char for name, char in html5.items() if name.endswith(";")}
+
+
+class _Element:
+    __slots__ = ("name", "lines", "text_types")
+
+    def __init__(self, name: Optional[str]):
+        self.name = name
+        # For the root, None is an empty element, replaced according to transform_newline
+        self.lines: list[Optional[str]] = []
+        self.text_types: set[str] = set()  # Types of the non blank strings
+
+    def has_text(self) -> bool:
+        if self.name in STRING_CONTAINERS:
+            return self.name in self.text_types
+        return bool(self.text_types & DEFAULT_TEXT_TYPES)
+
+
+class ParsedField(NamedTuple):
+    lines: tuple[Optional[str], ...]
+    text: str
+
+
+class FieldTextParser(HTMLParser):
+    """Streaming extraction of the text of an Anki field, without building a tree.
+
+    The lines are the same as extract_text on a BeautifulSoup tree: the stripped
+    strings, and a blank line for each <br> or element without text.
+    The text is the same as BeautifulSoup(field, "html.parser").text.
+    """
+
+    def __init__(self):
+        super().__init__(convert_charrefs=False)
+        self.stack = [_Element(None)]
+        self.current_data: list[str] = []
+        self.text_parts: list[str] = []
+        self.already_closed_empty_element: list[str] = []
+
+    def parse(self, html: str) -> ParsedField:
+        self.feed(html)
+        self.close()
+        self.end_data()
+        while len(self.stack) > 1:
+            self.pop_element()
+        return ParsedField(tuple(self.stack[0].lines), "".join(self.text_parts))
+
+    def end_data(self, string_type: Optional[str] = None) -> None:
+        if not self.current_data:
+            return
+        data = "".join(self.current_data)
+        self.current_data = []
+        if not any(el.name in PRESERVE_WHITESPACE_TAGS for el in self.stack):
+            if all(char in ASCII_SPACES for char in data):
+                data = "\n" if "\n" in data else " "
+
+        if string_type is None:
+            string_type = next(
+                (el.name for el in reversed(self.stack) if el.name in STRING_CONTAINERS),
+                TEXT,
+            )
+        if string_type in DEFAULT_TEXT_TYPES:
+            self.text_parts.append(data)
+        text = data.strip()
+        if text:
+            self.stack[-1].lines.append(text)
+            self.stack[-1].text_types.add(string_type)
+
+    def pop_element(self) -> None:
+        element = self.stack.pop()
+        parent = self.stack[-1]
+        if element.name == "br" or not element.has_text():
+            parent.lines.append(None if len(self.stack) == 1 else "\n")
+        else:
+            parent.lines.extend(element.lines)
+        parent.text_types.update(element.text_types)
+
+    def handle_starttag(self, tag, attrs, handle_empty_element=True):
+        self.end_data()
+        self.stack.append(_Element(tag))
+        if tag in VOID_ELEMENTS and handle_empty_element:
+            self.handle_endtag(tag, check_already_closed=False)
+            self.already_closed_empty_element.append(tag)
+
+    def handle_startendtag(self, tag, attrs):
+        self.handle_starttag(tag, attrs, handle_empty_element=False)
+        self.handle_endtag(tag)
+
+    def handle_endtag(self, tag, check_already_closed=True):
+        if check_already_closed and tag in self.already_closed_empty_element:
+            self.already_closed_empty_element.remove(tag)
+            return
+        self.end_data()
+        if not any(el.name == tag for el in self.stack[1:]):
+            return
+        while self.stack[-1].name != tag:
+            self.pop_element()
+        self.pop_element()
+
+    def handle_data(self, data):
+        self.current_data.append(data)
+
+    def handle_charref(self, name):
+        if name.startswith(("x", "X")):
+            codepoint = int(name.lstrip("xX"), 16)
+        else:
+            codepoint = int(name)
+        data = None
+        if codepoint < 256:
+            try:
+                data = bytearray([codepoint]).decode("windows-1252")
+            except UnicodeDecodeError:
+                pass
+        if not data:
+            try:
+                data = chr(codepoint)
+            except (ValueError, OverflowError):
+                pass
+        self.handle_data(data or "\N{REPLACEMENT CHARACTER}")
+
+    def handle_entityref(self, name):
+        self.handle_data(ENTITIES.get(name, f"&{name}"))
+
+    def _handle_special_string(self, data, string_type):
+        self.end_data()
+        self.handle_data(data)
+        self.end_data(string_type)
+
+    def handle_comment(self, data):
+        self._handle_special_string(data, OTHER)
+
+    def handle_decl(self, decl):
+        self._handle_special_string(decl[len("DOCTYPE "):], OTHER)
+
+    def unknown_decl(self, data):
+        if data.upper().startswith("CDATA["):
+            self._handle_special_string(data[len("CDATA["):], CDATA)
+        else:
+            self._handle_special_string(data, OTHER)
+
+    def handle_pi(self, data):
+        self._handle_special_string(data, OTHER)
+
+
+@lru_cache(maxsize=65536)
+def parse_field_html(html: str) -> ParsedField:
+    """Parse the HTML of a field once. The result is memoized by field content."""
+    instrumentation.count(instrumentation.HTML_PARSES)
+    return FieldTextParser().parse(html)
+
+
+def html_to_text(html: str) -> str:
+    """Same as BeautifulSoup(html, "html.parser").text"""
+    return parse_field_html(html).text
+
+
+def extract_field_lines(html: str, transform_newline: bool = False) -> list[str]:
+    """Same as extract_text(BeautifulSoup(html, "html.parser"), transform_newline):
+    the text lines of the field, with a blank line for <br> and empty elements."""
+    newline_replacement = " " if transform_newline else "\n"
+    return [
+        newline_replacement if line is None else line for line in parse_field_html(html).lines
+    ]
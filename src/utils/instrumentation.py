@@ -0,0 +1,178 @@
+import functools
+import os
+import time
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime
+from json import dump
+from os import path
+from typing import Callable, Iterator, Optional
+
+from loguru import logger
+
+# Set to "1" to log the reports, or to a directory to also save them there
+ENV_VAR = "ANKI_EDITING_PROFILE"
+
+# Names of the counters
+NOTES_LOADED = "notes_loaded"
+SQL_QUERIES = "sql_queries"
+HTML_PARSES = "html_parses"
+REGEX_COMPILES = "regex_compiles"
+ANN_QUERIES = "ann_queries"
+NOTES_WRITTEN = "notes_written"
+QUERY_CACHE_HITS = "query_cache_hits"
+QUERY_CACHE_MISSES = "query_cache_misses"
+
+
+class Span:
+    """Timing of a code section. The spans with the same name and the same
+    parent are merged, their calls and times are summed."""
+
+    __slots__ = ("name", "calls", "seconds", "children")
+
+    def __init__(self, name: str):
+        self.name = name
+        self.calls = 0
+        self.seconds = 0.0
+        self.children: dict[str, "Span"] = {}
+
+    def child(self, name: str) -> "Span":
+        if name not in self.children:
+            self.children[name] = Span(name)
+        return self.children[name]
+
+    @property
+    def self_seconds(self) -> float:
+        return max(self.seconds - sum(c.seconds for c in self.children.values()), 0.0)
+
+    def to_dict(self) -> dict:
+        return {
+            "name": self.name,
+            "calls": self.calls,
+            "seconds": self.seconds,
+            "self_seconds": self.self_seconds,
+            "children": [c.to_dict() for c in self.children.values()],
+        }
+
+    def folded_stacks(self, prefix: str = "") -> Iterator[str]:
+        """Lines of the collapsed stack format of flamegraph.pl and speedscope,
+        with the self time in microseconds."""
+        stack = f"{prefix};{self.name}" if prefix else self.name
+        yield f"{stack} {round(self.self_seconds * 1e6)}"
+        for c in self.children.values():
+            yield from c.folded_stacks(stack)
+
+
+class Profiler:
+    """Nested timing spans and counters of a run.
+
+    When the outermost span ends, the report of the run is logged (and saved if
+    report_dir is given) and the profiler is reset for the next run.
+    """
+
+    def __init__(self, enabled: bool = False, report_dir: Optional[str] = None):
+        self.enabled = enabled
+        self.report_dir = report_dir
+        self.last_report: Optional[dict] = None
+        self.reset()
+
+    def reset(self) -> None:
+        self.stack: list[Span] = []
+        self.root: Optional[Span] = None
+        self.counters: Counter = Counter()
+
+    @contextmanager
+    def span(self, name: str):
+        if not self.enabled:
+            yield
+            return
+        if self.stack:
+            current = self.stack[-1].child(name)
+        else:
+            current = self.root = Span(name)
+        self.stack.append(current)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            current.seconds += time.perf_counter() - start
+            current.calls += 1
+            self.stack.pop()
+            if not self.stack:
+                self.emit_report()
+
+    def count(self, counter: str, n: int = 1) -> None:
+        if self.enabled:
+            self.counters[counter] += n
+
+    def get_report(self) -> dict:
+        return {
+            "spans": self.root.to_dict() if self.root is not None else None,
+            "counters": dict(self.counters),
+        }
+
+    def emit_report(self) -> None:
+        report = self.get_report()
+        logger.info(
+            f"Profile of {self.root.name}: {self.root.seconds:.4f} sec, counters {report['counters']}"
+        )
+        if self.report_dir is not None:
+            os.makedirs(self.report_dir, exist_ok=True)
+            now = datetime.now().strftime("%Y%m%d-%H-%M-%S")
+            file_name = path.join(self.report_dir, f"{now}_{self.root.name}")
+            with open(f"{file_name}.json", "w", encoding="utf-8") as f:
+                dump(report, f, indent=2)
+            with open(f"{file_name}.folded", "w", encoding="utf-8") as f:
+                f.write("\n".join(self.root.folded_stacks()) + "\n")
+            logger.info(f"Profile saved in {file_name}.json and {file_name}.folded")
+        self.last_report = report
+        self.reset()
+
+
+def _profiler_from_env() -> Profiler:
+    value = os.environ.get(ENV_VAR, "")
+    if value in ("", "0"):
+        return Profiler()
+    return Profiler(enabled=True, report_dir=None if value == "1" else value)
+
+
+PROFILER = _profiler_from_env()
+
+
+def enable(report_dir: Optional[str] = None) -> None:
+    """Enable the profiling, in addition to the ANKI_EDITING_PROFILE environment variable."""
+    PROFILER.enabled = True
+    PROFILER.report_dir = report_dir
+
+
+def disable() -> None:
+    PROFILER.enabled = False
+    PROFILER.reset()
+
+
+def span(name: str):
+    """Time a code section: `with span("build_index"): ...`"""
+    return PROFILER.span(name)
+
+
+def count(counter: str, n: int = 1) -> None:
+    PROFILER.count(counter, n)
+
+
+def traced(f: Optional[Callable] = None, *, name: Optional[str] = None):
+    """Decorator timing each call of the function in a span, named after the
+    function by default. Can be used as @traced or @traced(name="...")."""
+
+    def decorator(f):
+        span_name = name or f.__qualname__
+
+        @functools.wraps(f)
+        def wrapper(*args, **kwargs):
+            if not PROFILER.enabled:
+                return f(*args, **kwargs)
+            with PROFILER.span(span_name):
+                return f(*args, **kwargs)
+
+        return wrapper
+
+    return decorator(f) if f is not None else decorator
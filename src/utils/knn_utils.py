@@ -0,0 +1,82 @@
+from typing import Sequence
+
+import numpy as np
+
+
+def normalize_rows(vectors: np.ndarray) -> np.ndarray:
+    """Divide each vector by its norm. Null vectors are kept as is."""
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[np.abs(norms) < 1e-8] = 1
+    return vectors / norms
+
+
+def top_k_similar(
+    word_vectors: np.ndarray,
+    queries: np.ndarray,
+    k: int,
+    block_size: int = 65536,
+) -> tuple[np.ndarray, np.ndarray]:
+    """Exact search of the k most similar vectors of a batch of queries.
+
+    The similarity is the dot product with the normalized query, so it is the cosine
+    similarity if the word vectors are already normalized (cf. normalize_rows).
+    The word vectors are read by blocks of block_size rows, with one matrix product
+    per block, so the memory stays bounded with large vector tables.
+
+    Args:
+        word_vectors (np.ndarray): The (n, dim) matrix of the vectors to search
+        queries (np.ndarray): The (m, dim) matrix of the query vectors, or one vector
+        k (int): The number of neighbours to return for each query
+        block_size (int, optional): The number of word vectors multiplied at once.
+        Defaults to 65536.
+
+    Returns:
+        np.ndarray: The (m, k) indices of the neighbours, most similar first
+        np.ndarray: The (m, k) similarities of the neighbours
+    """
+    word_vectors = np.asarray(word_vectors)  # No copy for arrays and memory-mapped arrays
+    # The computations keep the precision of the word vectors (float32 is faster)
+    dtype = word_vectors.dtype if np.issubdtype(word_vectors.dtype, np.floating) else np.float64
+    queries = normalize_rows(np.atleast_2d(np.asarray(queries, dtype=dtype)))
+    n_queries = queries.shape[0]
+    k = min(k, len(word_vectors))
+    if k <= 0:
+        return np.zeros((n_queries, 0), dtype=np.int64), np.zeros((n_queries, 0), dtype=dtype)
+
+    best_indices = np.zeros((n_queries, 0), dtype=np.int64)
+    best_similarities = np.zeros((n_queries, 0), dtype=dtype)
+    for start in range(0, len(word_vectors), block_size):
+        block = np.asarray(word_vectors[start : start + block_size], dtype=dtype)
+        similarities = queries @ block.T
+        block_k = min(k, block.shape[0])
+        indices = np.argpartition(-similarities, block_k - 1, axis=1)[:, :block_k]
+
+        best_similarities = np.concatenate(
+            [best_similarities, np.take_along_axis(similarities, indices, axis=1)], axis=1
+        )
+        best_indices = np.concatenate([best_indices, indices + start], axis=1)
+        if best_indices.shape[1] > k:
+            kept = np.argpartition(-best_similarities, k - 1, axis=1)[:, :k]
+            best_similarities = np.take_along_axis(best_similarities, kept, axis=1)
+            best_indices = np.take_along_axis(best_indices, kept, axis=1)
+
+    order = np.argsort(-best_similarities, axis=1, kind="stable")
+    return (
+        np.take_along_axis(best_indices, order, axis=1),
+        np.take_along_axis(best_similarities, order, axis=1),
+    )
+
+
+def get_batch_nn(
+    word_vectors: np.ndarray,
+    queries: np.ndarray,
+    k: int,
+    word_list: Sequence[str],
+    block_size: int = 65536,
+) -> list[list[tuple[float, str]]]:
+    """Get the k nearest words of each query as (similarity, word), most similar first."""
+    indices, similarities = top_k_similar(word_vectors, queries, k, block_size)
+    return [
+        [(similarity, word_list[i]) for i, similarity in zip(row_indices, row_similarities)]
+        for row_indices, row_similarities in zip(indices.tolist(), similarities.tolist())
+    ]
@@ -0,0 +1,194 @@
+from typing import Callable, Iterable, Iterator, Optional, Sequence
+from weakref import WeakKeyDictionary
+
+from anki import notes_pb2
+from anki.collection import Collection
+from anki.notes import Note
+from anki.utils import ids2str
+from loguru import logger
+
+from src.utils import instrumentation
+
+# Rows are kept as backend notes so that building a Note never goes through the
+# backend again (Note(col, id=nid) does one backend call per note)
+_NOTE_COLUMNS = "id, guid, mid, mod, usn, tags, flds"
+# Number of notes loaded or saved at once by the streaming methods
+DEFAULT_CHUNK_SIZE = 1000
+
+
+class NoteCache:
+    """Bulk-loading cache of the notes of a collection.
+
+    The notes are loaded by batches with a single SQL query instead of one
+    `col.get_note` call per note. Every call to `get` returns a fresh `Note` object,
+    so editing a note without saving it doesn't change the cached version.
+    Use `update_notes` to save notes: it invalidates the saved notes.
+
+    As for the query cache, the rows are valid as long as the modification time of
+    the collection doesn't change: any other change (col.update_note, a new field...)
+    empties the cache at the next access.
+    """
+
+    def __init__(self, col: Collection):
+        self.col = col
+        self._mod: Optional[int] = None
+        self._rows: dict[int, notes_pb2.Note] = {}
+
+    def __contains__(self, nid: int) -> bool:
+        return nid in self._rows
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    @instrumentation.traced(name="NoteCache.load")
+    def load(self, notesID: Iterable[int]) -> None:
+        """Load in one SQL query all the notes that are not cached yet.
+
+        Args:
+            notesID (Iterable[int]): The IDs of the notes to load
+        """
+        self._check_mod()
+        missing = {nid for nid in notesID if nid not in self._rows}
+        if not missing:
+            return
+        rows = self.col.db.all(
+            f"select {_NOTE_COLUMNS} from notes where id in {ids2str(missing)}"
+        )
+        instrumentation.count(instrumentation.SQL_QUERIES)
+        instrumentation.count(instrumentation.NOTES_LOADED, len(rows))
+        for nid, guid, mid, mod, usn, tags, flds in rows:
+            self._rows[nid] = notes_pb2.Note(
+                id=nid,
+                guid=guid,
+                notetype_id=mid,
+                mtime_secs=mod,
+                usn=usn,
+                tags=tags.split(),
+                fields=flds.split("\x1f"),
+            )
+
+    def _check_mod(self) -> None:
+        mod = self.col.mod
+        if mod != self._mod:
+            self._rows.clear()
+            self._mod = mod
+
+    def get(self, nid: int) -> Note:
+        self._check_mod()
+        if nid not in self._rows:
+            self.load([nid])
+        return self._new_note(nid)
+
+    def _new_note(self, nid: int) -> Note:
+        try:
+            row = self._rows[nid]
+        except KeyError:
+            raise KeyError(f"Note {nid} not found in the collection") from None
+        note = Note.__new__(Note)
+        note.col = self.col.weakref()
+        note._load_from_backend_note(row)
+        return note
+
+    def get_fields(self, nid: int) -> list[str]:
+        """Get the fields of a note without building a Note."""
+        self._check_mod()
+        if nid not in self._rows:
+            self.load([nid])
+        try:
+            return list(self._rows[nid].fields)
+        except KeyError:
+            raise KeyError(f"Note {nid} not found in the collection") from None
+
+    def get_notes(self, notesID: Sequence[int]) -> list[Note]:
+        """Get the notes in the same order as notesID, loading the missing ones
+        in a single query."""
+        self.load(notesID)
+        return [self._new_note(nid) for nid in notesID]
+
+    def iter_notes(
+        self, notesID: Sequence[int], chunk_size: Optional[int] = DEFAULT_CHUNK_SIZE
+    ) -> Iterator[Note]:
+        """Yield the notes in the same order as notesID, loading them by chunks
+        (all at once if chunk_size is None)."""
+        chunk_size = chunk_size or max(len(notesID), 1)
+        for start in range(0, len(notesID), chunk_size):
+            chunk = notesID[start : start + chunk_size]
+            self.load(chunk)
+            for nid in chunk:
+                yield self.get(nid)
+
+    def invalidate(self, notesID: Iterable[int] | None = None) -> None:
+        """Forget the given notes, or all the notes if notesID is None."""
+        if notesID is None:
+            self._rows.clear()
+            return
+        for nid in notesID:
+            self._rows.pop(nid, None)
+
+    def update_notes(self, notes: Sequence[Note]) -> None:
+        """Save the notes in the collection and invalidate them in the cache.
+        The other cached notes stay valid."""
+        self._check_mod()
+        self.col.update_notes(notes)
+        instrumentation.count(instrumentation.NOTES_WRITTEN, len(notes))
+        self.invalidate(note.id for note in notes)
+        self._mod = self.col.mod
+
+    def update_notes_by_chunks(
+        self,
+        notes: Iterable[Note],
+        chunk_size: Optional[int] = DEFAULT_CHUNK_SIZE,
+        total: Optional[int] = None,
+        confirm: Optional[Callable[[], bool]] = None,
+        on_saved: Optional[Callable[[list[Note]], None]] = None,
+    ) -> int:
+        """Save the notes of a generator by chunks, so that only one chunk of
+        modified notes is in memory at once.
+
+        Args:
+            notes (Iterable[Note]): The modified notes, ideally yielded lazily
+            chunk_size (Optional[int]): The number of notes saved at once. If None,
+            all the notes are saved at the end.
+            total (Optional[int]): The number of notes, for the progress logs
+            confirm (Optional[Callable[[], bool]]): Asked once before saving the first
+            chunk. If it returns False, nothing is saved and the notes are not consumed.
+            on_saved (Optional[Callable[[list[Note]], None]]): Called with each saved chunk
+
+        Returns:
+            int: The number of saved notes
+        """
+        saved = 0
+        chunk = []
+
+        def save_chunk() -> bool:
+            nonlocal saved, confirm
+            if confirm is not None:
+                if not confirm():
+                    return False
+                confirm = None
+            self.update_notes(chunk)
+            if on_saved is not None:
+                on_saved(chunk)
+            saved += len(chunk)
+            logger.info(f"{saved}{'' if total is None else f'/{total}'} notes saved.")
+            chunk.clear()
+            return True
+
+        for note in notes:
+            chunk.append(note)
+            if chunk_size is not None and len(chunk) >= chunk_size:
+                if not save_chunk():
+                    return saved
+        if chunk:
+            save_chunk()
+        return saved
+
+
+_CACHES: "WeakKeyDictionary[Collection, NoteCache]" = WeakKeyDictionary()
+
+
+def get_note_cache(col: Collection) -> NoteCache:
+    """Get the note cache shared by every stage working on the collection."""
+    if col not in _CACHES:
+        _CACHES[col] = NoteCache(col)
+    return _CACHES[col]
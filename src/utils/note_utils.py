@@ -1,15 +1,17 @@
 import re
-from typing import Optional
+from typing import Iterator, Optional
 import yaml
-import heapq
-import numpy as np
 
 from anki.collection import Collection
-from anki.errors import InvalidInput
 from anki.models import NotetypeDict
+from anki.notes import Note
 from loguru import logger
 
+from src.utils import instrumentation
+from src.utils.conversion_journal import ConversionJournal
 from src.utils.field_utils import (NoteFieldsUtils, proceed, truncate_field)
+from src.utils.note_cache import DEFAULT_CHUNK_SIZE, get_note_cache
+from src.utils.query_cache import get_query_cache
 from src.utils.utils import FIELD_WITH_ORIGINAL_CLOZE, CLOZE_TYPE
 
 class NoteConverter:
@@ -19,11 +21,12 @@ class NoteConverter:
                  new_fields: Optional[list[tuple[str, str]]] = None,
                  original_type_name: Optional[str] = "Cloze",
                  cloze_text_field: Optional[str] = "Text",
-
+                 col: Optional[Collection] = None,
                  ):
         self.config_path = config_path
-        self.COL_PATH = get_col_path(self.config_path)
-        self.col = Collection(self.COL_PATH)
+        # An open collection can be given instead of the config (ex: by the daemon)
+        self.COL_PATH = get_col_path(self.config_path) if col is None else col.path
+        self.col = Collection(self.COL_PATH) if col is None else col
         self.original_type_name = original_type_name
         self.new_type_name = new_note_name
         self.new_fields = new_fields
@@ -31,7 +34,8 @@ class NoteConverter:
             self.interactive_field_mapping()
         self.original_field_list = []
         self.cloze_text_field = cloze_text_field
-        self.note_field_utils = NoteFieldsUtils(self.col,new_note_name,new_fields+[cloze_text_field]) # FIXME: create a list of NoteFieldsUtils
+        # The note type is None until it is created by create_note_type
+        self.note_field_utils = NoteFieldsUtils(self.col,new_note_name)
         
     def interactive_field_mapping(self):
         """Interactive method to map the fields of the new note type from the cloze fields
@@ -57,9 +61,11 @@ class NoteConverter:
             
         self.new_fields = new_fields
         
+    @instrumentation.traced
     def run_cloze2Basic(
         self,
         query: str,
+        chunk_size: Optional[int] = DEFAULT_CHUNK_SIZE,
     ) -> None:
         """Main method to convert Anki notes from Cloze type to a Basic type
 
@@ -67,6 +73,8 @@ class NoteConverter:
             query (str): The query to search for the notes to convert.
                 It follows the search convention from Anki.
                 Ex, if you want to add regex search, use: 're:<pattern>'
+            chunk_size (Optional[int]): The number of notes saved at once, the notes
+            being filled lazily. If None, all the notes are saved at the end.
             new_type_name (str): The name of the new Basic note type
             new_fields (Optional[list[tuple]]): A list of the new fields to be added
             to the new note type.
@@ -77,14 +85,27 @@ class NoteConverter:
             Could be new_type_name if you are resuming a conversion. Defaults to "Cloze".
             cloze_text_field (str, optional): The name of the field holding the cloze text
             when the original type is a Cloze. Defaults to "Text".
+
+        The converted and filled notes are recorded by chunks in a journal next to the
+        collection. If the conversion is interrupted, running it again only converts
+        and fills the remaining notes.
         """
         col = self.col
-        notesID, original_model = find_notes(
-            col,
-            query=query,
-            note_type_name=self.original_type_name,
-            cloze_text_field=self.cloze_text_field,
+        journal = ConversionJournal.for_conversion(
+            self.COL_PATH, self.original_type_name, self.new_type_name
         )
+        try:
+            notesID, original_model = find_notes(
+                col,
+                query=query,
+                note_type_name=self.original_type_name,
+                cloze_text_field=self.cloze_text_field,
+            )
+        except ValueError:
+            if not journal.converting:
+                raise
+            # All the notes were converted by the interrupted run, only the filling is left
+            notesID, original_model = [], col.models.by_name(self.original_type_name)
         # TODO: save original model & new created model
         self.original_field_list = [fld["name"] for fld in original_model["flds"]]
 
@@ -100,8 +121,8 @@ class NoteConverter:
             # TODO: make it the user action to create the new type ?
             new_note_type = col.models.by_name(self.new_type_name)
             if new_note_type is None:
-                new_note_type = self.create_note_type(
-                )
+                new_note_type = self.create_note_type()
+                self.note_field_utils = NoteFieldsUtils(col,self.new_type_name)
 
             missing_fields = set(field[0] for field in self.new_fields) - set(
                 field["name"] for field in new_note_type["flds"]
@@ -111,27 +132,46 @@ class NoteConverter:
                     f"Creation of the field '{field}' which is not present in new note type"
                 )
                 self.note_field_utils.add_field(field)
-            col.models.save(new_note_type)
+            new_note_type = self.note_field_utils.note_type
 
-            self.change_note_type(original_model, new_note_type, notesID)
+            if notesID:
+                self.change_note_type(original_model, new_note_type, notesID, chunk_size, journal)
+            notes_to_fill = journal.get_unfilled(col, new_note_type["id"])
         else:
             new_note_type = original_model
+            notes_to_fill = [nid for nid in notesID if nid not in journal.filled]
+        if journal.filled:
+            logger.info(
+                f"Resuming the conversion: {len(journal.filled)} notes were already filled, "
+                f"{len(notes_to_fill)} notes left."
+            )
 
         edited_notes = self.copy_from_cloze2save_field(
-            notesID, new_note_type
+            notes_to_fill, new_note_type, chunk_size
         )
-        
-        logger.info("Confirm the mappings and save notes ? (Y/n)")
-        if input() == "y":
-            col.update_notes(edited_notes)
+
+        def confirm():
+            logger.info("Confirm the mappings and save notes ? (Y/n)")
+            return input() == "y"
+
+        def on_saved(notes):
+            col.save()  # Committed before being recorded as filled
+            journal.add_filled(note.id for note in notes)
+
+        saved = get_note_cache(col).update_notes_by_chunks(
+            edited_notes, chunk_size, total=len(notes_to_fill), confirm=confirm, on_saved=on_saved
+        )
+        if saved == len(notes_to_fill):
+            journal.remove()
             logger.success("New notes created and saved in the collection!")
         else:
             logger.warning(
                 "The note field extraction was not saved. But the notes were already"
-                " converted."
+                " converted. Run the same conversion again to fill them."
             )
         col.close()
 
+    @instrumentation.traced
     def create_note_type(
         self,
     ) -> NotetypeDict:
@@ -148,35 +188,38 @@ class NoteConverter:
         """
         # Create new note type
         models = self.col.models
-        new_note_type = models.new(self.note_name)
+        new_note_type = models.new(self.new_type_name)
 
         for i, field_info in enumerate(self.new_fields):
-            self.note_field_utils.add_field(field_info[0])
+            models.add_field(new_note_type, models.new_field(field_info[0]))
 
             if field_info[1] not in self.original_field_list:
                 # Add template
                 template = models.new_template(f"Answer: {field_info[0]}")
-
-                models.add_template(new_note_type, template)
-
-                new_note_type["tmpls"][i]["qfmt"] = "{{%s}}" % (
+                template["qfmt"] = "{{%s}}" % (
                     self.new_fields[(i + 1) % len(self.new_fields)][0]
                 )
-                new_note_type["tmpls"][i]["afmt"] = "{{%s}}" % (field_info[0])
+                template["afmt"] = "{{%s}}" % (field_info[0])
+                models.add_template(new_note_type, template)
 
-        models.save(new_note_type)
+        models.add(new_note_type)
+        new_note_type = models.by_name(self.new_type_name)
 
         return new_note_type
 
 
+    @instrumentation.traced
     def change_note_type(
         self,
         old_note_type: dict,
         new_note_type: dict,
         notesID: list[int],
+        chunk_size: Optional[int] = DEFAULT_CHUNK_SIZE,
+        journal: Optional[ConversionJournal] = None,
     ) -> None:
         """
-        Convert the note type of Anki flashcards.
+        Convert the note type of Anki flashcards, by chunks of notes that are
+        committed one by one.
 
         Args:
             col (Collection): The Anki collection object.
@@ -186,6 +229,10 @@ class NoteConverter:
             new_fields (list[tuple[str,str]]): The new fields to be added to
             the new note type. It is in the form (<new_field>,<old_field>).
             Ex: ("Album","c1") or ("Album","Albums")
+            chunk_size (Optional[int]): The number of notes converted at once.
+            If None, they are all converted at once.
+            journal (Optional[ConversionJournal]): Where to record the notes being
+            converted, to resume the conversion if it is interrupted.
 
         Raises:
         ValueError: If the number of new fields is less than 2.
@@ -221,6 +268,7 @@ class NoteConverter:
                     f"mapped from the field '{target_field_info[1]}'"
                 )
             except IndexError:  # When taking the index 0 of empty list
+                instrumentation.count(instrumentation.REGEX_COMPILES)
                 if re.compile(r"c\d").search(target_field_info[1]):
                     logger.info(
                         f"Target field {target_field_info[0]} will extract the "
@@ -244,7 +292,14 @@ class NoteConverter:
                 )
 
         proceed()
-        self.col.models.change(old_note_type, notesID, new_note_type, fmap, cmap=None)
+        chunk_size = chunk_size or max(len(notesID), 1)
+        for start in range(0, len(notesID), chunk_size):
+            chunk = notesID[start : start + chunk_size]
+            if journal is not None:
+                journal.add_converting(chunk)
+            self.col.models.change(old_note_type, chunk, new_note_type, fmap, cmap=None)
+            self.col.save()
+            logger.info(f"{start + len(chunk)}/{len(notesID)} notes converted.")
         # TODO: Is it possible not to do this?
         logger.warning(
             "The notes were converted even if the extraction is not validated. "
@@ -257,8 +312,10 @@ class NoteConverter:
         self,
         notesID: list[int],
         new_note_type: NotetypeDict,
-    ):
+        chunk_size: Optional[int] = DEFAULT_CHUNK_SIZE,
+    ) -> Iterator[Note]:
         """Copy the information from the cloze deletion to a new field.
+        The notes are loaded by chunks and yielded one by one, not saved.
 
         Args:
             col (Collection): The Anki Collection
@@ -269,6 +326,8 @@ class NoteConverter:
             original_field_list (list[str]): The fields of the previous note type
             cloze_text_field (str, optional): The name of the field with cloze text.
             Defaults to "Text".
+            chunk_size (Optional[int]): The number of notes loaded at once.
+            If None, they are all loaded at once.
         """
         
         if FIELD_WITH_ORIGINAL_CLOZE == self.new_fields[-1][0]:
@@ -276,10 +335,9 @@ class NoteConverter:
         else:
             field_to_extract_index = self.note_field_utils.get_field_index(self.cloze_text_field)
 
-        notes = []
-        for noteID in notesID:
-            note = self.col.get_note(noteID)
+        for note in get_note_cache(self.col).iter_notes(notesID, chunk_size):
             for i, (target_field, field_origin) in enumerate(
+                self.new_fields
             ):  # Could use last value to see if it's a regex / cloze extraction
                 if field_origin not in self.original_field_list:
                     try:
@@ -295,11 +353,10 @@ class NoteConverter:
             logger.info(
                 f"Final fields of the note: {[truncate_field(fld) for fld in note.fields]}"
             )
-            notes.append(note)
-            
-        return notes
+            yield note
 
 
+@instrumentation.traced
 def find_notes(
     col: Collection,
     query: str = "",
@@ -308,7 +365,8 @@ def find_notes(
     cloze_text_field: str = "Text",
     override_confirmation: bool = False,
 ) -> tuple[list[int], NotetypeDict | None]:
-    """Retrieves the notes according to a query.
+    """Retrieves the notes according to a query. The results are cached until
+    the collection is modified (cf. QueryCache).
 
     Args:
         col (Collection): The full Anki collection with all models and notes
@@ -327,25 +385,17 @@ def find_notes(
     """
 
     # Get the notes to edit
-    new_query = query + f' note:"{note_type_name}"'
-    notefields = NoteFieldsUtils(col, note_type_name)
-    try:
-        notesID = col.find_notes(new_query)
-    except InvalidInput as e:
-        col.reopen()
-        notesID = col.find_notes(new_query)
+    query_cache = get_query_cache(col)
+    notesID, original_model = query_cache.search(query, note_type_name)
 
     if len(notesID) == 0:
         raise ValueError("No notes found. Please review your query and cloze note type")
     else:
         if verbose>=1:
             logger.info(f"Number of notes found: {len(notesID)}")
-        original_modelID = col.models.get_single_notetype_of_notes(notesID)
-        original_model = col.models.get(original_modelID)
-        for note in notesID:
-            note_details = col.get_note(note)
-
-            if verbose>=2:
+        if verbose>=2:
+            notefields = query_cache.get_note_fields(note_type_name)
+            for note_details in get_note_cache(col).get_notes(notesID):
                 if original_model["type"] != CLOZE_TYPE:
                     logger.warning(
                         "The fields of the note of Basic type are not empty "
@@ -360,6 +410,15 @@ def find_notes(
             proceed()
     return list(notesID), original_model
 
+def get_notes_model(col: Collection, notesID: list[int]) -> NotetypeDict:
+    """Get the note type common to all the notes.
+
+    Raises:
+        InvalidInput: If the notes are not all of the same type
+    """
+    original_modelID = col.models.get_single_notetype_of_notes(notesID)
+    return col.models.get(original_modelID)
+
 def get_yaml_value(config_path,key):
     with open(config_path, 'rb') as file:
         config = yaml.safe_load(file)
@@ -373,29 +432,10 @@ def get_col_path(config_path):
     return COL_PATH
 
 
-def get_nn(word_vectors, query, k, word_list):
-    # Calculate the norm of the query vector
-    # Used fasttext C++ code converted
-    query_norm = np.linalg.norm(query)
-    if np.abs(query_norm) < 1e-8:
-        query_norm = 1
+def get_nn(word_vectors, query, k, word_list, block_size=65536):
+    """Get the k nearest words of the query as (similarity, word), most similar first.
+    The similarity is the dot product with the normalized query, as in the fasttext
+    C++ code. Cf. get_batch_nn to search the neighbours of several queries at once."""
+    from src.utils.knn_utils import get_batch_nn  # numpy is only imported when needed
 
-    heap = []
-    
-    for i, word in enumerate(word_list):
-        # Calculate the dot product
-        dp = np.dot(word_vectors[i], query)
-        similarity = dp / query_norm
-        
-        if len(heap) == k and similarity < heap[0][0]:
-            continue
-        
-        # Push to the heap
-        heapq.heappush(heap, (similarity, word))
-        if len(heap) > k:
-            heapq.heappop(heap)
-
-    # Sort the heap by similarity in descending order
-    heap.sort(reverse=True, key=lambda x: x[0])
-    
-    return heap
\ No newline at end of file
+    return get_batch_nn(word_vectors, query, k, word_list, block_size)[0]
@@ -0,0 +1,93 @@
+import re
+import unicodedata
+from functools import lru_cache
+
+# Combining tone marks of the NFD form of the toned vowels (ā á ǎ à)
+TONE_MARKS = {"̄": 1, "́": 2, "̌": 3, "̀": 4}
+NEUTRAL_TONE = 5
+_DIAERESIS = "̈"  # ü is written v in the keys, so that lu < lü
+
+_INITIALS = "zh|ch|sh|[bpmfdtnlgkhjqxrzcsyw]"
+# Longest first, so that the regex tries them in this order
+_FINALS = sorted(
+    """a ai an ang ao e ei en eng er i ia ian iang iao ie in ing iong iu o ong ou u ua uai
+    uan uang ue ui un uo v van ve vn""".split(),
+    key=len,
+    reverse=True,
+)
+# A final ending with n, g or r can't take the first letter of the next syllable:
+# in pinyin, a syllable starting with a vowel is preceded by an apostrophe (xi'an)
+_SYLLABLE = re.compile(
+    rf"(?:{_INITIALS})?(?:{'|'.join(_FINALS)})r?(?![aeiouv])|(?:{_INITIALS})?(?:{'|'.join(_FINALS)})"
+)
+_LETTERS = re.compile(r"[a-z]+")
+
+
+def _strip_tones(text: str) -> tuple[str, dict[int, int]]:
+    """Lowercase letters of the text without the tone marks, and the tone of each
+    marked letter by its index in these letters."""
+    letters = []
+    tones = {}
+    for char in unicodedata.normalize("NFD", text.lower()):
+        if char in TONE_MARKS:
+            if letters:
+                tones[len(letters) - 1] = TONE_MARKS[char]
+        elif char == _DIAERESIS or char == ":":  # ü or u:
+            if letters and letters[-1] == "u":
+                letters[-1] = "v"
+            elif char == ":":
+                letters.append(" ")
+        elif char.isascii() and (char.isalpha() or char.isdigit()):
+            letters.append(char)
+        else:
+            letters.append(" ")
+    return "".join(letters), tones
+
+
+def parse_pinyin(text: str) -> list[tuple[str, int]]:
+    """Split pinyin into syllables with their tone, from the tone marks (nǐ hǎo)
+    or the tone numbers (ni3 hao3). The syllables can be written without spaces.
+    The syllables without tone have the neutral tone 5.
+
+    Returns:
+        list[tuple[str, int]]: The syllables without tone (ü written v) and their tone
+    """
+    letters, tones = _strip_tones(text)
+    syllables = []
+    for word in re.finditer(r"[a-z0-9]+", letters):
+        position = word.start()
+        end = word.end()
+        while position < end:
+            if letters[position].isdigit():
+                position += 1  # A number that is not a tone
+                continue
+            match = _SYLLABLE.match(letters, position, end) or _LETTERS.match(letters, position, end)
+            toned = [i for i in range(position, match.end()) if i in tones]
+            if len(toned) > 1:
+                # A syllable has one tone mark: the second marked letter starts
+                # the next syllable (xīngqīèr)
+                match = _SYLLABLE.match(letters, position, toned[1]) or _LETTERS.match(letters, position, toned[1])
+            syllable_end = match.end()
+            tone = next((tones[i] for i in range(position, syllable_end) if i in tones), NEUTRAL_TONE)
+            if syllable_end < end and letters[syllable_end] in "12345":
+                tone = int(letters[syllable_end])
+                syllable_end += 1
+            syllables.append((match.group(), tone))
+            position = syllable_end
+    return syllables
+
+
+@lru_cache(maxsize=65536)
+def pinyin_collation_key(text: str) -> str:
+    """Compact key sorting pinyin syllable by syllable, then by tone for the same
+    syllable: "yu2 nan2" < "yun2 mi4" ("yu" < "yun"), "ma1" < "ma2" < "ma".
+
+    Each syllable is written with its tone number and followed by a space, which sorts
+    before the letters. The keys are cached by text, so each pinyin is parsed once.
+    """
+    return "".join(f"{syllable}{tone} " for syllable, tone in parse_pinyin(text))
+
+
+def pinyin_sorting_key(row: tuple[str, str]) -> str:
+    """Sorting key of the (hint, sorting info) rows whose sorting info is pinyin."""
+    return pinyin_collation_key(row[1])
@@ -0,0 +1,96 @@
+from typing import Optional
+from weakref import WeakKeyDictionary
+
+from anki.collection import Collection
+from anki.errors import InvalidInput
+from anki.models import NotetypeDict
+
+from src.utils import instrumentation
+from src.utils.field_utils import NoteFieldsUtils
+
+# (IDs of the notes found, their common note type or None if no note was found)
+QueryResult = tuple[tuple[int, ...], Optional[NotetypeDict]]
+
+
+class QueryCache:
+    """Cache of the note searches of a collection, and of the note types of
+    their results.
+
+    The results are valid as long as the modification time of the collection
+    doesn't change: Anki updates it with every change of a note or a note type,
+    so the whole cache is emptied at the first search after a change.
+    """
+
+    def __init__(self, col: Collection):
+        self.col = col
+        self._mod: Optional[int] = None
+        self._results: dict[tuple[str, str], QueryResult] = {}
+        self._note_fields: dict[str, NoteFieldsUtils] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._results)
+
+    def _check_mod(self) -> None:
+        mod = self.col.mod
+        if mod != self._mod:
+            self.invalidate()
+            self._mod = mod
+
+    def invalidate(self) -> None:
+        self._results.clear()
+        self._note_fields.clear()
+
+    def search(self, query: str, note_type_name: str) -> QueryResult:
+        """Find the notes of the note type matching the query, and their note type.
+
+        Raises:
+            InvalidInput: If the notes found are not all of the same type
+        """
+        self._check_mod()
+        key = (query, note_type_name)
+        if key in self._results:
+            self.hits += 1
+            instrumentation.count(instrumentation.QUERY_CACHE_HITS)
+            return self._results[key]
+        self.misses += 1
+        instrumentation.count(instrumentation.QUERY_CACHE_MISSES)
+
+        new_query = query + f' note:"{note_type_name}"'
+        try:
+            notesID = self.col.find_notes(new_query)
+        except InvalidInput:
+            self.col.reopen()
+            notesID = self.col.find_notes(new_query)
+        instrumentation.count(instrumentation.SQL_QUERIES)
+        model = None
+        if len(notesID) > 0:
+            model = self.col.models.get(self.col.models.get_single_notetype_of_notes(notesID))
+        self._results[key] = (tuple(notesID), model)
+        return self._results[key]
+
+    def get_note_fields(self, note_type_name: str) -> NoteFieldsUtils:
+        self._check_mod()
+        if note_type_name not in self._note_fields:
+            self._note_fields[note_type_name] = NoteFieldsUtils(self.col, note_type_name)
+        return self._note_fields[note_type_name]
+
+    def stats(self) -> dict:
+        searches = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / searches if searches else 0.0,
+            "cached_queries": len(self._results),
+        }
+
+
+_CACHES: "WeakKeyDictionary[Collection, QueryCache]" = WeakKeyDictionary()
+
+
+def get_query_cache(col: Collection) -> QueryCache:
+    """Get the query cache shared by every stage working on the collection."""
+    if col not in _CACHES:
+        _CACHES[col] = QueryCache(col)
+    return _CACHES[col]
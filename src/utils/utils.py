@@ -1,18 +1,7 @@
-import time
+import hashlib
 
 CLOZE_TYPE = 1
 FIELD_WITH_ORIGINAL_CLOZE = "Original cloze text"
 
-def timeit(f):
-
-    def timed(*args, **kw):
-
-        ts = time.time()
-        result = f(*args, **kw)
-        te = time.time()
-
-        print ("func:%r took: %2.4f sec" % \
-          (f.__name__, te-ts))
-        return result
-
-    return timed
\ No newline at end of file
+def text_hash(text: str) -> str:
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
\ No newline at end of file
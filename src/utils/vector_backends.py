@@ -0,0 +1,298 @@
+import os
+from os import path
+from typing import Optional
+
+import numpy as np
+
+from src.utils.knn_utils import normalize_rows
+
+# (neighbour items of each query, their distances), nearest first
+Neighbours = tuple[list[list[int]], list[list[float]]]
+
+
+def batch_vector_distances(vectors: np.ndarray, queries: np.ndarray, metric: str) -> np.ndarray:
+    """The (len(queries), len(vectors)) distances between each query and the vectors,
+    as computed by Annoy."""
+    if metric == "angular":
+        norms = np.outer(np.linalg.norm(queries, axis=1), np.linalg.norm(vectors, axis=1))
+        norms[norms == 0] = 1
+        cos = queries @ vectors.T / norms
+        return np.sqrt(np.maximum(2 * (1 - cos), 0))
+    if metric == "euclidean":
+        squared = (
+            np.sum(queries**2, axis=1)[:, None] + np.sum(vectors**2, axis=1)[None, :]
+            - 2 * queries @ vectors.T
+        )
+        return np.sqrt(np.maximum(squared, 0))
+    raise ValueError(f"Metric {metric} is not supported.")
+
+
+def save_vectors(vectors_file: str, vectors: np.ndarray) -> None:
+    """Save the vectors in a new file replacing the old one, which may still be
+    memory-mapped."""
+    tmp_file = f"{vectors_file}.tmp.npy"
+    np.save(tmp_file, vectors)
+    os.replace(tmp_file, vectors_file)
+
+
+class VectorBackend:
+    """Search structure built once over a matrix of vectors, whose items are
+    the rows of the matrix.
+
+    The distances are the ones of Annoy for every backend: sqrt(2 * (1 - cos)) for
+    the angular metric, so that a distance threshold means the same for all of them.
+    """
+
+    name = ""
+
+    def __init__(self, vector_len: int, metric: str = "angular"):
+        if metric not in ("angular", "euclidean"):
+            raise ValueError(f"Metric {metric} is not supported.")
+        self.vector_len = vector_len
+        self.metric = metric
+
+    def __len__(self) -> int:
+        raise NotImplementedError
+
+    def build(self, vectors: np.ndarray) -> None:
+        raise NotImplementedError
+
+    def save(self, index_path: str) -> None:
+        raise NotImplementedError
+
+    def load(self, index_path: str) -> bool:
+        """Load the structure saved with index_path. Returns False if there is none."""
+        raise NotImplementedError
+
+    def unload(self) -> None:
+        pass
+
+    def get_item_vector(self, item: int) -> np.ndarray:
+        raise NotImplementedError
+
+    def query(self, queries: np.ndarray, n: int) -> Neighbours:
+        """The n nearest items of each query."""
+        raise NotImplementedError
+
+    def query_radius(self, queries: np.ndarray, distance: float) -> Neighbours:
+        """All the items closer than distance to each query."""
+        raise NotImplementedError
+
+
+class BruteForceBackend(VectorBackend):
+    """Exact search with matrix products, by blocks of queries."""
+
+    name = "bruteforce"
+
+    def __init__(self, vector_len: int, metric: str = "angular", block_size: int = 1024):
+        super().__init__(vector_len, metric)
+        self.block_size = block_size
+        self.vectors = np.zeros((0, vector_len), dtype=np.float32)
+
+    @staticmethod
+    def vectors_file(index_path: str) -> str:
+        return f"{index_path}_vectors.npy"
+
+    def __len__(self) -> int:
+        return len(self.vectors)
+
+    def build(self, vectors: np.ndarray) -> None:
+        self.vectors = np.asarray(vectors, dtype=np.float32).reshape(-1, self.vector_len)
+
+    def save(self, index_path: str) -> None:
+        save_vectors(self.vectors_file(index_path), self.vectors)
+
+    def load(self, index_path: str) -> bool:
+        if not path.exists(self.vectors_file(index_path)):
+            return False
+        self.vectors = np.load(self.vectors_file(index_path), mmap_mode="r")
+        return True
+
+    def unload(self) -> None:
+        self.vectors = np.zeros((0, self.vector_len), dtype=np.float32)
+
+    def get_item_vector(self, item: int) -> np.ndarray:
+        return np.array(self.vectors[item])
+
+    def _distances_by_blocks(self, queries: np.ndarray):
+        queries = np.atleast_2d(np.asarray(queries, dtype=np.float32))
+        for start in range(0, len(queries), self.block_size):
+            yield batch_vector_distances(self.vectors, queries[start : start + self.block_size], self.metric)
+
+    def query(self, queries: np.ndarray, n: int) -> Neighbours:
+        n = min(n, len(self.vectors))
+        items, distances = [], []
+        for block_distances in self._distances_by_blocks(queries):
+            if n == 0:
+                items += [[] for _ in block_distances]
+                distances += [[] for _ in block_distances]
+                continue
+            nearest = np.argpartition(block_distances, n - 1, axis=1)[:, :n]
+            nearest_distances = np.take_along_axis(block_distances, nearest, axis=1)
+            order = np.argsort(nearest_distances, axis=1, kind="stable")
+            items += np.take_along_axis(nearest, order, axis=1).tolist()
+            distances += np.take_along_axis(nearest_distances, order, axis=1).tolist()
+        return items, distances
+
+    def query_radius(self, queries: np.ndarray, distance: float) -> Neighbours:
+        items, distances = [], []
+        for block_distances in self._distances_by_blocks(queries):
+            for row in block_distances:
+                close = np.flatnonzero(row <= distance)
+                close = close[np.argsort(row[close], kind="stable")]
+                items.append(close.tolist())
+                distances.append(row[close].tolist())
+        return items, distances
+
+
+class AnnoyBackend(VectorBackend):
+    """Approximate search with a forest of random projection trees (Annoy),
+    memory-mapped when loaded."""
+
+    name = "annoy"
+
+    def __init__(self, vector_len: int, metric: str = "angular", n_trees: int = 10, search_k: int = -1):
+        super().__init__(vector_len, metric)
+        self.n_trees = n_trees
+        self.search_k = search_k
+        self.index = None
+
+    @staticmethod
+    def ann_file(index_path: str) -> str:
+        return f"{index_path}.ann"
+
+    def _new_index(self):
+        from annoy import AnnoyIndex
+
+        return AnnoyIndex(self.vector_len, self.metric)
+
+    def __len__(self) -> int:
+        return 0 if self.index is None else self.index.get_n_items()
+
+    def build(self, vectors: np.ndarray) -> None:
+        self.unload()
+        self.index = self._new_index()
+        for i, v in enumerate(vectors):
+            self.index.add_item(i, v)
+        self.index.build(self.n_trees)
+
+    def save(self, index_path: str) -> None:
+        self.index.save(self.ann_file(index_path))
+
+    def load(self, index_path: str) -> bool:
+        if not path.exists(self.ann_file(index_path)):
+            return False
+        self.unload()
+        self.index = self._new_index()
+        self.index.load(self.ann_file(index_path))  # Memory-mapped
+        return True
+
+    def unload(self) -> None:
+        if self.index is not None:
+            self.index.unload()
+            self.index = None
+
+    def get_item_vector(self, item: int) -> np.ndarray:
+        return np.array(self.index.get_item_vector(item))
+
+    def query(self, queries: np.ndarray, n: int) -> Neighbours:
+        items, distances = [], []
+        for vector in np.atleast_2d(queries):
+            row_items, row_distances = self.index.get_nns_by_vector(
+                vector, n, search_k=self.search_k, include_distances=True
+            )
+            items.append(row_items)
+            distances.append(row_distances)
+        return items, distances
+
+    def query_radius(self, queries: np.ndarray, distance: float) -> Neighbours:
+        """Annoy has no range search: the number of neighbours asked is doubled
+        until the farthest one is beyond the distance."""
+        items, distances = [], []
+        for vector in np.atleast_2d(queries):
+            n = 16
+            while True:
+                row_items, row_distances = self.index.get_nns_by_vector(
+                    vector, n, search_k=self.search_k, include_distances=True
+                )
+                if len(row_items) < n or row_distances[-1] > distance:
+                    break
+                n *= 2
+            n_close = sum(1 for d in row_distances if d <= distance)
+            items.append(row_items[:n_close])
+            distances.append(row_distances[:n_close])
+        return items, distances
+
+
+class SklearnBackend(VectorBackend):
+    """Exact search with the trees of scikit-learn NearestNeighbors. For the angular
+    metric, the vectors are normalized: their euclidean distance is then the Annoy one.
+    The vectors are saved and the tree is fitted again when loaded."""
+
+    name = "sklearn"
+
+    def __init__(self, vector_len: int, metric: str = "angular", algorithm: str = "auto", leaf_size: int = 30):
+        super().__init__(vector_len, metric)
+        self.algorithm = algorithm
+        self.leaf_size = leaf_size
+        self.vectors = np.zeros((0, vector_len), dtype=np.float32)
+        self.nn = None
+
+    @staticmethod
+    def vectors_file(index_path: str) -> str:
+        return f"{index_path}_vectors.npy"
+
+    def __len__(self) -> int:
+        return len(self.vectors)
+
+    def _prepare(self, vectors: np.ndarray) -> np.ndarray:
+        vectors = np.atleast_2d(np.asarray(vectors, dtype=np.float32))
+        return normalize_rows(vectors) if self.metric == "angular" else vectors
+
+    def build(self, vectors: np.ndarray) -> None:
+        from sklearn.neighbors import NearestNeighbors
+
+        self.vectors = np.asarray(vectors, dtype=np.float32).reshape(-1, self.vector_len)
+        if len(self.vectors) == 0:
+            self.nn = None
+            return
+        self.nn = NearestNeighbors(algorithm=self.algorithm, leaf_size=self.leaf_size, metric="euclidean")
+        self.nn.fit(self._prepare(self.vectors))
+
+    def save(self, index_path: str) -> None:
+        save_vectors(self.vectors_file(index_path), self.vectors)
+
+    def load(self, index_path: str) -> bool:
+        if not path.exists(self.vectors_file(index_path)):
+            return False
+        self.build(np.load(self.vectors_file(index_path)))
+        return True
+
+    def get_item_vector(self, item: int) -> np.ndarray:
+        return np.array(self.vectors[item])
+
+    def query(self, queries: np.ndarray, n: int) -> Neighbours:
+        queries = self._prepare(queries)
+        n = min(n, len(self.vectors))
+        if n == 0:
+            return [[] for _ in queries], [[] for _ in queries]
+        distances, items = self.nn.kneighbors(queries, n_neighbors=n)
+        return items.tolist(), distances.tolist()
+
+    def query_radius(self, queries: np.ndarray, distance: float) -> Neighbours:
+        if self.nn is None:
+            return [[] for _ in np.atleast_2d(queries)], [[] for _ in np.atleast_2d(queries)]
+        distances, items = self.nn.radius_neighbors(self._prepare(queries), radius=distance, sort_results=True)
+        return [row.tolist() for row in items], [row.tolist() for row in distances]
+
+
+BACKENDS: dict[str, type[VectorBackend]] = {
+    backend.name: backend for backend in (BruteForceBackend, AnnoyBackend, SklearnBackend)
+}
+
+
+def get_backend(name: str, vector_len: int, metric: str = "angular", params: Optional[dict] = None) -> VectorBackend:
+    """Create a backend by its name: "bruteforce", "annoy" or "sklearn"."""
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown vector search backend {name}. Available backends: {', '.join(BACKENDS)}")
+    return BACKENDS[name](vector_len, metric, **(params or {}))
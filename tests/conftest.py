@@ -0,0 +1,16 @@
+import pytest
+from anki.collection import Collection
+
+
+@pytest.fixture
+def col(tmp_path):
+    """A throwaway collection with a few Basic notes."""
+    col = Collection(str(tmp_path / "collection.anki2"))
+    model = col.models.by_name("Basic")
+    for front, back in [("Hund", "1"), ("Katze", "1, 2"), ("Maus", "2"), ("Vogel", "")]:
+        note = col.new_note(model)
+        note["Front"] = front
+        note["Back"] = back
+        col.add_note(note, 1)
+    yield col
+    col.close()
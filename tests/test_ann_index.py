@@ -0,0 +1,111 @@
+import numpy as np
+import pytest
+
+from src.utils.ann_index import PersistentVectorIndex
+
+
+VECTORS = {
+    "chat": [1.0, 0.0, 0.0],
+    "chaton": [0.9, 0.1, 0.0],
+    "chien": [0.0, 1.0, 0.0],
+    "chiot": [0.1, 0.9, 0.0],
+    "oiseau": [0.0, 0.0, 1.0],
+}
+
+
+class Embedder:
+    def __init__(self):
+        self.embedded = []
+
+    def __call__(self, texts):
+        self.embedded += texts
+        return np.array([VECTORS[text] for text in texts])
+
+
+def update(index_path, notes, rebuild_threshold=0.8, backend="annoy"):
+    embedder = Embedder()
+    index = PersistentVectorIndex(str(index_path), backend=backend, rebuild_threshold=rebuild_threshold)
+    index.update(
+        [nid for nid, _, _ in notes],
+        [mod for _, mod, _ in notes],
+        [text for _, _, text in notes],
+        embedder,
+    )
+    return index, embedder.embedded
+
+
+@pytest.mark.parametrize("backend", ["annoy", "bruteforce", "sklearn"])
+def test_only_changed_notes_are_embedded(tmp_path, backend):
+    notes = [(1, 10, "chat"), (2, 10, "chien"), (3, 10, "oiseau"), (4, 10, "chiot")]
+    index, embedded = update(tmp_path / "index", notes, backend=backend)
+    assert embedded == ["chat", "chien", "oiseau", "chiot"]
+    assert index.get_nns_by_nid(1, 1) == [1]
+
+    # Note 2 has another field edited, note 4 is edited, note 5 is new
+    notes = [(1, 10, "chat"), (2, 11, "chien"), (3, 10, "oiseau"), (4, 11, "chaton"),
+             (5, 12, "chiot")]
+    index, embedded = update(tmp_path / "index", notes, backend=backend)
+    assert embedded == ["chaton", "chiot"]
+    assert index.delta_nids == [4, 5]
+    assert index.get_nns_by_nid(1, 2) == [1, 4]
+    assert index.get_nns_by_nid(2, 2) == [2, 5]
+
+    # Nothing changed: the saved index and delta are reused
+    index, embedded = update(tmp_path / "index", notes, backend=backend)
+    assert embedded == []
+    assert index.get_nns_by_nid(2, 2) == [2, 5]
+
+
+def test_rebuild_above_threshold(tmp_path):
+    notes = [(1, 10, "chat"), (2, 10, "chien"), (3, 10, "oiseau")]
+    update(tmp_path / "index", notes, rebuild_threshold=0.5)
+
+    notes = [(1, 11, "chaton"), (2, 11, "chiot")]
+    index, embedded = update(tmp_path / "index", notes, rebuild_threshold=0.5)
+    assert embedded == ["chaton", "chiot"]
+    assert index.delta_nids == [] and index.stale_items == set()
+    assert sorted(index.item_nids) == [1, 2]
+    nids, distances = index.get_nns_by_nid(1, 3, include_distances=True)
+    assert nids == [1, 2] and distances[0] < 1e-6
+
+
+def test_batch_search_gives_the_same_neighbours(tmp_path):
+    notes = [(1, 10, "chat"), (2, 10, "chien"), (3, 10, "oiseau")]
+    update(tmp_path / "index", notes)
+    notes = [(1, 10, "chat"), (2, 10, "chien"), (3, 10, "oiseau"), (4, 11, "chaton"), (5, 11, "chiot")]
+    index, _ = update(tmp_path / "index", notes)
+    assert index.delta_nids == [4, 5] and 3 in index and 6 not in index
+
+    neighbours, distances = index.get_nns_by_nids([1, 2, 4], 3)
+    for nid, row_neighbours, row_distances in zip([1, 2, 4], neighbours, distances):
+        expected_neighbours, expected_distances = index.get_nns_by_nid(nid, 3, include_distances=True)
+        assert row_neighbours == expected_neighbours
+        assert np.allclose(row_distances, expected_distances, atol=1e-5)
+
+
+def test_range_search(tmp_path):
+    notes = [(1, 10, "chat"), (2, 10, "chien"), (3, 10, "oiseau")]
+    update(tmp_path / "index", notes, backend="sklearn")
+    notes = [(1, 10, "chat"), (2, 11, "chiot"), (3, 10, "oiseau"), (4, 11, "chaton"), (5, 11, "chien")]
+    index, _ = update(tmp_path / "index", notes, backend="sklearn")
+    neighbours, distances = index.get_nns_within_distance([1, 5, 3], 0.5)
+    assert neighbours == [[1, 4], [5, 2], [3]]
+    assert all(d <= 0.5 for row in distances for d in row)
+
+
+def test_backend_change_rebuilds(tmp_path):
+    notes = [(1, 10, "chat"), (2, 10, "chien")]
+    update(tmp_path / "index", notes)
+    index, embedded = update(tmp_path / "index", notes, backend="bruteforce")
+    assert embedded == []
+    assert index.item_nids == [1, 2] and index.get_nns_by_nid(2, 1) == [2]
+
+
+def test_corrupt_mapping_rebuilds(tmp_path):
+    notes = [(1, 10, "chat"), (2, 10, "chien")]
+    update(tmp_path / "index", notes)
+    (tmp_path / "index.json").write_text('{"vector_len": 3, "met')
+    index, embedded = update(tmp_path / "index", notes)
+    assert embedded == ["chat", "chien"]
+    assert index.get_nns_by_nid(2, 1) == [2]
+    assert not (tmp_path / "index.json.tmp").exists()
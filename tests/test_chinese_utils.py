@@ -0,0 +1,84 @@
+import pytest
+
+from src.utils import chinese_utils
+from src.utils.chinese_utils import PinyinCache, convert_to_pinyin, fill_pinyin
+
+
+def fake_pinyin(text: str) -> str:
+    return f"{text.lower()}1"
+
+
+@pytest.fixture(autouse=True)
+def empty_pinyin_cache():
+    chinese_utils._PINYIN_CACHE.clear()
+    yield
+    chinese_utils._PINYIN_CACHE.clear()
+
+
+def test_convert_each_text_once():
+    converted = []
+
+    def convert(text):
+        converted.append(text)
+        return fake_pinyin(text)
+
+    assert convert_to_pinyin(["Hund", "Maus", "Hund"], convert) == {"Hund": "hund1", "Maus": "maus1"}
+    assert convert_to_pinyin(["Maus", "Katze"], convert) == {"Maus": "maus1", "Katze": "katze1"}
+    assert sorted(converted) == ["Hund", "Katze", "Maus"]
+
+
+def test_cache_by_converter():
+    assert convert_to_pinyin(["Hund"], fake_pinyin) == {"Hund": "hund1"}
+    assert convert_to_pinyin(["Hund"], str.upper) == {"Hund": "HUND"}
+    assert convert_to_pinyin(["Hund"], fake_pinyin) == {"Hund": "hund1"}
+
+
+def test_cache_size():
+    cache = PinyinCache(maxsize=2)
+    cache.put(fake_pinyin, "a", "a1")
+    cache.put(fake_pinyin, "b", "b1")
+    assert cache.get(fake_pinyin, "a") == "a1"  # b is now the oldest
+    cache.put(fake_pinyin, "c", "c1")
+    assert len(cache) == 2
+    assert (cache.get(fake_pinyin, "a"), cache.get(fake_pinyin, "b")) == ("a1", None)
+    assert cache.get(str.upper, "a") is None
+
+
+def test_convert_in_pool():
+    texts = [f"Text{i}" for i in range(10)]
+    pinyins = convert_to_pinyin(texts, fake_pinyin, n_process=2, texts_per_task=3)
+    assert pinyins == {text: fake_pinyin(text) for text in texts}
+
+
+def test_fill_pinyin(col, mocker):
+    mocker.patch("builtins.input", return_value="y")
+    note = col.get_note(col.find_notes("Front:Maus")[0])
+    note["Back"] = "maus1"
+    col.update_note(note)
+
+    converted = []
+
+    def convert(text):
+        converted.append(text)
+        return fake_pinyin(text)
+
+    # Only the notes whose field changes are saved
+    assert fill_pinyin(None, "Basic", "Back", "Front", "", col=col, convert=convert, chunk_size=2) == 3
+    col.reopen()
+    assert sorted(col.get_note(nid)["Back"] for nid in col.find_notes("")) == ["hund1", "katze1", "maus1", "vogel1"]
+
+    # The texts are converted again only with another converter
+    assert fill_pinyin(None, "Basic", "Back", "Front", "", col=col, convert=convert) == 0
+    col.reopen()
+    assert len(converted) == 4
+    assert fill_pinyin(None, "Basic", "Back", "Front", "", col=col, convert=str.lower) == 4
+    col.reopen()
+
+
+def test_fill_pinyin_not_confirmed(col, mocker):
+    # Proceed with the notes found, but don't save
+    mocker.patch("builtins.input", side_effect=["y", "y", "n"])
+    col.save()
+    assert fill_pinyin(None, "Basic", "Back", "Front", "", col=col, convert=fake_pinyin) == 0
+    col.reopen()
+    assert col.get_note(col.find_notes("Front:Hund")[0])["Back"] == "1"
@@ -0,0 +1,47 @@
+from types import SimpleNamespace
+
+import pytest
+
+from src.utils.cloze_utils import get_note_cloze_data, parse_cloze_field
+
+
+def test_parse_cloze_field():
+    cloze_data = parse_cloze_field(
+        "{{c2::Chris Froome}} won the {{c1::2013::year}} Tour de France"
+    )
+    assert cloze_data.deletions == {"c2": ("Chris Froome",), "c1": ("2013",)}
+    assert cloze_data.hints == {"c2": (None,), "c1": ("year",)}
+    assert cloze_data.get("c1") == "2013"
+    with pytest.raises(KeyError):
+        cloze_data.get("c3")
+
+
+def test_several_occurrences_of_same_cloze():
+    cloze_data = parse_cloze_field(
+        "<div>{{c1::Paris}} and {{c1::Lyon}} are in {{c2::France}}</div>"
+    )
+    assert cloze_data.deletions["c1"] == ("Paris", "Lyon")
+    assert cloze_data.get("c1", 1) == "Lyon"
+    with pytest.raises(KeyError):
+        cloze_data.get("c2", 1)
+
+
+def test_deletion_with_colon():
+    assert parse_cloze_field("At {{c1::12:30}}").get("c1") == "12:30"
+
+
+def test_note_cloze_data_is_updated_with_the_field():
+    note = SimpleNamespace(id=1, fields=["{{c1::a}}", ""])
+    assert get_note_cloze_data(note, 0).get("c1") == "a"
+    assert get_note_cloze_data(note, 0) is get_note_cloze_data(note, 0)
+    note.fields[0] = "{{c1::b}}"
+    assert get_note_cloze_data(note, 0).get("c1") == "b"
+
+
+def test_parsed_field_is_shared_and_read_only():
+    cloze_data = parse_cloze_field("{{c1::a}} {{c1::b}}")
+    assert parse_cloze_field("{{c1::a}} {{c1::b}}") is cloze_data
+    with pytest.raises(TypeError):
+        cloze_data.deletions["c2"] = ("c",)
+    with pytest.raises(AttributeError):
+        cloze_data.deletions["c1"].append("c")
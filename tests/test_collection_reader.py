@@ -0,0 +1,68 @@
+import pytest
+from anki.collection import Collection
+
+from src.utils.collection_reader import CollectionReader
+from src.utils.group_index import GroupIndex
+
+
+@pytest.fixture
+def reader(col):
+    col.save()  # The reader only sees the saved changes
+    with CollectionReader(col.path) as reader:
+        yield reader
+
+
+def test_read_rows(col, reader):
+    assert reader.get_field_names("Basic") == ["Front", "Back"]
+    rows = reader.read_rows("Basic")
+    assert [row["Front"] for row in rows] == ["Hund", "Katze", "Maus", "Vogel"]
+    assert [row.id for row in rows] == sorted(col.find_notes("note:Basic"))
+    note = col.get_note(rows[1].id)
+    assert (rows[1]["Back"], rows[1].mid, rows[1].mod) == (note["Back"], note.mid, note.mod)
+    with pytest.raises(AttributeError):
+        rows[0].other = 1  # Rows have slots
+
+
+def test_read_columns(col, reader):
+    columns = reader.read_columns("Basic", ["Back"])
+    assert len(columns) == 4
+    assert columns["Back"] == ["1", "1, 2", "2", ""]
+    assert list(columns.ids) == sorted(col.find_notes("note:Basic"))
+    assert list(reader.read_columns("Basic").fields) == ["Front", "Back"]
+
+    with pytest.raises(ValueError):
+        reader.read_columns("Basic", ["Extra"])
+    with pytest.raises(ValueError):
+        reader.read_columns("Unknown")
+
+
+def test_tags(col):
+    note = col.get_note(col.find_notes("Hund")[0])
+    note.add_tag("marked")
+    col.update_note(note)
+    col.save()
+    with CollectionReader(col.path) as reader:
+        assert reader.read_rows("Basic")[0].tags == ["marked"]
+
+
+def test_group_index_from_reader(col, reader):
+    from_reader = GroupIndex.from_reader(reader, "Basic", "Back")
+    from_collection = GroupIndex.from_collection(col, "Basic", "Back")
+    assert from_reader.group_to_nids == from_collection.group_to_nids
+    assert from_reader.nid_to_groups == from_collection.nid_to_groups
+
+
+def test_old_schema(tmp_path):
+    col_path = str(tmp_path / "old.anki2")
+    col = Collection(col_path)
+    note = col.new_note(col.models.by_name("Basic"))
+    note["Front"] = "Hund"
+    col.add_note(note, 1)
+    col.close(downgrade=True)
+    with CollectionReader(col_path) as reader:
+        assert [row["Front"] for row in reader.read_rows("Basic")] == ["Hund"]
+
+
+def test_no_collection(tmp_path):
+    with pytest.raises(FileNotFoundError):
+        CollectionReader(str(tmp_path / "missing.anki2"))
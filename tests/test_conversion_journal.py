@@ -0,0 +1,71 @@
+import pytest
+import yaml
+from anki.collection import Collection
+
+from src.utils.conversion_journal import ConversionJournal
+from src.utils.note_utils import NoteConverter
+
+NEW_FIELDS = [("Album", "c1"), ("Year", "c2"), ("Extra", "Back Extra")]
+
+
+@pytest.fixture
+def config_path(tmp_path):
+    col_path = str(tmp_path / "collection.anki2")
+    col = Collection(col_path)
+    model = col.models.by_name("Cloze")
+    for i in range(7):
+        note = col.new_note(model)
+        note["Text"] = f"{{{{c1::Album {i}}}}} ({{{{c2::{1990 + i}}}}})"
+        col.add_note(note, 1)
+    col.close()
+    config_path = tmp_path / "config.yaml"
+    config_path.write_text(yaml.safe_dump({"collection_path": col_path}))
+    return str(config_path)
+
+
+def test_journal_ignores_truncated_line(tmp_path):
+    journal_path = tmp_path / "a.journal"
+    journal_path.write_text('{"converting": [1, 2]}\n{"filled": [1]}\n{"filled": [2')
+    journal = ConversionJournal(str(journal_path))
+    assert list(journal.converting) == [1, 2] and journal.filled == {1}
+
+
+def test_interrupted_conversion_is_resumed(config_path, mocker):
+    mocker.patch("builtins.input", return_value="y")
+    converter = NoteConverter(config_path, "Album", list(NEW_FIELDS), "Cloze", "Text")
+    journal_path = ConversionJournal.for_conversion(converter.COL_PATH, "Cloze", "Album").journal_path
+    copy = converter.copy_from_cloze2save_field
+
+    def interrupted_copy(notesID, new_note_type, chunk_size):
+        for i, note in enumerate(copy(notesID, new_note_type, chunk_size)):
+            if i == 5:
+                raise KeyboardInterrupt
+            yield note
+
+    converter.copy_from_cloze2save_field = interrupted_copy
+    with pytest.raises(KeyboardInterrupt):
+        converter.run_cloze2Basic("", chunk_size=2)
+    converter.col.close(save=False)  # The uncommitted changes are lost as in a crash
+
+    journal = ConversionJournal(journal_path)
+    assert len(journal.converting) == 7 and len(journal.filled) == 4
+
+    converter = NoteConverter(config_path, "Album", list(NEW_FIELDS), "Cloze", "Text")
+    filled = []
+    copy = converter.copy_from_cloze2save_field
+
+    def recorded_copy(notesID, new_note_type, chunk_size):
+        filled.extend(notesID)
+        return copy(notesID, new_note_type, chunk_size)
+
+    converter.copy_from_cloze2save_field = recorded_copy
+    converter.run_cloze2Basic("", chunk_size=2)
+    assert len(filled) == 3
+    assert not ConversionJournal(journal_path).converting
+
+    col = Collection(converter.COL_PATH)
+    rows = sorted(col.db.list(
+        "select flds from notes where mid = ?", col.models.id_for_name("Album")
+    ))
+    col.close()
+    assert [row.split("\x1f")[:2] for row in rows] == [[f"Album {i}", str(1990 + i)] for i in range(7)]
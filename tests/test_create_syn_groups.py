@@ -0,0 +1,39 @@
+import pytest
+from anki.collection import Collection
+
+from benchmarks.bench_pipelines import StubNlp
+from benchmarks.synthetic_collection import generate_collection
+from src import create_syn_cognat_groups_main
+from src.utils.ann_index import PersistentVectorIndex
+from src.utils.collection_reader import CollectionReader
+from src.utils.group_index import GroupIndex
+
+
+@pytest.mark.parametrize("n_neighbours, search", [(None, "get_nns_within_distance"), (3, "get_nns_by_nids")])
+def test_grouping_run(tmp_path, mocker, n_neighbours, search):
+    col_path = str(tmp_path / "collection.anki2")
+    generate_collection(col_path, 60)
+    spy = mocker.spy(PersistentVectorIndex, search)
+    read_columns = mocker.spy(CollectionReader, "read_columns")
+    from_collection = mocker.spy(GroupIndex, "from_collection")
+    col = Collection(col_path)
+    create_syn_cognat_groups_main.main(
+        str(tmp_path / "groups.json"),
+        col,
+        tag="syn_created",
+        hint_field="Synonyms",
+        group_name="Synonyms group",
+        main_signification_field="Simplified",
+        original_type_name="Chinois",
+        group_separator=", ",
+        query="-is:new -is:suspended tag:marked -tag:syn_created",
+        embedding_cache_dir=str(tmp_path / "embedding_cache"),
+        nlp=StubNlp(),
+        n_neighbours=n_neighbours,
+    )
+    assert spy.call_count == 1
+    if n_neighbours is not None:
+        assert spy.call_args.args[2] == n_neighbours
+    # The group field and the texts to embed are read without the Anki backend
+    assert [call.args[2] for call in read_columns.call_args_list] == [["Synonyms group"], ["Simplified"]]
+    assert from_collection.call_count == 0
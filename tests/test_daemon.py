@@ -0,0 +1,70 @@
+import threading
+
+import pytest
+
+from src.utils.daemon import DaemonServer, EditingDaemon, is_daemon_running, resolve_function, submit_job
+from src.utils.german_utils import romanic_sorting_key
+
+HINT_PARAMS = {
+    "note_type_name": "Basic", "flds_in_hint": ["Front"], "hint_holding_field": "Extra",
+    "sorting_field": "Front", "additional_hint_field": "Front", "group_separator": ", ",
+    "replace": True, "query_field": "Back", "verbose": 0,
+}
+
+
+@pytest.fixture
+def socket_path(col, tmp_path):
+    col.save()  # The jobs that fail are rolled back
+    socket_path = str(tmp_path / "daemon.sock")
+    server = DaemonServer(EditingDaemon(col), socket_path)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.start()
+    yield socket_path
+    submit_job("shutdown", socket_path=socket_path)
+    thread.join()
+    server.server_close()
+    col.reopen()
+
+
+def get_extra(col, front):
+    return col.get_note(col.find_notes(f"Front:{front}")[0])["Extra"]
+
+
+def test_jobs(col, socket_path):
+    assert is_daemon_running(socket_path)
+    response = submit_job("ping", socket_path=socket_path)
+    assert response["ok"] and response["result"]["col_path"] == col.path
+
+    # The hint job asks for a confirmation before saving
+    response = submit_job("hints", HINT_PARAMS, socket_path=socket_path)
+    assert not response["ok"] and "confirmation" in response["error"]
+    assert col.db is None  # Closed between the jobs
+
+    for _ in range(2):
+        response = submit_job("hints", HINT_PARAMS, confirm=True, socket_path=socket_path)
+        assert response["ok"] and response["result"] == {"groups": 2}
+    col.reopen()
+    assert get_extra(col, "Maus") == "Katze<br>M"
+    col.close()
+
+
+def test_errors(socket_path):
+    response = submit_job("unknown", socket_path=socket_path)
+    assert not response["ok"] and "Unknown job" in response["error"]
+    response = submit_job("hints", {"note_type_name": "Basic"}, socket_path=socket_path)
+    assert not response["ok"] and "TypeError" in response["error"]
+    # The daemon is still running
+    assert submit_job("ping", socket_path=socket_path)["ok"]
+
+
+def test_no_daemon(tmp_path):
+    assert not is_daemon_running(str(tmp_path / "none.sock"))
+    with pytest.raises(ConnectionError):
+        submit_job("ping", socket_path=str(tmp_path / "none.sock"))
+
+
+def test_resolve_function():
+    assert resolve_function("src.utils.german_utils.romanic_sorting_key") is romanic_sorting_key
+    assert resolve_function(None) is None
+    with pytest.raises(ValueError):
+        resolve_function("os.remove")
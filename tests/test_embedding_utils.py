@@ -0,0 +1,88 @@
+from types import SimpleNamespace
+
+import numpy as np
+
+from src.utils import embedding_utils
+from src.utils.embedding_utils import EmbeddingCache, embed_texts, get_model_name
+
+
+class FakeNlp:
+    meta = {"lang": "de", "name": "core_web_md", "version": "3.7.0"}
+    vocab = SimpleNamespace(vectors_length=2)
+
+    def __init__(self):
+        self.embedded = []
+
+    def pipe(self, texts, batch_size=1, n_process=1):
+        for text in texts:
+            self.embedded.append(text)
+            yield SimpleNamespace(vector=np.array([len(text), text.count("a")], dtype=np.float32))
+
+
+def test_only_new_texts_are_embedded(tmp_path):
+    nlp = FakeNlp()
+    cache = EmbeddingCache(str(tmp_path), get_model_name(nlp))
+    vectors = embed_texts(nlp, ["Hand", "Hand ", "Haus"], cache)
+    assert nlp.embedded == ["Hand", "Haus"]
+    np.testing.assert_array_equal(vectors, [[4, 1], [4, 1], [4, 1]])
+
+    nlp = FakeNlp()
+    cache = EmbeddingCache(str(tmp_path), "de_core_web_md-3.7.0")
+    assert len(cache) == 2
+    vectors = embed_texts(nlp, ["Haus", "Katze", "Hand"], cache)
+    assert nlp.embedded == ["Katze"]
+    np.testing.assert_array_equal(vectors, [[4, 1], [5, 1], [4, 1]])
+    assert len(EmbeddingCache(str(tmp_path), "de_core_web_md-3.7.0")) == 3
+
+
+def test_saves_are_appended_then_merged(tmp_path, monkeypatch):
+    monkeypatch.setattr(embedding_utils, "MAX_CHUNK_FILES", 2)
+    texts = ["a", "bb", "ccc", "dddd", "eeeee"]
+    for i, text in enumerate(texts):
+        cache = EmbeddingCache(str(tmp_path), "de_core_web_md-3.7.0")
+        embed_texts(FakeNlp(), texts[: i + 1], cache)
+        # One file per save, until the 4th save merges them
+        assert sorted(f.name for f in tmp_path.glob("*.npy")) == [
+            ["de_core_web_md-3.7.0.npy"],
+            ["de_core_web_md-3.7.0.npy", "de_core_web_md-3.7.0_chunk1.npy"],
+            ["de_core_web_md-3.7.0.npy", "de_core_web_md-3.7.0_chunk1.npy", "de_core_web_md-3.7.0_chunk2.npy"],
+            ["de_core_web_md-3.7.0.npy"],
+            ["de_core_web_md-3.7.0.npy", "de_core_web_md-3.7.0_chunk4.npy"],
+        ][i]
+
+    nlp = FakeNlp()
+    cache = EmbeddingCache(str(tmp_path), "de_core_web_md-3.7.0")
+    vectors = embed_texts(nlp, texts[::-1], cache)
+    assert nlp.embedded == []
+    np.testing.assert_array_equal(vectors, [[len(text), text.count("a")] for text in texts[::-1]])
+
+
+def test_interrupted_save_is_ignored(tmp_path):
+    embed_texts(FakeNlp(), ["a"], EmbeddingCache(str(tmp_path), "de_core_web_md-3.7.0"))
+    # A chunk file saved without its index
+    np.save(tmp_path / "de_core_web_md-3.7.0_chunk1.npy", np.zeros((1, 2), dtype=np.float32))
+    cache = EmbeddingCache(str(tmp_path), "de_core_web_md-3.7.0")
+    assert len(cache) == 1
+    embed_texts(FakeNlp(), ["bb"], cache)
+    np.testing.assert_array_equal(
+        embed_texts(FakeNlp(), ["a", "bb"], EmbeddingCache(str(tmp_path), "de_core_web_md-3.7.0")),
+        [[1, 1], [2, 0]],
+    )
+
+
+def test_without_cache():
+    nlp = FakeNlp()
+    assert embed_texts(nlp, ["a", "a"]).shape == (2, 2)
+    assert nlp.embedded == ["a"]
+    assert embed_texts(nlp, []).shape == (0, 2)
+
+
+def test_vectors_beyond_the_index_are_not_reused(tmp_path):
+    embed_texts(FakeNlp(), ["a"], EmbeddingCache(str(tmp_path), "de_core_web_md-3.7.0"))
+    # A merge interrupted after replacing the main file, before saving the index
+    np.save(tmp_path / "de_core_web_md-3.7.0.npy", np.array([[1, 1], [99, 99]], dtype=np.float32))
+    cache = EmbeddingCache(str(tmp_path), "de_core_web_md-3.7.0")
+    np.testing.assert_array_equal(embed_texts(FakeNlp(), ["bb", "a"], cache), [[2, 0], [1, 1]])
+    cache = EmbeddingCache(str(tmp_path), "de_core_web_md-3.7.0")
+    np.testing.assert_array_equal(cache.get(next(key for key, row in cache.rows.items() if row == 1)), [2, 0])
+    assert sorted(f.name for f in tmp_path.iterdir()) == ["de_core_web_md-3.7.0.npy", "de_core_web_md-3.7.0_index.json"]
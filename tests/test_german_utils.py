@@ -0,0 +1,72 @@
+import pytest
+
+from src.utils.german_utils import GermanKeys, tokenize
+
+STOP_WORDS = {"der", "die", "das", "sich", "e", "r", "s"}
+
+# German hints of the Allemand notes
+FIXTURES = [
+    "das Mädchen",
+    "der Hund, die Hunde",
+    "e Abfahrt",
+    "r Apfel",
+    "aufmuntern",
+    "sich freuen auf",
+    "die E-Mail",
+    "das Fahrrad",
+    "der Zug",
+    "übernehmen",
+    "jdm helfen",
+    "s Auto",
+    "die Angst vor",
+]
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("das Mädchen", ["das", "Mädchen"]),
+    ("der Hund, die Hunde", ["der", "Hund", ",", "die", "Hunde"]),
+    ("die E-Mail", ["die", "E-Mail"]),
+    ("(sich) ärgern", ["(", "sich", ")", "ärgern"]),
+    ("", []),
+])
+def test_tokenize(text, expected):
+    assert tokenize(text) == expected
+
+
+@pytest.mark.parametrize("text, sorting_key, initial", [
+    ("das Mädchen", "Mädchen", "M"),
+    ("der Hund, die Hunde", "Hund , Hunde", "H"),
+    ("e Abfahrt", "Abfahrt", "A"),
+    ("(sich) ärgern", "( ) ärgern", "ä"),
+    ("die", "", ""),
+])
+def test_german_keys(text, sorting_key, initial):
+    german_keys = GermanKeys(STOP_WORDS)
+    assert german_keys.sorting_key(("hint", text)) == sorting_key
+    assert german_keys.additional_hint(text) == initial
+
+
+def test_keys_computed_once_by_text():
+    german_keys = GermanKeys(STOP_WORDS)
+    german_keys.sorting_key(("hint", "das Mädchen"))
+    german_keys.additional_hint("das Mädchen")
+    german_keys.sorting_key(("other hint", "das Mädchen"))
+    info = german_keys.get_keys.cache_info()
+    assert (info.misses, info.hits) == (1, 2)
+
+
+def test_same_order_as_nltk():
+    pytest.importorskip("nltk")
+    from src.utils.german_utils import get_main_words
+
+    try:
+        nltk_keys = {text: list(get_main_words(text)) for text in FIXTURES}
+    except LookupError:
+        pytest.skip("The NLTK tokenizer data is not installed")
+    german_keys = GermanKeys()
+
+    def nltk_sorting_key(text):
+        return " ".join(nltk_keys[text])
+
+    assert sorted(FIXTURES, key=lambda text: german_keys.get_keys(text)[0]) == sorted(FIXTURES, key=nltk_sorting_key)
+    assert [german_keys.additional_hint(text) for text in FIXTURES] == [nltk_keys[text][0][0] for text in FIXTURES]
@@ -0,0 +1,34 @@
+from src.utils.graph_clustering import (UnionFind, cluster_knn_graph, knn_graph_edges,
+                                        merge_into_existing_groups)
+
+
+def test_union_find():
+    union_find = UnionFind([1, 2, 3, 4])
+    assert union_find.union(1, 2)
+    assert union_find.union(3, 4)
+    assert not union_find.union(1, 3, max_size=3)
+    assert union_find.union(2, 1, max_size=2)
+    assert union_find.groups() == [[1, 2], [3, 4]]
+    assert union_find.union(4, 1)
+    assert union_find.groups() == [[1, 2, 3, 4]]
+
+
+def test_knn_graph_edges():
+    edges = knn_graph_edges([1, 2], [[1, 3, 4], [2, 1, 4]], [[0.0, 0.5, 0.9], [0.0, 0.2, 0.6]], 0.7)
+    assert edges == [(0.2, 2, 1), (0.5, 1, 3), (0.6, 2, 4)]
+
+
+def test_cluster_knn_graph():
+    edges = [(0.1, 1, 2), (0.2, 3, 4), (0.3, 2, 3), (0.4, 5, 6), (0.5, 1, 4)]
+    assert cluster_knn_graph(edges) == [[1, 2, 3, 4], [5, 6]]
+    # The weakest link of the group 1-2-3-4 is cut
+    assert cluster_knn_graph(edges, max_group_size=2) == [[1, 2], [3, 4], [5, 6]]
+    assert cluster_knn_graph(edges, max_group_size=3) == [[1, 2], [3, 4], [5, 6]]
+
+
+def test_merge_into_existing_groups():
+    clusters = [[1, 2, 3], [4, 5], [6, 7]]
+    note_groups = {1: [10], 2: [10, 11], 3: [], 6: [12], 7: [12]}
+    new_groups, extended_groups = merge_into_existing_groups(clusters, note_groups)
+    assert new_groups == [[4, 5]]
+    assert extended_groups == {10: [3]}
@@ -0,0 +1,133 @@
+import pytest
+
+from src.utils.group_hints import HintSettings, JoinedHint, compute_group_hints
+from src.utils.group_index import GroupIndex
+from src.utils.hint_generation_utils import HintAdaptor
+
+
+def test_compute_group_hints():
+    settings = HintSettings(
+        field_names=["Album", "Year"], flds_in_hint=["Year", "Album"], separator=" ",
+        sorting_field="Year",
+    )
+    notes = [(1, ["Zaireeka", "1997"]), (2, ["<b>Embryonic</b>", "2009"]), (3, ["Clouds", "1995"])]
+    assert compute_group_hints(settings, notes) == [
+        (3, "?<br>1997 Zaireeka<br>2009 Embryonic"),
+        (1, "1995 Clouds<br>?<br>2009 Embryonic"),
+        (2, "1995 Clouds<br>1997 Zaireeka<br>?"),
+    ]
+
+
+def test_compute_group_hints_identical_lines_and_break_lines():
+    settings = HintSettings(
+        field_names=["Album", "Year"], flds_in_hint=["Year"], sorting_field="Year",
+        additional_hint_field="Album", break_lines=True,
+    )
+    notes = [(1, ["Abc", "1997"]), (2, ["Def", "1997"]), (3, ["Ghi", "2009"])]
+    assert compute_group_hints(settings, notes) == [
+        (1, "A<br>1997<br><br>2009"),
+        (2, "1997<br>D<br><br>2009"),
+        (3, "1997<br>1997<br><br>G"),
+    ]
+
+
+def test_compute_group_hints_cloze():
+    settings = HintSettings(
+        field_names=["Text", "Back Extra"], flds_in_hint=["c2", "c1"], separator=" ",
+        sorting_field="c2", cloze_field_index=0,
+    )
+    notes = [(1, ["{{c1::Froome}} won in {{c2::2013}}", ""]), (2, ["{{c1::Hinault}} won in {{c2::1985}}", ""])]
+    assert compute_group_hints(settings, notes) == [(2, "?<br>2013 Froome"), (1, "1985 Hinault<br>?")]
+
+
+def get_hints(col):
+    return {front: extra for front, extra in (
+        flds.split("\x1f")[::2] for flds in col.db.list("select flds from notes order by id")
+    )}
+
+
+@pytest.mark.parametrize("chunk_size", [None, 1])
+def test_pool_gives_the_same_hints(col, chunk_size):
+    hints = []
+    for n_process in [1, 2]:
+        hint_adaptor = HintAdaptor(
+            "Basic", ["Front"], col=col, hint_holding_field="Extra", sorting_field="Front",
+            additional_hint_field="Front", group_separator=", ", replace=True,
+            query_field="Back", override_confirm=True, verbose=0,
+        )
+        group_index = GroupIndex.from_collection(col, "Basic", "Back", ", ")
+        hint_adaptor.run_all_groups(group_index, chunk_size=chunk_size, n_process=n_process)
+        col.reopen()
+        hints.append(get_hints(col))
+    assert hints[0] == hints[1]
+    assert hints[0] == {
+        "Hund": "H<br>Katze",
+        "Katze": "Hund<br>K<br><br>K<br>Maus",
+        "Maus": "Katze<br>M",
+        "Vogel": "",
+    }
+
+
+@pytest.mark.parametrize("n_process", [1, 2])
+def test_default_sorting_key_chosen_for_each_group(col, n_process):
+    # The group 0 is sorted as int, then the groups 1 and 2 as text
+    for front in ["10", "9"]:
+        note = col.new_note(col.models.by_name("Basic"))
+        note["Front"] = front
+        note["Back"] = "0"
+        col.add_note(note, 1)
+    hint_adaptor = HintAdaptor(
+        "Basic", ["Front"], col=col, hint_holding_field="Extra", sorting_field="Front",
+        additional_hint_field="Front", group_separator=", ", replace=True,
+        query_field="Back", override_confirm=True, verbose=0,
+    )
+    group_index = GroupIndex.from_collection(col, "Basic", "Back", ", ")
+    hint_adaptor.run_all_groups(group_index, n_process=n_process)
+    col.reopen()
+    hints = get_hints(col)
+    assert (hints["9"], hints["10"]) == ("9<br>10", "9<br>1")
+    assert hints["Katze"] == "Hund<br>K<br><br>K<br>Maus"
+
+
+@pytest.mark.parametrize("lines", [["a"], ["1995 Clouds", "", "2009 Embryonic", "2010 X"], ["", ""]])
+def test_joined_hint(lines):
+    joined_hint = JoinedHint(lines)
+    assert joined_hint.text == "<br>".join(lines)
+    for i in range(len(lines)):
+        assert joined_hint.replace_line(i, "?") == "<br>".join(lines[:i] + ["?"] + lines[i + 1:])
+
+
+def test_identical_hints_are_hidden_in_their_own_note(col):
+    note = col.new_note(col.models.by_name("Basic"))
+    note["Front"] = "Affe"
+    note["Back"] = "1"
+    col.add_note(note, 1)
+    # Affe and Hund have the same hint line "1"
+    hint_adaptor = HintAdaptor(
+        "Basic", ["Back"], col=col, hint_holding_field="Extra", sorting_field="Front",
+        additional_hint_field="Front", replace=True, override_confirm=True, verbose=0,
+    )
+    hint_adaptor.run("(Front:Hund or Front:Affe)")
+    col.reopen()
+    assert get_hints(col)["Affe"] == "A<br>1"
+    assert get_hints(col)["Hund"] == "1<br>H"
+
+
+@pytest.mark.parametrize("n_process", [1, 2])
+def test_declined_chunk_is_not_appended_to(col, mocker, n_process):
+    hint_adaptor = HintAdaptor(
+        "Basic", ["Front"], col=col, hint_holding_field="Extra", sorting_field="Front",
+        additional_hint_field="Front", group_separator=", ", replace=True,
+        query_field="Back", verbose=0,
+    )
+    note = col.get_note(col.find_notes("Front:Katze")[0])
+    note["Extra"] = "old"
+    col.update_note(note)
+    col.save()
+    # Decline the group 1 (Hund, Katze), then save the group 2 (Katze, Maus)
+    mocker.patch("builtins.input", side_effect=["n", "y"])
+    group_index = GroupIndex.from_collection(col, "Basic", "Back", ", ")
+    hint_adaptor.run_all_groups(group_index, chunk_size=1, n_process=n_process)
+    col.reopen()
+    hints = get_hints(col)
+    assert (hints["Hund"], hints["Katze"], hints["Maus"]) == ("", "K<br>Maus", "Katze<br>M")
@@ -0,0 +1,19 @@
+from src.utils.group_index import GroupIndex, parse_group_ids
+
+
+def test_parse_group_ids():
+    assert parse_group_ids("1, 12") == [1, 12]
+    assert parse_group_ids("3") == [3]
+    assert parse_group_ids("") == []
+
+
+def test_group_index_from_collection(col):
+    group_index = GroupIndex.from_collection(col, "Basic", "Back")
+    hund, katze, maus = (col.find_notes(word)[0] for word in ["Hund", "Katze", "Maus"])
+
+    assert group_index.group_ids() == [1, 2]
+    assert sorted(group_index.get_notes(1)) == sorted([hund, katze])
+    assert sorted(group_index.get_notes(2)) == sorted([katze, maus])
+    assert group_index.get_groups(katze) == [1, 2]
+    assert group_index.get_groups(col.find_notes("Vogel")[0]) == []
+    assert group_index.last_id == 2
@@ -0,0 +1,66 @@
+import json
+
+import pytest
+
+from src.utils.group_store import GroupStore
+
+GROUPS = {
+    "1": [{"id": 10, "text": "高兴"}, {"id": 11, "text": "开心"}],
+    "2": [{"id": 11, "text": "开心"}, {"id": 12, "text": "快乐"}],
+}
+
+
+@pytest.fixture
+def store_path(tmp_path):
+    return str(tmp_path / "groups.sqlite")
+
+
+def test_lookups(store_path):
+    with GroupStore(store_path) as group_store:
+        assert group_store.import_groups(GROUPS) == {10, 11, 12}
+        assert len(group_store) == 2 and group_store.last_id == 2
+        assert group_store.get_notes(1) == [10, 11]
+        assert group_store.get_group(2) == GROUPS["2"]
+        assert group_store.get_groups(11) == [1, 2]
+        assert group_store.get_groups(13) == []
+        assert 1 in group_store and 3 not in group_store
+        assert group_store.to_dict() == GROUPS
+
+
+def test_incremental_updates(store_path):
+    with GroupStore(store_path) as group_store:
+        group_store.import_groups(GROUPS)
+        group_store.add_notes(1, [{"id": 13, "text": "愉快"}, {"id": 10, "text": "高兴"}])
+        assert group_store.get_notes(1) == [10, 11, 13]
+        group_store.set_group(3, [{"id": 14, "text": "难过"}, {"id": 15, "text": "伤心"}])
+        group_store.remove_notes(2, [12])
+        assert group_store.get_notes(2) == [11]
+        assert group_store.get_text(12) is None  # In no group anymore
+        group_store.remove_group(1)
+        assert group_store.get_groups(11) == [2]
+        assert (group_store.get_text(10), group_store.get_text(11)) == (None, "开心")
+        group_store.set_group(3, [{"id": 15, "text": "伤心"}])
+        assert group_store.get_group(3) == [{"id": 15, "text": "伤心"}]
+
+    with GroupStore(store_path) as group_store:
+        assert group_store.group_ids() == [2, 3]
+        assert group_store.get_text(14) is None
+
+
+def test_rolled_back_on_error(store_path):
+    with GroupStore(store_path) as group_store:
+        group_store.import_groups(GROUPS)
+    with pytest.raises(RuntimeError):
+        with GroupStore(store_path) as group_store:
+            group_store.remove_group(1)
+            raise RuntimeError
+    with GroupStore(store_path) as group_store:
+        assert group_store.group_ids() == [1, 2]
+
+
+def test_import_json(tmp_path, store_path):
+    json_path = tmp_path / "groups.json"
+    json_path.write_text(json.dumps(GROUPS, ensure_ascii=False), encoding="utf-8")
+    with GroupStore(store_path) as group_store:
+        group_store.import_json(str(json_path))
+        assert group_store.to_dict() == GROUPS
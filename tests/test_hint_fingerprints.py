@@ -0,0 +1,123 @@
+from src.utils.group_hints import HintSettings
+from src.utils.group_index import GroupIndex
+from src.utils.hint_fingerprints import HintFingerprints, get_input_field_indices, group_fingerprint
+from src.utils.hint_generation_utils import HintAdaptor
+
+
+def test_input_field_indices():
+    settings = HintSettings(
+        field_names=["Album", "Year", "Band"], flds_in_hint=["Year"], sorting_field="Year",
+        additional_hint_field="Album",
+    )
+    assert get_input_field_indices(settings) == [0, 1]
+
+
+def test_group_fingerprint_ignores_the_other_fields_and_the_order():
+    notes = [(1, ["a", "b"]), (2, ["c", "d"])]
+    fingerprint = group_fingerprint("settings", notes, [0])
+    assert group_fingerprint("settings", notes[::-1], [0]) == fingerprint
+    assert group_fingerprint("settings", [(1, ["a", "x"]), (2, ["c", "d"])], [0]) == fingerprint
+    assert group_fingerprint("settings", [(1, ["x", "b"]), (2, ["c", "d"])], [0]) != fingerprint
+    assert group_fingerprint("other", notes, [0]) != fingerprint
+
+
+def run_incremental(col, mocker):
+    hint_adaptor = HintAdaptor(
+        "Basic", ["Front"], col=col, hint_holding_field="Extra", sorting_field="Front",
+        additional_hint_field="Front", group_separator=", ", replace=True,
+        query_field="Back", override_confirm=True, verbose=0,
+    )
+    spy = mocker.spy(hint_adaptor, "generate_clean_hint")
+    group_index = GroupIndex.from_collection(col, "Basic", "Back", ", ")
+    hint_adaptor.run_all_groups(group_index, incremental=True)
+    col.reopen()
+    group_of_notes = {tuple(group_index.get_notes(group_id)): group_id for group_id in group_index.group_ids()}
+    return sorted(group_of_notes[tuple(call.args[1])] for call in spy.call_args_list)
+
+
+def test_only_the_changed_groups_are_regenerated(col, mocker):
+    for front in ["Tanne", "Eiche"]:
+        note = col.new_note(col.models.by_name("Basic"))
+        note["Front"] = front
+        note["Back"] = "3"
+        col.add_note(note, 1)
+    assert run_incremental(col, mocker) == [1, 2, 3]
+    assert run_incremental(col, mocker) == []
+
+    nid = col.find_notes("Front:Hund")[0]
+    note = col.get_note(nid)
+    note["Front"] = "Wolf"
+    col.update_notes([note])
+    # Group 2 shares the note Katze with the group 1
+    assert run_incremental(col, mocker) == [1, 2]
+
+    nid = col.find_notes("Front:Tanne")[0]
+    note = col.get_note(nid)
+    note["Front"] = "Buche"
+    col.update_notes([note])
+    assert run_incremental(col, mocker) == [3]
+    assert col.get_note(nid)["Extra"] == "B<br>Eiche"
+    assert HintFingerprints.for_hints(col.path, "Basic", "Extra").fingerprints.keys() == {"1", "2", "3"}
+
+
+def set_back(col, front, back):
+    nid = col.find_notes(f"Front:{front}")[0]
+    note = col.get_note(nid)
+    note["Back"] = back
+    col.update_notes([note])
+    return nid
+
+
+def test_note_removed_from_one_of_its_groups(col, mocker):
+    set_back(col, "Vogel", "2")
+    assert run_incremental(col, mocker) == [1, 2]
+    katze = col.find_notes("Front:Katze")[0]
+    assert col.get_note(katze)["Extra"] == "Hund<br>K<br><br>K<br>Maus<br>Vogel"
+
+    # Katze leaves the group 2: its hint only has the group 1 hint
+    set_back(col, "Katze", "1")
+    assert run_incremental(col, mocker) == [1, 2]
+    assert col.get_note(katze)["Extra"] == "Hund<br>K"
+    assert col.get_note(col.find_notes("Front:Maus")[0])["Extra"] == "M<br>Vogel"
+    assert run_incremental(col, mocker) == []
+
+
+def test_group_deleted(col, mocker):
+    set_back(col, "Vogel", "2, 3")
+    set_back(col, "Hund", "1, 3")
+    assert run_incremental(col, mocker) == [1, 2, 3]
+
+    # The group 3 disappears: the other groups of its notes are regenerated
+    set_back(col, "Vogel", "2")
+    set_back(col, "Hund", "1")
+    assert run_incremental(col, mocker) == [1, 2]
+    assert col.get_note(col.find_notes("Front:Hund")[0])["Extra"] == "H<br>Katze"
+
+
+def test_declined_groups_are_not_recorded(col, mocker):
+    hint_adaptor = HintAdaptor(
+        "Basic", ["Front"], col=col, hint_holding_field="Extra", sorting_field="Front",
+        additional_hint_field="Front", group_separator=", ", replace=True,
+        query_field="Back", verbose=0,
+    )
+    # Decline the group 1, then save the group 2
+    mocker.patch("builtins.input", side_effect=["n", "y"])
+    hint_adaptor.run_all_groups(
+        GroupIndex.from_collection(col, "Basic", "Back", ", "), chunk_size=1, incremental=True
+    )
+    col.reopen()
+    assert run_incremental(col, mocker) == [1, 2]
+
+
+def test_settings_unchanged_by_a_run(col):
+    hint_adaptor = HintAdaptor(
+        "Basic", ["Front"], col=col, hint_holding_field="Extra", sorting_field="Front",
+        additional_hint_field="Front", group_separator=", ", replace=True,
+        query_field="Back", override_confirm=True, verbose=0,
+    )
+    group_index = GroupIndex.from_collection(col, "Basic", "Back", ", ")
+    hint_adaptor.run_all_groups(group_index, incremental=True)
+    assert hint_adaptor.additional_hint_func is None
+    col.reopen()
+    fingerprints = HintFingerprints.for_hints(col.path, "Basic", "Extra")
+    assert hint_adaptor.get_changed_groups(group_index, fingerprints)[0] == []
@@ -0,0 +1,58 @@
+import random
+
+import pytest
+from bs4 import BeautifulSoup
+
+from src.utils.field_utils import extract_text
+from src.utils.html_utils import extract_field_lines, html_to_text
+
+FIELDS = [
+    "",
+    "aufmuntern",
+    "das Mädchen<br>girl",
+    "<div>1976</div><div><br></div><div>Lucien Van Impe</div>",
+    "<div>&nbsp;</div>line&nbsp;with&nbsp;spaces",
+    "<b>NOUN</b><br/>Hund<br />dog",
+    "鼓励<br><div>gǔlì</div><div></div>",
+    "<ruby>汉<rt>hàn</rt></ruby>字",
+    "<span style=\"color: rgb(0, 0, 0);\">rot</span> &amp; <i>weiß</i>",
+    "unclosed <div>tag<b>bold",
+    "stray </div> end tag</br>",
+    "<br>a<br/>b<br>c",
+    "a <!-- comment --> b",
+    "&eacute;t&eacute; &#233;t&#xE9; &#150; &unknown;",
+    "<pre>  keep   spaces </pre>   <p>  </p>",
+    "<img src=\"chat.jpg\"><div><img src=\"chien.jpg\"></div>",
+    "<script>if (a < b) {}</script><style>b {}</style>text",
+    "<div><div>nested</div><div>&nbsp;</div></div>",
+]
+PIECES = [
+    "<div>", "</div>", "<br>", "<br/>", "</br>", "&nbsp;", "&amp;", "&#233;", "&foo;",
+    "word", " other word ", "  ", "\n", "<b>", "</b>", "<span>", "</span>", "<rt>",
+    "</rt>", "汉", "<!-- c -->", "<p>", "</p>", "<img src='a.png'>", "<pre>", "</pre>",
+    "<", "<div", "&", "<![CDATA[x]]>",
+]
+
+
+def random_fields(n):
+    rng = random.Random(0)
+    return ["".join(rng.choice(PIECES) for _ in range(rng.randint(0, 12))) for _ in range(n)]
+
+
+@pytest.mark.parametrize("field", FIELDS + random_fields(500))
+@pytest.mark.parametrize("transform_newline", [False, True])
+def test_same_lines_as_beautifulsoup(field, transform_newline):
+    expected = extract_text(BeautifulSoup(field, "html.parser"), transform_newline)
+    assert extract_field_lines(field, transform_newline) == expected
+
+
+@pytest.mark.parametrize("field", FIELDS + random_fields(500))
+def test_same_text_as_beautifulsoup(field):
+    assert html_to_text(field) == BeautifulSoup(field, "html.parser").text
+    assert html_to_text(field[:10]) == BeautifulSoup(field[:10], "html.parser").text
+
+
+def test_lines_are_not_shared_between_calls():
+    lines = extract_field_lines("<div>ADJ</div>gut")
+    lines.pop(0)
+    assert extract_field_lines("<div>ADJ</div>gut") == ["ADJ", "gut"]
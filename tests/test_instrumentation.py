@@ -0,0 +1,51 @@
+import json
+
+import pytest
+
+from src.utils import instrumentation
+
+
+@pytest.fixture
+def profiler(tmp_path):
+    instrumentation.enable(str(tmp_path))
+    yield instrumentation.PROFILER
+    instrumentation.disable()
+
+
+@instrumentation.traced
+def load(n):
+    instrumentation.count(instrumentation.NOTES_LOADED, n)
+
+
+@instrumentation.traced(name="pipeline")
+def pipeline():
+    for n in [1, 2, 3]:
+        load(n)
+    with instrumentation.span("write"):
+        instrumentation.count(instrumentation.NOTES_WRITTEN, 6)
+
+
+def test_nested_spans_and_counters(profiler, tmp_path):
+    pipeline()
+    report = profiler.last_report
+    assert report["counters"] == {"notes_loaded": 6, "notes_written": 6}
+    spans = report["spans"]
+    assert spans["name"] == "pipeline" and spans["calls"] == 1
+    assert [(c["name"], c["calls"]) for c in spans["children"]] == [("load", 3), ("write", 1)]
+    assert spans["seconds"] >= sum(c["seconds"] for c in spans["children"])
+
+    # The report is reset after each run
+    pipeline()
+    assert profiler.last_report["counters"]["notes_loaded"] == 6
+
+    json_files = sorted(tmp_path.glob("*_pipeline.json"))
+    assert json_files and json.loads(json_files[-1].read_text())["counters"]["notes_written"] == 6
+    folded = sorted(tmp_path.glob("*_pipeline.folded"))[-1].read_text().splitlines()
+    assert [line.rsplit(" ", 1)[0] for line in folded] == ["pipeline", "pipeline;load", "pipeline;write"]
+
+
+def test_disabled():
+    assert not instrumentation.PROFILER.enabled
+    pipeline()
+    assert instrumentation.PROFILER.root is None
+    assert not instrumentation.PROFILER.counters
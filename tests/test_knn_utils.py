@@ -0,0 +1,54 @@
+import heapq
+
+import numpy as np
+
+from src.utils.knn_utils import get_batch_nn, normalize_rows, top_k_similar
+from src.utils.note_utils import get_nn
+
+
+def heap_get_nn(word_vectors, query, k, word_list):
+    """Previous implementation of get_nn, one word at a time"""
+    query_norm = np.linalg.norm(query)
+    if np.abs(query_norm) < 1e-8:
+        query_norm = 1
+    heap = []
+    for i, word in enumerate(word_list):
+        similarity = np.dot(word_vectors[i], query) / query_norm
+        if len(heap) == k and similarity < heap[0][0]:
+            continue
+        heapq.heappush(heap, (similarity, word))
+        if len(heap) > k:
+            heapq.heappop(heap)
+    heap.sort(reverse=True, key=lambda x: x[0])
+    return heap
+
+
+def test_get_nn_matches_heap_implementation():
+    rng = np.random.default_rng(0)
+    word_vectors = normalize_rows(rng.normal(size=(1000, 20)))
+    word_list = [f"word{i}" for i in range(1000)]
+    for query in rng.normal(size=(5, 20)):
+        expected = heap_get_nn(word_vectors, query, 10, word_list)
+        result = get_nn(word_vectors, query, 10, word_list, block_size=64)
+        assert [word for _, word in result] == [word for _, word in expected]
+        np.testing.assert_allclose([s for s, _ in result], [s for s, _ in expected])
+
+
+def test_batch_search_by_blocks():
+    rng = np.random.default_rng(1)
+    word_vectors = rng.normal(size=(300, 8)).astype(np.float32)
+    queries = rng.normal(size=(7, 8)).astype(np.float32)
+    indices, similarities = top_k_similar(word_vectors, queries, 5, block_size=3)
+    full_indices, _ = top_k_similar(word_vectors, queries, 5)
+    np.testing.assert_array_equal(indices, full_indices)
+    assert indices.shape == (7, 5)
+    assert np.all(np.diff(similarities, axis=1) <= 0)
+
+    results = get_batch_nn(word_vectors, queries, 2, [str(i) for i in range(300)])
+    assert [word for _, word in results[3]] == [str(i) for i in indices[3, :2]]
+
+
+def test_k_larger_than_vocabulary():
+    indices, _ = top_k_similar(np.eye(3), np.array([1.0, 0.0, 0.0]), 10)
+    assert indices.shape == (1, 3)
+    assert indices[0, 0] == 0
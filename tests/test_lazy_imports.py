@@ -0,0 +1,8 @@
+import pytest
+
+from benchmarks.bench_startup import ENTRY_POINTS, time_import
+
+
+@pytest.mark.parametrize("module", ENTRY_POINTS)
+def test_entry_points_dont_import_heavy_dependencies(module):
+    assert time_import(module)["heavy_modules"] == []
@@ -0,0 +1,71 @@
+from src.utils.note_cache import get_note_cache
+
+
+def test_notes_are_identical_to_backend_notes(col):
+    notesID = list(col.find_notes(""))
+    cached_notes = get_note_cache(col).get_notes(notesID)
+    for nid, cached_note in zip(notesID, cached_notes):
+        note = col.get_note(nid)
+        assert cached_note.id == note.id
+        assert cached_note.fields == note.fields
+        assert cached_note.tags == note.tags
+        assert cached_note.mod == note.mod
+        assert cached_note["Front"] == note["Front"]
+
+
+def test_cache_is_shared_and_invalidated(col):
+    nid = col.find_notes("Hund")[0]
+    note_cache = get_note_cache(col)
+    assert note_cache is get_note_cache(col)
+
+    note = note_cache.get(nid)
+    note["Back"] = "edited"
+    assert note_cache.get(nid)["Back"] == "1"
+
+    note_cache.update_notes([note])
+    assert nid not in note_cache
+    assert note_cache.get(nid)["Back"] == "edited"
+
+
+def test_notes_are_saved_by_chunks(col):
+    notesID = list(col.find_notes(""))
+    note_cache = get_note_cache(col)
+    loaded = []
+
+    def edited_notes():
+        for note in note_cache.iter_notes(notesID, chunk_size=3):
+            loaded.append(len(note_cache))
+            note["Back"] = "edited"
+            yield note
+
+    assert note_cache.update_notes_by_chunks(edited_notes(), chunk_size=3, total=len(notesID)) == 4
+    # The saved chunks are forgotten: at most one chunk of notes is in the cache
+    assert max(loaded) <= 3
+    assert [col.get_note(nid)["Back"] for nid in notesID] == ["edited"] * 4
+
+
+def test_nothing_is_saved_without_confirmation(col):
+    notesID = list(col.find_notes(""))
+    note_cache = get_note_cache(col)
+    notes = note_cache.get_notes(notesID)
+    for note in notes:
+        note["Back"] = "edited"
+    assert note_cache.update_notes_by_chunks(notes, chunk_size=2, confirm=lambda: False) == 0
+    assert "edited" not in [col.get_note(nid)["Back"] for nid in notesID]
+
+
+def test_changes_outside_the_cache_empty_it(col):
+    nid = col.find_notes("Hund")[0]
+    note_cache = get_note_cache(col)
+    assert note_cache.get(nid)["Back"] == "1"
+
+    note = col.get_note(nid)
+    note["Back"] = "edited"
+    col.update_note(note)
+    assert note_cache.get_fields(nid)[1] == "edited"
+
+    # The notes saved by the cache don't empty it
+    other_nid = col.find_notes("Katze")[0]
+    note_cache.get(other_nid)
+    note_cache.update_notes([note_cache.get(nid)])
+    assert other_nid in note_cache
@@ -0,0 +1,44 @@
+import pytest
+
+from src.utils.group_hints import HintSettings, compute_group_hints
+from src.utils.pinyin_collation import parse_pinyin, pinyin_collation_key, pinyin_sorting_key
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("nǐ hǎo", [("ni", 3), ("hao", 3)]),
+    ("Ni3 hao3", [("ni", 3), ("hao", 3)]),
+    ("zhōngguó", [("zhong", 1), ("guo", 2)]),
+    ("xīngqīèr", [("xing", 1), ("qi", 1), ("er", 4)]),
+    ("hǎnà", [("ha", 3), ("na", 4)]),
+    ("yunan", [("yu", 5), ("nan", 5)]),
+    ("yunmi", [("yun", 5), ("mi", 5)]),
+    ("xī'ān", [("xi", 1), ("an", 1)]),
+    ("xian", [("xian", 5)]),
+    ("nǚ", [("nv", 3)]),
+    ("nu:3", [("nv", 3)]),
+    ("nǎr", [("nar", 3)]),
+    ("narou", [("na", 5), ("rou", 5)]),
+    ("", []),
+])
+def test_parse_pinyin(text, expected):
+    assert parse_pinyin(text) == expected
+
+
+def test_same_key_with_tone_marks_or_numbers():
+    assert pinyin_collation_key("Zhōngwén") == pinyin_collation_key("zhong1 wen2")
+
+
+def test_collation_order():
+    expected = ["a", "lù", "lǜ", "mā", "má", "mǎ", "mà", "ma", "yú nán", "yùn mǐ",
+                "zhōng", "zhōngguó", "zhōng wén", "zhǒng"]
+    assert sorted(reversed(expected), key=pinyin_collation_key) == expected
+    assert sorted(["yùnmǐ", "yúnán"], key=pinyin_collation_key) == ["yúnán", "yùnmǐ"]
+
+
+def test_pinyin_sorting_key_in_group_hints():
+    settings = HintSettings(
+        field_names=["Simplified", "Pinyin.1"], flds_in_hint=["Simplified"],
+        sorting_field="Pinyin.1", sorting_key=pinyin_sorting_key,
+    )
+    notes = [(1, ["运米", "yùn mǐ"]), (2, ["鱼南", "yú nán"])]
+    assert compute_group_hints(settings, notes) == [(2, "?<br>运米"), (1, "鱼南<br>?")]
@@ -0,0 +1,40 @@
+import pytest
+
+from src.utils.note_utils import find_notes
+from src.utils.query_cache import get_query_cache
+
+
+def test_search_cached_until_modification(col):
+    query_cache = get_query_cache(col)
+    notesID, model = query_cache.search("Back:1*", "Basic")
+    assert len(notesID) == 2 and model["name"] == "Basic"
+    assert query_cache.search("Back:1*", "Basic") == (notesID, model)
+    assert (query_cache.hits, query_cache.misses) == (1, 1)
+
+    note = col.get_note(col.find_notes("Front:Maus")[0])
+    note["Back"] = "1"
+    col.update_note(note)
+    assert len(query_cache.search("Back:1*", "Basic")[0]) == 3
+    assert (query_cache.hits, query_cache.misses) == (1, 2)
+    assert query_cache.stats()["cached_queries"] == 1
+
+
+def test_find_notes(col):
+    query_cache = get_query_cache(col)
+    notesID, _ = find_notes(col, "", "Basic", verbose=0, override_confirmation=True)
+    notesID.append(0)  # The cached result is not changed
+    assert find_notes(col, "", "Basic", verbose=0, override_confirmation=True)[0] == notesID[:-1]
+
+    # The searches without result are cached too
+    for _ in range(2):
+        with pytest.raises(ValueError):
+            find_notes(col, "Front:Elefant", "Basic", verbose=0, override_confirmation=True)
+    assert query_cache.stats() == {"hits": 2, "misses": 2, "hit_rate": 0.5, "cached_queries": 2}
+
+
+def test_note_fields_utils(col):
+    query_cache = get_query_cache(col)
+    note_fields = query_cache.get_note_fields("Basic")
+    assert query_cache.get_note_fields("Basic") is note_fields
+    col.models.save(col.models.by_name("Basic"))
+    assert query_cache.get_note_fields("Basic") is not note_fields
@@ -0,0 +1,21 @@
+from anki.collection import Collection
+
+from benchmarks.synthetic_collection import generate_collection
+from src.utils.group_index import GroupIndex
+
+
+def test_generate_collection(tmp_path):
+    col_path = str(tmp_path / "collection.anki2")
+    notes_per_type = generate_collection(col_path, 31)
+    assert [len(notes) for notes in notes_per_type.values()] == [11, 10, 10]
+
+    col = Collection(col_path)
+    try:
+        assert len(col.find_notes('note:Cloze "Text:*{{c3::Band*"')) == 11
+        # The Chinois notes are reviewed cards, only the two last thirds are marked
+        assert sorted(col.find_notes("note:Chinois -is:new")) == sorted(notes_per_type["Chinois"])
+        assert len(col.find_notes("note:Chinois tag:marked")) == 6
+        group_index = GroupIndex.from_collection(col, "Chinois", "Synonyms group", ", ")
+        assert group_index.group_ids() == [1, 2]
+    finally:
+        col.close()
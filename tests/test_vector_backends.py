@@ -0,0 +1,77 @@
+import numpy as np
+import pytest
+
+from src.utils.vector_backends import BACKENDS, batch_vector_distances, get_backend
+
+
+@pytest.fixture
+def vectors():
+    rng = np.random.default_rng(0)
+    return rng.normal(size=(300, 16)).astype(np.float32)
+
+
+@pytest.mark.parametrize("metric", ["angular", "euclidean"])
+def test_batch_vector_distances(metric):
+    from annoy import AnnoyIndex
+
+    rng = np.random.default_rng(1)
+    vectors = rng.normal(size=(20, 4)).astype(np.float32)
+    index = AnnoyIndex(4, metric)
+    for i, v in enumerate(vectors):
+        index.add_item(i, v)
+    expected = [index.get_distance(0, i) for i in range(20)]
+    np.testing.assert_allclose(batch_vector_distances(vectors, vectors[:1], metric)[0], expected, atol=1e-3)
+
+
+@pytest.mark.parametrize("name", BACKENDS)
+@pytest.mark.parametrize("metric", ["angular", "euclidean"])
+def test_backends_match_exact_search(vectors, name, metric):
+    exact = get_backend("bruteforce", 16, metric)
+    exact.build(vectors)
+    backend = get_backend(name, 16, metric)
+    backend.build(vectors)
+    assert len(backend) == 300
+    np.testing.assert_allclose(backend.get_item_vector(3), vectors[3])
+
+    queries = vectors[:20]
+    expected_items, expected_distances = exact.query(queries, 10)
+    items, distances = backend.query(queries, 10)
+    recall = np.mean([len(set(a) & set(b)) / 10 for a, b in zip(items, expected_items)])
+    assert recall >= (0.8 if name == "annoy" else 1.0)
+    assert all(row[0] == i for i, row in enumerate(items))
+    if name != "annoy":
+        np.testing.assert_allclose(distances, expected_distances, atol=1e-2)
+
+    radius = float(np.median(expected_distances))
+    expected_items, _ = exact.query_radius(queries, radius)
+    items, distances = backend.query_radius(queries, radius)
+    for row_items, row_distances, row_expected in zip(items, distances, expected_items):
+        assert set(row_items) <= set(row_expected)
+        assert all(d <= radius for d in row_distances) and row_distances == sorted(row_distances)
+        if name != "annoy":
+            assert set(row_items) == set(row_expected)
+
+
+@pytest.mark.parametrize("name", BACKENDS)
+def test_save_and_load(tmp_path, vectors, name):
+    backend = get_backend(name, 16)
+    backend.build(vectors)
+    backend.save(str(tmp_path / "index"))
+
+    loaded = get_backend(name, 16)
+    assert loaded.load(str(tmp_path / "index"))
+    assert loaded.query(vectors[:3], 4) == backend.query(vectors[:3], 4)
+    assert not get_backend(name, 16).load(str(tmp_path / "other"))
+
+
+def test_unknown_backend():
+    with pytest.raises(ValueError):
+        get_backend("faiss", 16)
+
+
+def test_benchmark(tmp_path):
+    from benchmarks.bench_ann_backends import run_benchmarks
+
+    results = run_benchmarks([60], list(BACKENDS), str(tmp_path), dim=8, n_queries=10)
+    assert [result["backend"] for result in results] == list(BACKENDS)
+    assert results[0]["recall@15"] == 1.0 and results[0]["radius_recall"] == 1.0